@@ -0,0 +1,171 @@
+"""
+Headless batch mode.
+
+Runs every conversation in a JSONL file through the chatbot graph and streams
+the answers to an output JSONL file. Each input line is either
+{"id": ..., "messages": [{"role": "user", "content": ...}, ...]} or
+{"id": ..., "prompt": ...}, optionally with its own "model". Conversations
+already answered in the output file are skipped, so an interrupted run
+resumes where it stopped.
+
+Usage:
+    python batch.py prompts.jsonl -o answers.jsonl --model openai:gpt-4o --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import main
+
+# Read the IDs that already have an answer in the output file, dropping a
+# partial last line left behind by a crash so new records start on a fresh line
+def load_progress(output_path):
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "answer" in record:
+            done.add(record["id"])
+    return done
+
+# Yield (id, model, messages) for every input conversation
+def read_conversations(input_path, default_model):
+    with open(input_path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if "messages" in item:
+                    messages = []
+                    for message in item["messages"]:
+                        if message["role"] == "user":
+                            messages.append(HumanMessage(content=message["content"]))
+                        elif message["role"] == "assistant":
+                            messages.append(AIMessage(content=message["content"]))
+                else:
+                    messages = [HumanMessage(content=item["prompt"])]
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Skipping invalid input line {line_number}: {e}", file=sys.stderr)
+                continue
+            yield str(item.get("id", f"line-{line_number}")), item.get("model", default_model), messages
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+# Run the batch and return the summary
+async def run_batch(input_path, output_path, model_name, concurrency=8, retries=3):
+    # Conversations are independent, so the batch graph keeps no thread state
+    graph = main.build_graph()
+    done = load_progress(output_path)
+    if done:
+        print(f"Resuming: {len(done)} conversations already answered")
+
+    stats = {"ok": 0, "failed": 0, "skipped": 0, "latencies": [], "input_tokens": 0, "output_tokens": 0}
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    output = open(output_path, "a")
+
+    async def answer(conversation_id, conversation_model, messages):
+        started = time.perf_counter()
+        for attempt in range(1, retries + 2):
+            try:
+                result = await graph.ainvoke({"messages": messages, "model_name": conversation_model})
+                break
+            except Exception as e:
+                if attempt > retries:
+                    return {"id": conversation_id, "model": conversation_model, "error": str(e), "attempts": attempt}
+                # Exponential backoff with jitter so retries don't arrive in lockstep
+                await asyncio.sleep(min(60, 2 ** attempt) * (0.5 + random.random()))
+        reply = result["messages"][-1]
+        usage = getattr(reply, "usage_metadata", None) or {}
+        return {
+            "id": conversation_id,
+            "model": conversation_model,
+            "answer": main.content_text(reply.content),
+            "latency": round(time.perf_counter() - started, 3),
+            "attempts": attempt,
+            "usage": {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+        }
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record = await answer(*item)
+            # Every record is flushed right away; the output file is the progress checkpoint
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            if "answer" in record:
+                stats["ok"] += 1
+                stats["latencies"].append(record["latency"])
+                stats["input_tokens"] += record["usage"]["input_tokens"]
+                stats["output_tokens"] += record["usage"]["output_tokens"]
+            else:
+                stats["failed"] += 1
+                print(f"Conversation {record['id']} failed: {record['error']}", file=sys.stderr)
+            finished = stats["ok"] + stats["failed"]
+            if finished % 100 == 0:
+                print(f"{finished} conversations finished")
+
+    started = time.perf_counter()
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for conversation_id, conversation_model, messages in read_conversations(input_path, model_name):
+            if conversation_id in done:
+                stats["skipped"] += 1
+                continue
+            await queue.put((conversation_id, conversation_model, messages))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        output.close()
+
+    elapsed = time.perf_counter() - started
+    latencies = stats.pop("latencies")
+    stats.update({
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_per_second": round(stats["ok"] / elapsed, 2) if elapsed else 0.0,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3)
+    })
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of conversations through the chatbot graph.")
+    parser.add_argument("input", help="JSONL file with one conversation per line")
+    parser.add_argument("-o", "--output", help="JSONL file the answers are appended to (default: <input>.out.jsonl)")
+    parser.add_argument("--model", default="openai:gpt-4o", help="Model for conversations that don't name one")
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversations in flight at once")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per conversation before it is recorded as failed")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    output_path = args.output or os.path.splitext(args.input)[0] + ".out.jsonl"
+    summary = asyncio.run(run_batch(args.input, output_path, args.model, max(1, args.concurrency), max(0, args.retries)))
+    print(json.dumps(summary, indent=2))
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,100 @@
+"""
+Deterministic Fake Chat Model.
+
+A local stand-in for the provider chat models, so the app's own overhead can
+be measured without network calls. Latency, token rate and response size are
+configurable, and the same prompt always gets the same answer.
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+VOCABULARY = (
+    "the function returns a list of values from the database and caches them "
+    "for later use when the request handler calls it again with new arguments"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering with deterministic filler text.
+
+    Attributes:
+        latency: Seconds before the first token
+        tokens_per_second: Generation speed; 0 produces the whole answer at once
+        response_tokens: Number of tokens (words) in every answer
+        seed: Changes the generated text without changing its size
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    response_tokens: int = 64
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode()).digest()
+        return [VOCABULARY[(digest[i % len(digest)] + i) % len(VOCABULARY)] + " " for i in range(self.response_tokens)]
+
+    def _message(self, messages: List[BaseMessage], tokens: List[str]) -> AIMessage:
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        return AIMessage(
+            content="".join(tokens),
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": len(tokens),
+                "total_tokens": input_tokens + len(tokens)
+            }
+        )
+
+    def _usage_chunk(self, messages: List[BaseMessage]) -> AIMessageChunk:
+        message = self._message(messages, self._tokens(messages))
+        return AIMessageChunk(content="", usage_metadata=message.usage_metadata)
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep(self.latency + self._token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, tokens))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.latency + self._token_delay() * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, tokens))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        delay = self._token_delay()
+        for token in self._tokens(messages):
+            if delay:
+                time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        # Providers report usage on the last chunk of a stream
+        yield ChatGenerationChunk(message=self._usage_chunk(messages))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.latency)
+        delay = self._token_delay()
+        for token in self._tokens(messages):
+            if delay:
+                await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=self._usage_chunk(messages))
@@ -0,0 +1,154 @@
+"""
+Chat history storage format benchmark.
+
+Writes the same synthetic corpus of code-heavy chats in every storage
+format (the old pretty-printed JSON, minified JSON, gzip, zstd and zstd
+with a trained dictionary) and reports the bytes on disk and the time to
+write, load and index it.
+
+Usage:
+    python -m benchmarks.history_format
+    python -m benchmarks.history_format --chats 5000 --turns 8
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ui.history_index import HistoryIndex
+from ui.history_store import read_history, train_dictionary, write_history
+
+QUESTIONS = (
+    "How do I read a CSV file with pandas and skip the header?",
+    "Why does my React component render twice?",
+    "Write a Python function that retries a request with exponential backoff.",
+    "What's the difference between a list and a tuple?",
+    "How can I speed up this SQL query with an index?",
+    "Explain async/await in JavaScript with an example."
+)
+
+CODE = '''```python
+def retry(fn, attempts={attempts}, base_delay={delay}):
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as error:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(base_delay * 2 ** attempt)
+```'''
+
+def synthetic_history(i, turns, rng):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": rng.choice(QUESTIONS) + f" (case {rng.randint(1, 10 ** 6)})"})
+        answer = [f"Here is one way to do it for case {turn}:"]
+        for _ in range(rng.randint(1, 3)):
+            answer.append(CODE.format(attempts=rng.randint(2, 9), delay=rng.random()))
+            answer.append(" ".join(rng.choice(("the", "function", "returns", "value", "list", "index", "query", "cache")) for _ in range(40)))
+        messages.append({"role": "assistant", "content": "\n\n".join(answer)})
+    return {
+        "id": f"chat_20240101_{i:06d}_{i:06x}",
+        "timestamp": f"2024-01-01T00:00:{i % 60:02d}",
+        "model": "openai:gpt-4o",
+        "title": f"Monday, January 01, 2024 - chat {i}",
+        "messages": messages
+    }
+
+# The format every earlier version wrote
+def write_legacy(history_dir, history):
+    with open(os.path.join(history_dir, history["id"] + ".json"), "w") as f:
+        json.dump(history, f, indent=2)
+
+def directory_size(history_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(history_dir) if entry.is_file())
+
+def measure(name, corpus, write, scratch):
+    history_dir = os.path.join(scratch, name)
+    os.makedirs(history_dir)
+    prepare = write.get("prepare")
+    if prepare:
+        prepare(history_dir)
+
+    started = time.perf_counter()
+    for history in corpus:
+        write["write"](history_dir, history)
+    write_seconds = time.perf_counter() - started
+
+    paths = sorted(entry.path for entry in os.scandir(history_dir) if entry.is_file())
+    load_times = []
+    for path in paths:
+        started = time.perf_counter()
+        read_history(path)
+        load_times.append(time.perf_counter() - started)
+    load_times.sort()
+
+    started = time.perf_counter()
+    HistoryIndex(history_dir).rebuild()
+    index_seconds = time.perf_counter() - started
+
+    return {
+        "bytes": directory_size(history_dir),
+        "write_ms": write_seconds * 1000 / len(corpus),
+        "load_p50_ms": load_times[len(load_times) // 2] * 1000,
+        "load_total_s": sum(load_times),
+        "index_s": index_seconds
+    }
+
+def run(args):
+    rng = random.Random(args.seed)
+    corpus = [synthetic_history(i, args.turns, rng) for i in range(args.chats)]
+    scratch = tempfile.mkdtemp(prefix="coding-agent-history-format-")
+
+    def train(history_dir):
+        # Train on a separate sample of the corpus, as history_cli would on existing chats
+        sample_dir = os.path.join(scratch, "dict-sample")
+        os.makedirs(sample_dir, exist_ok=True)
+        for history in corpus[:min(len(corpus), 1000)]:
+            write_history(sample_dir, history, "json")
+        train_dictionary(sample_dir)
+        shutil.copytree(os.path.join(sample_dir, ".db"), os.path.join(history_dir, ".db"))
+
+    formats = {
+        "legacy-json": {"write": write_legacy},
+        "json": {"write": lambda d, h: write_history(d, h, "json")},
+        "gzip": {"write": lambda d, h: write_history(d, h, "gzip")}
+    }
+    try:
+        import zstandard  # noqa: F401
+        formats["zstd"] = {"write": lambda d, h: write_history(d, h, "zstd")}
+        formats["zstd+dict"] = {"write": lambda d, h: write_history(d, h, "zstd"), "prepare": train}
+    except ImportError:
+        print("zstandard is not installed; skipping the zstd formats")
+
+    try:
+        results = {name: measure(name, corpus, spec, scratch) for name, spec in formats.items()}
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    legacy = results["legacy-json"]
+    print(f"\n{args.chats} chats x {args.turns} turns")
+    print(f"{'format':12} {'size MiB':>10} {'vs legacy':>10} {'write ms':>9} {'load p50 ms':>12} {'load all s':>11} {'index s':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:12} {result['bytes'] / 2 ** 20:>10.2f} {result['bytes'] / legacy['bytes']:>10.1%} "
+            f"{result['write_ms']:>9.3f} {result['load_p50_ms']:>12.3f} {result['load_total_s']:>11.2f} {result['index_s']:>8.2f}"
+        )
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the chat history storage formats on a synthetic corpus.")
+    parser.add_argument("--chats", type=int, default=2000, help="Chats in the corpus")
+    parser.add_argument("--turns", type=int, default=6, help="Question/answer pairs per chat")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus random seed")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -0,0 +1,117 @@
+"""
+Import-time budget check.
+
+Imports each entry module in a fresh interpreter with ``-X importtime`` and
+fails when its cumulative import time exceeds the budget, or when it pulls in
+a module that is meant to load lazily (the UI, provider SDKs, the voice
+stack, numpy). Startup time matters for restarts and autoscaling, and these
+are the imports that tend to creep back in.
+
+Usage:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --runs 5 --scale 2
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budget per entry module, in milliseconds
+BUDGETS_MS = {
+    "main": 1500,
+    "batch": 1500
+}
+
+# Packages the entry modules must not import at startup
+LAZY_PACKAGES = (
+    "gradio",
+    "numpy",
+    "tiktoken",
+    "langchain",
+    "langchain_openai",
+    "langchain_anthropic",
+    "langchain_google_genai",
+    "openai",
+    "anthropic",
+    "google.generativeai",
+    "whisper",
+    "speech_recognition",
+    "pyaudio"
+)
+
+
+def import_profile(module):
+    """
+    Import a module in a fresh interpreter.
+
+    Returns:
+        dict: (cumulative import time in microseconds, nesting depth) per imported module
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, capture_output=True, text=True,
+        # Keep optional features that import extra packages off
+        env=dict(os.environ, SEMANTIC_CACHE="false", METRICS_PORT="")
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            # Nested imports are indented by two spaces per level
+            profile[name.strip()] = (int(cumulative), (len(name) - len(name.lstrip()) - 1) // 2)
+        except ValueError:
+            # The header line
+            continue
+    return profile
+
+def check(module, budget_ms, runs):
+    """
+    Check one entry module against its budget.
+
+    Returns:
+        list: Problems found (empty when the module is within budget)
+    """
+    # The fastest run is the least disturbed by the rest of the machine
+    profiles = [import_profile(module) for _ in range(runs)]
+    profile = min(profiles, key=lambda p: p.get(module, (0, 0))[0])
+    total_ms = profile.get(module, (0, 0))[0] / 1000
+    problems = []
+
+    print(f"{module}: {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    # The module's own direct imports, slowest first
+    slowest = sorted(
+        ((cumulative, name) for name, (cumulative, depth) in profile.items() if depth == 1),
+        reverse=True
+    )[:8]
+    for cumulative, name in slowest:
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+    if total_ms > budget_ms:
+        problems.append(f"{module} takes {total_ms:.0f} ms to import, over its {budget_ms:.0f} ms budget")
+    for package in LAZY_PACKAGES:
+        if package in profile:
+            problems.append(f"{module} imports {package} at startup; it should load on first use")
+    return problems
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import time of the entry modules against their budget.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh imports per module; the fastest counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the budgets, e.g. for slow CI machines")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    problems = []
+    for module, budget_ms in BUDGETS_MS.items():
+        problems.extend(check(module, budget_ms * args.scale, max(1, args.runs)))
+    if problems:
+        print("\n" + "\n".join(problems))
+        sys.exit(1)
+    print("\nImport times are within budget.")
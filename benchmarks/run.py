@@ -0,0 +1,283 @@
+"""
+Offline benchmark suite.
+
+Measures the app's own overhead with the provider models swapped for the
+deterministic FakeChatModel: the chat entry points end to end, message
+conversion, graph compilation, and chat history storage at several history
+counts. Every benchmark reports p50/p99 latency and the memory it allocates
+(peak and retained, via tracemalloc), and is compared against the stored
+baseline.
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --sizes 10,1000 --filter history
+    python -m benchmarks.run --save-baseline
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+# Keep the benchmark run self-contained: no network, no caches, no files
+# outside the scratch directory. Set before main reads its settings.
+SCRATCH_DIR = tempfile.mkdtemp(prefix="coding-agent-bench-")
+os.environ.update({
+    "CHECKPOINT_DB": os.path.join(SCRATCH_DIR, "checkpoints.sqlite"),
+    "USAGE_DB": os.path.join(SCRATCH_DIR, "usage.sqlite"),
+    "CHAT_AUTOSAVE": "false",
+    "RESPONSE_CACHE": "false",
+    "SEMANTIC_CACHE": "false",
+    "MODEL_FALLBACKS": "",
+    "RATE_LIMITS": "",
+    "GOOGLE_API_KEY": "bench",
+    "ANTHROPIC_API_KEY": "bench",
+    "OPENAI_API_KEY": "bench"
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from ui import chat_history
+from benchmarks.fake_llm import FakeChatModel
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# The estimated token counter keeps the runs offline and deterministic
+MODEL_NAME = "anthropic:claude-3-haiku-20240307"
+
+
+class Benchmark:
+    """
+    A named function timed over repeated calls, with optional setup.
+
+    ``setup`` runs once before the benchmark; ``before_each`` runs before
+    every call, outside the timed and traced part.
+    """
+
+    def __init__(self, name, fn, repeat=None, setup=None, before_each=None):
+        self.name = name
+        self.fn = fn
+        self.repeat = repeat
+        self.setup = setup
+        self.before_each = before_each
+
+    def prepare(self):
+        if self.before_each:
+            self.before_each()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+def measure(benchmark, repeat, memory_repeat=3):
+    """
+    Time a benchmark and measure its allocations.
+
+    Returns:
+        dict: p50/p99 in milliseconds, iterations, and peak/retained KiB per call
+    """
+    if benchmark.setup:
+        benchmark.setup()
+    repeat = benchmark.repeat or repeat
+    # One warm-up call so one-time imports and caches don't skew the numbers
+    benchmark.prepare()
+    benchmark.fn()
+    timings = []
+    for _ in range(repeat):
+        benchmark.prepare()
+        started = time.perf_counter()
+        benchmark.fn()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # tracemalloc slows everything down, so memory is measured in a separate pass
+    peak, retained = 0, 0
+    memory_repeat = min(memory_repeat, repeat)
+    tracemalloc.start()
+    try:
+        for _ in range(memory_repeat):
+            tracemalloc.stop()
+            benchmark.prepare()
+            tracemalloc.start()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            benchmark.fn()
+            after, call_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, call_peak - before)
+            retained += after - before
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "iterations": repeat,
+        "p50_ms": round(percentile(timings, 50), 4),
+        "p99_ms": round(percentile(timings, 99), 4),
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(retained / memory_repeat / 1024, 1)
+    }
+
+# Chat messages in the Gradio 'messages' format
+def make_history(turns, words=40):
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"Question {turn}: " + "how do I write this function " * (words // 6)})
+        history.append({"role": "assistant", "content": f"Answer {turn}: " + "you can use a generator here " * (words // 6)})
+    return history
+
+# Write chats straight to the history directory as plain JSON files, which
+# load_chat_history still reads; going through save_chat_history would also
+# time index updates for every seeded chat
+def seed_histories(history_dir, count):
+    os.makedirs(history_dir, exist_ok=True)
+    messages = make_history(3)
+    started = datetime(2024, 1, 1)
+    for i in range(count):
+        history_id = f"chat_{(started + timedelta(seconds=i)).strftime('%Y%m%d_%H%M%S')}_{i:06x}"
+        with open(os.path.join(history_dir, f"{history_id}.json"), "w") as f:
+            json.dump({
+                "id": history_id,
+                "timestamp": (started + timedelta(seconds=i)).isoformat(),
+                "model": MODEL_NAME,
+                "title": f"Chat {i} about generators",
+                "messages": messages
+            }, f)
+
+def chat_benchmarks():
+    benchmarks = []
+    # Shared and never modified: the chat entry points get a copy
+    history = make_history(500)
+    follow_up = {}
+
+    # Every follow-up goes to a new one-turn thread, so the thread doesn't
+    # grow over the iterations
+    def new_follow_up_thread():
+        follow_up["thread"] = f"bench-follow-up-{uuid.uuid4().hex[:8]}"
+        main.run_chatbot("How do I reverse a list?", [], MODEL_NAME, thread_id=follow_up["thread"])
+
+    benchmarks.append(Benchmark("graph.build", lambda: main.build_graph()))
+    benchmarks.append(Benchmark("graph.cached", main.get_graph))
+    benchmarks.append(Benchmark("messages.convert_1k", lambda: main.to_langchain_messages(history)))
+    benchmarks.append(Benchmark("chat.run_new_thread", lambda: main.run_chatbot("How do I reverse a list?", [], MODEL_NAME)))
+    benchmarks.append(Benchmark(
+        "chat.run_follow_up",
+        lambda: main.run_chatbot("And in place?", [], MODEL_NAME, thread_id=follow_up["thread"]),
+        before_each=new_follow_up_thread
+    ))
+    benchmarks.append(Benchmark(
+        "chat.run_seeded_1k_history",
+        lambda: main.run_chatbot("Summarize that.", list(history), MODEL_NAME)
+    ))
+    benchmarks.append(Benchmark(
+        "chat.stream_new_thread",
+        lambda: list(main.stream_chatbot("How do I reverse a list?", [], MODEL_NAME))
+    ))
+    return benchmarks
+
+def history_benchmarks(size):
+    history_dir = os.path.join(SCRATCH_DIR, f"histories_{size}")
+    messages = make_history(3)
+    loaded_id = {}
+
+    # Every benchmark of a size shares the seeded directory, seeded by
+    # whichever of them runs first, so each one also runs on its own (--filter)
+    def setup():
+        if not loaded_id:
+            seed_histories(history_dir, size)
+        chat_history.HISTORY_DIR = history_dir
+        loaded_id["id"] = chat_history.get_chat_histories()[-1][0]
+
+    return [
+        # The first listing builds the index from the seeded files
+        Benchmark(f"history.index_rebuild@{size}", lambda: chat_history.get_history_index().rebuild(), repeat=3, setup=setup),
+        Benchmark(f"history.save@{size}", lambda: chat_history.save_chat_history(messages, MODEL_NAME), setup=setup),
+        Benchmark(f"history.list@{size}", chat_history.get_chat_histories, repeat=20 if size >= 100000 else None, setup=setup),
+        Benchmark(f"history.page@{size}", chat_history.get_chat_histories_page, setup=setup),
+        Benchmark(f"history.load@{size}", lambda: chat_history.load_chat_history(loaded_id["id"]), setup=setup),
+        Benchmark(f"history.search@{size}", lambda: chat_history.search_chat_histories("generator function"), setup=setup)
+    ]
+
+def compare(results, baseline, threshold):
+    """
+    Print each benchmark next to its baseline and return the regressions.
+    """
+    regressions = []
+    print(f"\n{'benchmark':36} {'p50 ms':>10} {'p99 ms':>10} {'peak KiB':>10} {'kept KiB':>10} {'vs base':>8}")
+    for name, result in results.items():
+        change = ""
+        if name in baseline and baseline[name]["p50_ms"]:
+            ratio = result["p50_ms"] / baseline[name]["p50_ms"]
+            change = f"{ratio:.2f}x"
+            if ratio > threshold:
+                change += " !"
+                regressions.append(name)
+        print(
+            f"{name:36} {result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} "
+            f"{result['peak_kib']:>10.1f} {result['retained_kib']:>10.1f} {change:>8}"
+        )
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app's overhead with a fake chat model.")
+    parser.add_argument("--sizes", default="10,1000,100000", help="Comma separated numbers of stored chats")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed calls per benchmark")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake model seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Fake model generation speed (0 is instant)")
+    parser.add_argument("--response-tokens", type=int, default=64, help="Fake model answer length")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 ratio over the baseline counted as a regression")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+def run(args):
+    fake = FakeChatModel(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens
+    )
+    main.init_chat_model = lambda model_name, **kwargs: fake
+
+    benchmarks = chat_benchmarks()
+    for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+        benchmarks.extend(history_benchmarks(size))
+
+    results = {}
+    for benchmark in benchmarks:
+        if args.filter and args.filter not in benchmark.name:
+            continue
+        print(f"Running {benchmark.name}...")
+        results[benchmark.name] = measure(benchmark, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f).get("results", {})
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+    if args.save_baseline:
+        # Keep entries for benchmarks that weren't part of this run
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": baseline}, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than {args.threshold:g}x the baseline: {', '.join(regressions)}")
+    return 1 if regressions and not args.save_baseline else 0
+
+if __name__ == "__main__":
+    try:
+        status = run(parse_args())
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+    sys.exit(status)
@@ -0,0 +1,3 @@
+"""
+Core runtime components for the Coding Agent application.
+"""
@@ -0,0 +1,156 @@
+"""
+Conversation Checkpoints.
+
+This module creates the LangGraph checkpointer that persists each chat
+thread's message state, so a turn only has to send the new user message.
+A thread's ID is the ID its chat is saved under, so deleting a chat also
+deletes its thread.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import weakref
+from typing import Dict, Iterable
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """
+    SQLite saver that also serves the async graph API.
+
+    The stock async SQLite saver is bound to a single event loop and keeps
+    a non-daemon connection thread alive, so the async methods here run the
+    (fast, locked) sync implementation in a worker thread instead.
+
+    Every checkpoint holds the thread's whole state, so keeping them all
+    would grow quadratically with the length of a chat; only the latest is
+    ever read, and older ones are pruned after each write.
+    """
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        # Checkpoint IDs sort in creation order
+        key = (str(next_config["configurable"]["thread_id"]), next_config["configurable"]["checkpoint_ns"], checkpoint["id"])
+        with self.cursor() as cur:
+            cur.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", key)
+            cur.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?", key)
+        return next_config
+
+    def thread_sizes(self) -> Dict[str, int]:
+        """Return the bytes stored for each thread."""
+        with self.cursor(transaction=False) as cur:
+            sizes = dict(cur.execute(
+                "SELECT thread_id, sum(length(checkpoint) + length(metadata)) FROM checkpoints GROUP BY thread_id"
+            ).fetchall())
+            for thread_id, size in cur.execute("SELECT thread_id, sum(length(value)) FROM writes GROUP BY thread_id"):
+                sizes[thread_id] = sizes.get(thread_id, 0) + (size or 0)
+        return sizes
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def create_checkpointer(db_path: str):
+    """
+    Create the checkpointer shared by the sync and async chat paths.
+
+    Args:
+        db_path: SQLite database file; an empty value keeps threads in memory
+
+    Returns:
+        A LangGraph checkpointer
+    """
+    if not db_path:
+        return MemorySaver()
+
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL, NORMAL only syncs at WAL checkpoints: an app crash loses
+    # nothing, and only a power cut can lose the latest turns' state
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return ThreadedSqliteSaver(conn)
+
+
+# One checkpointer per database, shared by the graph and the history code
+_checkpointers = {}
+_checkpointers_lock = threading.Lock()
+
+# Every ThreadTracker, so deleted threads are forgotten everywhere
+_trackers = weakref.WeakSet()
+
+
+def get_checkpointer(db_path: str):
+    """Return the shared checkpointer for a database (see create_checkpointer)."""
+    with _checkpointers_lock:
+        if db_path not in _checkpointers:
+            _checkpointers[db_path] = create_checkpointer(db_path)
+        return _checkpointers[db_path]
+
+
+def delete_threads(db_path: str, thread_ids: Iterable[str]):
+    """
+    Delete the stored state of threads: every checkpoint and pending write.
+
+    Args:
+        db_path: Checkpoint database (see create_checkpointer)
+        thread_ids: IDs of the threads to delete
+    """
+    checkpointer = get_checkpointer(db_path)
+    for thread_id in thread_ids:
+        checkpointer.delete_thread(thread_id)
+        for tracker in list(_trackers):
+            tracker.forget(thread_id)
+
+
+def thread_sizes(db_path: str) -> Dict[str, int]:
+    """Return the bytes stored for each thread; empty for in-memory checkpoints."""
+    checkpointer = get_checkpointer(db_path)
+    return checkpointer.thread_sizes() if isinstance(checkpointer, ThreadedSqliteSaver) else {}
+
+
+class ThreadTracker:
+    """
+    Remembers which thread IDs already have stored state in this process.
+
+    Lets a turn decide whether it only needs to send the new message or must
+    first seed the thread from the client-side history (new or reloaded
+    chats), without reading the checkpoint every time.
+    """
+
+    def __init__(self):
+        self._known = set()
+        self._lock = threading.Lock()
+        _trackers.add(self)
+
+    def is_known(self, thread_id: str) -> bool:
+        with self._lock:
+            return thread_id in self._known
+
+    def mark(self, thread_id: str):
+        with self._lock:
+            self._known.add(thread_id)
+
+    def forget(self, thread_id: str):
+        with self._lock:
+            self._known.discard(thread_id)
@@ -0,0 +1,111 @@
+"""
+Per-Provider Concurrency Limits.
+
+This module caps how many requests may be in flight to each LLM provider at
+once, for both the threaded (sync) and the asyncio (async) chat paths.
+"""
+
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+# Limit used for providers that have no explicit entry
+DEFAULT_PROVIDER_LIMIT = 16
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, int]:
+    """
+    Parse a limits specification such as ``"anthropic=8,openai=32"``.
+
+    Args:
+        spec: Comma separated ``provider=limit`` pairs
+
+    Returns:
+        dict: Mapping of provider name to maximum concurrent requests
+    """
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        provider, value = item.split("=", 1)
+        try:
+            limits[provider.strip()] = max(1, int(value))
+        except ValueError:
+            print(f"Ignoring invalid concurrency limit: {item}")
+    return limits
+
+
+class _Slot:
+    # One held provider slot; release() may be called early, from any thread,
+    # and only the first call gives the slot back
+
+    def __init__(self, semaphore: threading.BoundedSemaphore):
+        self._semaphore = semaphore
+        self._lock = threading.Lock()
+        self._held = True
+
+    def release(self):
+        with self._lock:
+            if not self._held:
+                return
+            self._held = False
+        self._semaphore.release()
+
+
+class ProviderLimiter:
+    """
+    Semaphores bounding concurrent requests per provider.
+
+    asyncio semaphores are bound to the event loop that first uses them, so
+    a separate set is kept for each running loop.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default_limit: int = DEFAULT_PROVIDER_LIMIT):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self._lock = threading.Lock()
+        self._thread_semaphores = {}
+        self._async_semaphores = weakref.WeakKeyDictionary()
+
+    def limit_for(self, provider: str) -> int:
+        """Return the concurrency limit configured for a provider."""
+        return self.limits.get(provider, self.default_limit)
+
+    def _thread_semaphore(self, provider: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if provider not in self._thread_semaphores:
+                self._thread_semaphores[provider] = threading.BoundedSemaphore(self.limit_for(provider))
+            return self._thread_semaphores[provider]
+
+    def _async_semaphore(self, provider: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._async_semaphores.setdefault(loop, {})
+            if provider not in semaphores:
+                semaphores[provider] = asyncio.Semaphore(self.limit_for(provider))
+            return semaphores[provider]
+
+    @contextmanager
+    def limit(self, provider: str):
+        """
+        Hold a provider slot for the duration of a blocking call.
+
+        Yields the slot, whose release() gives it back early, e.g. when the
+        caller stops waiting for a call that can't be interrupted.
+        """
+        semaphore = self._thread_semaphore(provider)
+        semaphore.acquire()
+        slot = _Slot(semaphore)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    @asynccontextmanager
+    async def alimit(self, provider: str):
+        """Hold a provider slot for the duration of an async call."""
+        semaphore = self._async_semaphore(provider)
+        async with semaphore:
+            yield
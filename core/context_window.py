@@ -0,0 +1,231 @@
+"""
+Context Window Management.
+
+This module decides which part of a conversation is sent to the model on
+each turn. The history is trimmed to a token budget, and when rolling
+summarization is enabled the trimmed turns are folded into a running
+summary that is extended incrementally instead of being rebuilt every turn.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+# Rough characters-per-token ratio used when no exact tokenizer is available
+CHARS_PER_TOKEN = 4
+
+# Fixed per-message cost of role markers and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Number of per-message token counts remembered between turns
+TOKEN_CACHE_SIZE = 20000
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def content_text(content) -> str:
+    """Return the text of message content given as a string or content blocks."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content:
+        if isinstance(block, str):
+            parts.append(block)
+        elif isinstance(block, dict) and block.get("type") == "text":
+            parts.append(block.get("text", ""))
+    return "".join(parts)
+
+
+class TokenCounter:
+    """
+    Counts prompt tokens for a given model.
+
+    OpenAI models are counted exactly with tiktoken; other providers only
+    offer token counting through a network call, so they use a character
+    based estimate. Counts are cached by message ID so a long thread only
+    pays for its new messages on each turn.
+    """
+
+    def __init__(self, cache_size: int = TOKEN_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._encodings = {}
+        self._lock = threading.Lock()
+        self._encoding_lock = threading.Lock()
+
+    def _encoding(self, model_name: str):
+        provider, model = model_name.split(":", 1) if ":" in model_name else ("", model_name)
+        if provider != "openai":
+            return None
+        if model in self._encodings:
+            return self._encodings[model]
+        # tiktoken downloads an encoding on first use; load each one once
+        with self._encoding_lock:
+            if model in self._encodings:
+                return self._encodings[model]
+            try:
+                import tiktoken
+                try:
+                    self._encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    self._encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # Missing package or encoding files that can't be downloaded
+                print(f"Falling back to estimated token counts for {model}: {e}")
+                self._encodings[model] = None
+            return self._encodings[model]
+
+    def preload(self, model_name: str):
+        """Load a model's encoding ahead of the first count, e.g. while warming the model up."""
+        self._encoding(model_name)
+
+    def count_text(self, text: str, model_name: str) -> int:
+        """Count the tokens in a piece of text."""
+        encoding = self._encoding(model_name)
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def count_message(self, message: BaseMessage, model_name: str) -> int:
+        """Count the tokens of a single message, including its overhead."""
+        key = (message.id, model_name) if message.id else None
+        if key is not None:
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    return self._cache[key]
+
+        tokens = self.count_text(content_text(message.content), model_name) + MESSAGE_OVERHEAD_TOKENS
+
+        if key is not None:
+            with self._lock:
+                self._cache[key] = tokens
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return tokens
+
+    def count_messages(self, messages: List[BaseMessage], model_name: str) -> int:
+        """Count the tokens of a list of messages."""
+        return sum(self.count_message(message, model_name) for message in messages)
+
+
+def select_window(
+    messages: List[BaseMessage],
+    budget: int,
+    counter: TokenCounter,
+    model_name: str,
+    start: int = 0,
+    reserved: int = 0
+) -> int:
+    """
+    Find the oldest message that still fits into the token budget.
+
+    The window always keeps the newest message and always starts at a user
+    message, so the model never sees an orphaned assistant reply.
+
+    Args:
+        messages: The full conversation
+        budget: Maximum number of prompt tokens
+        counter: Token counter for the model
+        model_name: Full model name in ``provider:model`` form
+        start: Index before which messages are never included
+        reserved: Tokens already used by other prompt parts (e.g. the summary)
+
+    Returns:
+        int: Index of the first message in the window
+    """
+    used = reserved
+    first = len(messages)
+    for index in range(len(messages) - 1, start - 1, -1):
+        used += counter.count_message(messages[index], model_name)
+        if used > budget and first < len(messages):
+            break
+        first = index
+
+    # Don't open the window with an assistant message
+    while first < len(messages) - 1 and not isinstance(messages[first], HumanMessage):
+        first += 1
+    return first
+
+
+def summary_message(summary: str) -> SystemMessage:
+    """Wrap a running summary into the system message placed before the window."""
+    return SystemMessage(content=SUMMARY_PREFIX + summary)
+
+
+def summary_request(summary: Optional[str], messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Build the prompt that folds new messages into the running summary.
+
+    Args:
+        summary: The current summary, if any
+        messages: Messages that are leaving the context window
+
+    Returns:
+        list: Messages to send to the summarizing model
+    """
+    transcript = "\n\n".join(
+        f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {content_text(message.content)}"
+        for message in messages
+    )
+    instructions = (
+        "You maintain a concise running summary of a conversation between a user and a coding assistant. "
+        "Keep the facts, decisions, code identifiers and open questions that later turns may refer to. "
+        "Reply with the updated summary only."
+    )
+    request = f"Current summary:\n{summary}\n\n" if summary else ""
+    request += f"New conversation turns to fold into the summary:\n\n{transcript}"
+    return [SystemMessage(content=instructions), HumanMessage(content=request)]
+
+
+def plan_context(
+    messages: List[BaseMessage],
+    model_name: str,
+    counter: TokenCounter,
+    budget: int,
+    summary: str = "",
+    summarized_upto: int = 0,
+    summarize: bool = False,
+    summary_ratio: float = 0.5
+) -> Tuple[int, int]:
+    """
+    Decide where the context window starts and what must be summarized.
+
+    Without summarization the oldest messages are simply dropped. With
+    summarization, the window starts after the already-summarized prefix
+    until it no longer fits; then it is shrunk to ``summary_ratio`` of the
+    budget so that the next summary update is several turns away.
+
+    Args:
+        messages: The full conversation
+        model_name: Full model name in ``provider:model`` form
+        counter: Token counter for the model
+        budget: Maximum number of prompt tokens
+        summary: The current running summary
+        summarized_upto: Number of leading messages already in the summary
+        summarize: Whether rolling summarization is enabled
+        summary_ratio: Fraction of the budget to keep when re-summarizing
+
+    Returns:
+        tuple: (window_start, fold_upto); messages in
+        ``[summarized_upto, fold_upto)`` must be folded into the summary
+        before the window is used
+    """
+    if not summarize:
+        return select_window(messages, budget, counter, model_name), summarized_upto
+
+    summary_tokens = counter.count_text(SUMMARY_PREFIX + summary, model_name) if summary else 0
+    if summary_tokens + counter.count_messages(messages[summarized_upto:], model_name) <= budget:
+        return summarized_upto, summarized_upto
+
+    start = select_window(
+        messages,
+        int(budget * summary_ratio),
+        counter,
+        model_name,
+        start=summarized_upto,
+        reserved=summary_tokens
+    )
+    return start, start
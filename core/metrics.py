@@ -0,0 +1,285 @@
+"""
+Runtime Metrics.
+
+This module records per-stage latencies and counters for the chat hot path
+(history conversion, graph build, queue wait, model time to first token and
+generation, history I/O, cache hits, tokens, provider connections, history
+retention and errors) and serves them in the Prometheus text format on a
+local /metrics endpoint.
+
+Metrics are off unless METRICS_PORT is set. When off, spans are a shared
+no-op context manager, counters return immediately and timed() leaves the
+decorated function untouched, so the hot path pays next to nothing.
+"""
+
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+# Histogram buckets in seconds, from sub-millisecond I/O to slow model calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NOOP = nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Bucketed observations (cumulative on output) per label set."""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Per label set: one count per bucket plus +Inf, then the sum
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            values[index] += 1
+            values[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(values)) for labels, values in self._values.items())
+        for labels, values in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {values[-1]:g}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {cumulative}")
+        return lines
+
+
+class _Span:
+    # Times one stage and counts the error class if it raises
+
+    __slots__ = ("metrics", "stage", "labels", "started")
+
+    def __init__(self, metrics, stage, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.stage_seconds.observe(time.perf_counter() - self.started, stage=self.stage, **self.labels)
+        if exc_type is not None:
+            self.metrics.error(self.stage, exc)
+        return False
+
+
+class Metrics:
+    """
+    The application's metrics: stage latencies, counters and their endpoint.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics = []
+        self.stage_seconds = self._add(Histogram("coding_agent_stage_seconds", "Time spent in each stage of a chat turn."))
+        self.errors = self._add(Counter("coding_agent_errors_total", "Errors by stage and exception class."))
+        self.cache_lookups = self._add(Counter("coding_agent_cache_lookups_total", "Response cache lookups by cache and result."))
+        self.tokens = self._add(Counter("coding_agent_tokens_total", "Model tokens by model and direction."))
+        self.model_requests = self._add(Counter("coding_agent_model_requests_total", "Model requests by model and outcome."))
+        self.http_requests = self._add(Counter("coding_agent_http_requests_total", "Provider HTTP requests by host."))
+        self.http_connections = self._add(Counter("coding_agent_http_connections_total", "New provider connections and TLS handshakes by host."))
+        self.history_evictions = self._add(Counter("coding_agent_history_evictions_total", "Chat histories evicted by the retention sweeper, by reason."))
+        self.history_bytes_reclaimed = self._add(Counter("coding_agent_history_bytes_reclaimed_total", "Bytes of history files deleted by the retention sweeper, by reason."))
+        self.history_bytes_archived = self._add(Counter("coding_agent_history_bytes_archived_total", "Bytes of compressed archive segments written by the retention sweeper."))
+        self._server = None
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def span(self, stage: str, **labels):
+        """
+        Context manager timing a stage; a no-op when metrics are off.
+
+        Args:
+            stage: Stage name, used as the ``stage`` label
+            **labels: Extra labels, e.g. the model
+        """
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, stage, labels)
+
+    def timed(self, stage: str):
+        """Decorator timing every call of a function (or coroutine function) as a stage."""
+        def decorate(fn):
+            if not self.enabled:
+                return fn
+
+            if inspect.isasyncgenfunction(fn):
+                @functools.wraps(fn)
+                async def async_generator_wrapper(*args, **kwargs):
+                    with _Span(self, stage, {}):
+                        async for item in fn(*args, **kwargs):
+                            yield item
+                return async_generator_wrapper
+
+            if inspect.isgeneratorfunction(fn):
+                @functools.wraps(fn)
+                def generator_wrapper(*args, **kwargs):
+                    with _Span(self, stage, {}):
+                        yield from fn(*args, **kwargs)
+                return generator_wrapper
+
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with _Span(self, stage, {}):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Span(self, stage, {}):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe(self, stage: str, seconds: float, **labels):
+        """Record a stage duration measured by the caller."""
+        if self.enabled:
+            self.stage_seconds.observe(seconds, stage=stage, **labels)
+
+    def error(self, stage: str, error: BaseException):
+        """Count an error by stage and exception class."""
+        if self.enabled:
+            self.errors.inc(stage=stage, error=type(error).__name__)
+
+    def cache_lookup(self, cache: str, hit: bool):
+        """Count a response cache lookup."""
+        if self.enabled:
+            self.cache_lookups.inc(cache=cache, result="hit" if hit else "miss")
+
+    def model_request(self, model_name: str, ok: bool, usage: Optional[Dict] = None):
+        """Count a model request and the tokens it used."""
+        if not self.enabled:
+            return
+        self.model_requests.inc(model=model_name, outcome="ok" if ok else "error")
+        if usage:
+            self.tokens.inc(usage.get("input_tokens", 0), model=model_name, direction="in")
+            self.tokens.inc(usage.get("output_tokens", 0), model=model_name, direction="out")
+
+    def http_request(self, host: str):
+        """Count a request sent through the shared HTTP transport."""
+        if self.enabled:
+            self.http_requests.inc(host=host)
+
+    def http_connection(self, host: str, event: str):
+        """Count a new connection ("connect") or TLS handshake ("tls") opened by the shared HTTP transport."""
+        if self.enabled:
+            self.http_connections.inc(host=host, event=event)
+
+    def history_eviction(self, reason: str, size: int):
+        """Count a chat history evicted by retention ("age", "chats" or "bytes") and the bytes it freed."""
+        if self.enabled:
+            self.history_evictions.inc(reason=reason)
+            self.history_bytes_reclaimed.inc(size, reason=reason)
+
+    def history_archive(self, size: int):
+        """Count the bytes of an archive segment written before evicting chats."""
+        if self.enabled:
+            self.history_bytes_archived.inc(size)
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """
+        Serve /metrics from a background thread.
+
+        Args:
+            port: Port to listen on
+            host: Interface to bind; local only by default
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes every few seconds would flood the console
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+
+
+# Application-wide metrics, created on first use from the environment
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics() -> Metrics:
+    """Return the application-wide metrics; enabled when METRICS_PORT is set."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(enabled=bool(os.getenv("METRICS_PORT", "").strip()))
+        return _metrics
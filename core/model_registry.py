@@ -0,0 +1,128 @@
+"""
+Chat Model Registry.
+
+This module keeps initialized chat model clients alive between turns so that
+provider SDK construction and connection setup are paid once per model
+instead of once per message.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+# Maximum number of chat model clients kept alive at once
+DEFAULT_MAX_MODELS = 8
+
+
+def credential_fingerprint(api_key: Optional[str]) -> str:
+    """
+    Create a short, non-reversible fingerprint for an API key.
+
+    Args:
+        api_key: The API key (may be empty)
+
+    Returns:
+        str: A hex digest identifying the key without exposing it
+    """
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class ModelRegistry:
+    """
+    Bounded LRU cache of initialized chat models.
+
+    Entries are keyed by ``provider:model`` plus a fingerprint of the
+    credential used to build the client, so a changed API key never reuses
+    a client created with the old one.
+    """
+
+    def __init__(self, max_models: int = DEFAULT_MAX_MODELS):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, api_key: Optional[str], factory: Callable[[], Any]):
+        """
+        Return the cached client for a model, creating it on first use.
+
+        Args:
+            model_name: Full model name in ``provider:model`` form
+            api_key: Credential used to build the client
+            factory: Zero-argument callable that builds a new client
+
+        Returns:
+            The initialized chat model
+        """
+        key = (model_name, credential_fingerprint(api_key))
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+        # Build outside the lock so a slow provider doesn't block other models
+        model = factory()
+
+        with self._lock:
+            # Another thread may have built the same model in the meantime
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            self._models[key] = model
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+        return model
+
+    def cached(self, model_name: str, api_key: Optional[str]) -> Optional[Any]:
+        """
+        Return the cached client for a model without creating one.
+
+        Args:
+            model_name: Full model name in ``provider:model`` form
+            api_key: Credential used to build the client
+
+        Returns:
+            The initialized chat model, or None if it isn't cached
+        """
+        key = (model_name, credential_fingerprint(api_key))
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+        return None
+
+    def contains(self, model_name: str, api_key: Optional[str]) -> bool:
+        """
+        Return True if a model's client is cached, without counting it as a use.
+
+        Args:
+            model_name: Full model name in ``provider:model`` form
+            api_key: Credential used to build the client
+        """
+        with self._lock:
+            return (model_name, credential_fingerprint(api_key)) in self._models
+
+    def invalidate(self, provider: Optional[str] = None, api_key: Optional[str] = None):
+        """
+        Drop cached clients.
+
+        Args:
+            provider: Only drop clients for this provider; drop everything if None
+            api_key: Only drop clients built with this credential, e.g. one a
+                session has just replaced
+        """
+        fingerprint = credential_fingerprint(api_key) if api_key is not None else None
+        with self._lock:
+            if provider is None and fingerprint is None:
+                self._models.clear()
+                return
+            for key in list(self._models):
+                if provider is not None and key[0].split(":", 1)[0] != provider:
+                    continue
+                if fingerprint is not None and key[1] != fingerprint:
+                    continue
+                del self._models[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._models)
@@ -0,0 +1,244 @@
+"""
+Per-Provider Rate Limits.
+
+This module keeps model requests under each provider's requests-per-minute
+and tokens-per-minute limits, separately for every API key. Each
+(provider, key) pair has one token bucket per limit. A request that doesn't
+fit reserves the next free slot and waits for it, so waiters are admitted
+in arrival order. A request whose wait would exceed the deadline is rejected
+straight away instead of piling up behind the others.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple
+
+
+def parse_rate_limits(spec: Optional[str]) -> Dict[str, Tuple[int, int]]:
+    """
+    Parse a rate limit specification such as ``"openai=500/30000,anthropic=50/40000"``.
+
+    Each entry is ``provider=requests_per_minute/tokens_per_minute``; either
+    number may be 0 (or the token part omitted) for no limit.
+
+    Args:
+        spec: Comma separated rate limits
+
+    Returns:
+        dict: Mapping of provider name to (requests per minute, tokens per minute)
+    """
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        provider, value = item.split("=", 1)
+        rpm, _, tpm = value.partition("/")
+        try:
+            limits[provider.strip()] = (max(0, int(rpm or 0)), max(0, int(tpm or 0)))
+        except ValueError:
+            print(f"Ignoring invalid rate limit: {item}")
+    return limits
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request would wait longer than the admission deadline."""
+
+
+class TokenBucket:
+    """
+    A bucket refilled continuously at ``per_minute / 60`` units per second.
+
+    The level may go negative: that is capacity already promised to
+    requests waiting for their turn.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Return the seconds until ``amount`` units are available (after refill())."""
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+
+class Reservation:
+    """A request's admitted slot: when it may start and what it was charged."""
+
+    def __init__(self, lane, start: float, tokens: int):
+        self.lane = lane
+        self.start = start
+        self.tokens = tokens
+        self.settled = False
+
+
+class _Lane:
+    # Buckets and pending reservations of one (provider, key) pair
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.starts = deque()
+
+    def buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def waiting(self, now: float) -> int:
+        # Start times are increasing, so admitted requests sit at the front
+        while self.starts and self.starts[0] <= now:
+            self.starts.popleft()
+        return len(self.starts)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits per provider and API key.
+
+    Providers without a configured limit are not limited.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[int, int]]] = None, max_wait: float = 30.0):
+        """
+        Args:
+            limits: Mapping of provider name to (requests per minute, tokens per minute)
+            max_wait: Longest a request may wait for admission, in seconds
+        """
+        self.limits = dict(limits or {})
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._lanes = {}
+
+    def is_limited(self, provider: str) -> bool:
+        """Return True when a provider has a rate limit configured."""
+        return any(self.limits.get(provider, ()))
+
+    def _lane(self, provider: str, credential: str) -> _Lane:
+        key = (provider, credential)
+        if key not in self._lanes:
+            self._lanes[key] = _Lane(*self.limits[provider])
+        return self._lanes[key]
+
+    def _wait(self, lane: _Lane, tokens: int, now: float) -> float:
+        wait = 0.0
+        for bucket in lane.buckets():
+            bucket.refill(now)
+        if lane.requests is not None:
+            wait = max(wait, lane.requests.wait_for(1))
+        if lane.tokens is not None:
+            wait = max(wait, lane.tokens.wait_for(tokens))
+        return wait
+
+    def estimate(self, provider: str, credential: str, tokens: int = 0) -> Tuple[int, float]:
+        """
+        Return the queue position and expected wait a new request would get.
+
+        Args:
+            provider: Provider name
+            credential: Fingerprint of the API key
+            tokens: Expected tokens of the request
+
+        Returns:
+            tuple: (requests waiting ahead, seconds until admission)
+        """
+        if not self.is_limited(provider):
+            return 0, 0.0
+        with self._lock:
+            lane = self._lane(provider, credential)
+            now = time.monotonic()
+            return lane.waiting(now), self._wait(lane, tokens, now)
+
+    def reserve(self, provider: str, credential: str, tokens: int) -> Optional[Reservation]:
+        """
+        Reserve the next slot for a request, charging it to the buckets.
+
+        Args:
+            provider: Provider name
+            credential: Fingerprint of the API key
+            tokens: Expected tokens of the request (prompt plus completion)
+
+        Returns:
+            Reservation: The admitted slot, or None when the provider isn't limited
+
+        Raises:
+            RateLimitExceeded: When the request would wait longer than max_wait
+        """
+        if not self.is_limited(provider):
+            return None
+        with self._lock:
+            lane = self._lane(provider, credential)
+            now = time.monotonic()
+            wait = self._wait(lane, tokens, now)
+            if wait > self.max_wait:
+                raise RateLimitExceeded(
+                    f"{provider} rate limit reached: {lane.waiting(now)} request(s) queued, "
+                    f"about {wait:.0f}s to wait (limit {self.max_wait:g}s)"
+                )
+            if lane.requests is not None:
+                lane.requests.level -= 1
+            if lane.tokens is not None:
+                # A request larger than a minute's budget is charged a full minute
+                tokens = min(tokens, int(lane.tokens.capacity))
+                lane.tokens.level -= tokens
+            reservation = Reservation(lane, now + wait, tokens)
+            if wait > 0:
+                lane.starts.append(reservation.start)
+            return reservation
+
+    def settle(self, reservation: Optional[Reservation], tokens_used: Optional[int] = None):
+        """
+        Correct a reservation's token charge once the real usage is known.
+
+        Args:
+            reservation: Reservation returned by reserve()
+            tokens_used: Tokens actually used; None refunds the whole reservation
+                (the request never reached the provider)
+        """
+        if reservation is None:
+            return
+        with self._lock:
+            # An abandoned request may be settled from the router's thread too
+            if reservation.settled:
+                return
+            reservation.settled = True
+            lane = reservation.lane
+            if tokens_used is None and lane.requests is not None:
+                lane.requests.level += 1
+            if lane.tokens is not None:
+                lane.tokens.level += reservation.tokens - (tokens_used or 0)
+
+    @contextmanager
+    def acquire(self, provider: str, credential: str, tokens: int):
+        """
+        Wait for admission before a blocking request.
+
+        Yields the reservation so the caller can settle() it with the real usage.
+        """
+        reservation = self.reserve(provider, credential, tokens)
+        if reservation is not None:
+            delay = reservation.start - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield reservation
+
+    @asynccontextmanager
+    async def aacquire(self, provider: str, credential: str, tokens: int):
+        """Async version of acquire(); a cancelled waiter gives its slot back."""
+        reservation = self.reserve(provider, credential, tokens)
+        if reservation is not None:
+            delay = reservation.start - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    # The request never reached the provider
+                    self.settle(reservation)
+                    raise
+        yield reservation
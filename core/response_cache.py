@@ -0,0 +1,208 @@
+"""
+Response Cache.
+
+This module stores model answers keyed on the exact request (model name,
+normalized messages and generation parameters) and the tenant it was made
+for, so repeated questions are answered without another upstream call but
+never across tenants. A small in-memory LRU sits in
+front of a size-capped SQLite table; both tiers honour a TTL.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .context_window import content_text
+
+# Minimum seconds between sweeps of expired rows from the disk tier
+PURGE_INTERVAL = 60
+
+
+def normalize_messages(messages: List[Any]) -> List[List[str]]:
+    """
+    Reduce messages to (type, text) pairs with whitespace collapsed.
+
+    Message IDs, metadata and formatting-only whitespace differences don't
+    change the answer, so they are left out of the cache key.
+    """
+    return [[message.type, " ".join(content_text(message.content).split())] for message in messages]
+
+
+def cache_key(model_name: str, messages: List[Any], params: Optional[Dict[str, Any]] = None, scope: str = "") -> str:
+    """
+    Build the cache key for a request.
+
+    Args:
+        model_name: Full model name in ``provider:model`` form
+        messages: Messages sent to the model
+        params: Generation parameters that affect the answer
+        scope: Tenant the answer may be served to, e.g. the credential
+            fingerprint of the API key the request used
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    payload = json.dumps(
+        {"model": model_name, "scope": scope, "messages": normalize_messages(messages), "params": params or {}},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier exact-match cache of model answers.
+
+    Attributes:
+        stats: Hit, miss, store and eviction counters
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        ttl_seconds: float = 86400,
+        memory_entries: int = 512,
+        max_disk_bytes: int = 256 * 1024 * 1024
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_bytes = 0
+        self._last_purge = 0.0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, "
+                "accessed REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._conn.commit()
+            self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created > self.ttl_seconds
+
+    def _remember(self, key: str, value: str, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached answer.
+
+        Args:
+            key: Key built with cache_key
+
+        Returns:
+            The cached answer, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created, now):
+                        self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                        self._conn.commit()
+                        self._remember(key, value, created)
+                        self.stats["disk_hits"] += 1
+                        return value
+                    self._delete_disk(key)
+                    self._conn.commit()
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key: str, value: str):
+        """
+        Store an answer in both tiers.
+
+        Args:
+            key: Key built with cache_key
+            value: The answer text
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.stats["stores"] += 1
+            if self._conn is None:
+                return
+            self._delete_disk(key)
+            size = len(value.encode("utf-8"))
+            self._conn.execute(
+                "INSERT INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, size)
+            )
+            self._disk_bytes += size
+            self._evict_disk(now)
+            self._conn.commit()
+
+    def _delete_disk(self, key: str) -> bool:
+        row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._disk_bytes -= row[0]
+        return True
+
+    def _evict_disk(self, now: float):
+        # Periodically drop expired rows, then least recently used ones over the size cap
+        if self.ttl_seconds and now - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = now
+            cutoff = now - self.ttl_seconds
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created < ?", (cutoff,)
+            ).fetchone()
+            if count:
+                self._conn.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+                self._disk_bytes -= size
+                self.stats["evictions"] += count
+
+        while self._disk_bytes > self.max_disk_bytes:
+            oldest = self._conn.execute(
+                "SELECT key FROM responses ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                self._disk_bytes = 0
+                break
+            for (key,) in oldest:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                self._delete_disk(key)
+                self._memory.pop(key, None)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        """Remove every cached answer."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+                self._disk_bytes = 0
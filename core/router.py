@@ -0,0 +1,526 @@
+"""
+Latency-Aware Model Routing.
+
+This module routes a chat request across a model and its configured
+equivalents. It keeps rolling time-to-first-token percentiles and error
+rates per model, moves models that keep failing to the back of the line,
+fails over to the next equivalent when a request errors or goes quiet for
+too long, and can hedge a request that hasn't started answering by its
+model's p95 with a backup, keeping whichever finishes first.
+
+Requests report their streamed chunks through an Attempt. Only one attempt
+at a time forwards its text to the caller's stream; when another takes
+over (a failover, or a hedge that wins) the stream gets a reset event so
+the caller can drop the text shown so far.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+def parse_fallbacks(spec: Optional[str]) -> Dict[str, List[str]]:
+    """
+    Parse a fallback specification such as
+    ``"openai:gpt-4o=anthropic:claude-3-opus-20240229,google_genai:gemini-1.5-pro"``.
+
+    Entries are separated by ``;``, and each maps a model to a comma
+    separated list of equivalents in order of preference.
+
+    Args:
+        spec: Fallback specification
+
+    Returns:
+        dict: Mapping of model name to its fallback model names
+    """
+    fallbacks = {}
+    for entry in (spec or "").split(";"):
+        if "=" not in entry:
+            continue
+        model_name, equivalents = entry.split("=", 1)
+        equivalents = [name.strip() for name in equivalents.split(",") if ":" in name]
+        if ":" not in model_name or not equivalents:
+            print(f"Ignoring invalid model fallback: {entry}")
+            continue
+        fallbacks[model_name.strip()] = equivalents
+    return fallbacks
+
+
+class RoutingError(Exception):
+    """Raised when every candidate model failed to answer."""
+
+    def __init__(self, errors: List[Tuple[str, Exception]]):
+        self.errors = errors
+        details = "; ".join(f"{model_name}: {error}" for model_name, error in errors)
+        super().__init__(details if len(errors) == 1 else f"All models failed. {details}")
+
+
+class LatencyStats:
+    """
+    Rolling latency and error statistics per model over the last requests.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._outcomes = {}
+        self._last_seen = {}
+
+    def record(self, model_name: str, seconds: float, ok: bool):
+        """
+        Record the outcome of one request.
+
+        Args:
+            model_name: Model that handled the request
+            seconds: Time until it answered or failed
+            ok: Whether it answered
+        """
+        with self._lock:
+            if model_name not in self._outcomes:
+                self._latencies[model_name] = deque(maxlen=self.window)
+                self._outcomes[model_name] = deque(maxlen=self.window)
+            self._outcomes[model_name].append(ok)
+            self._last_seen[model_name] = time.monotonic()
+            # Failures often return early, so only answers count towards latency
+            if ok:
+                self._latencies[model_name].append(seconds)
+
+    def samples(self, model_name: str) -> int:
+        """Return the number of requests recorded for a model."""
+        with self._lock:
+            return len(self._outcomes.get(model_name, ()))
+
+    def idle_seconds(self, model_name: str) -> float:
+        """Return the seconds since a model's last recorded request."""
+        with self._lock:
+            last_seen = self._last_seen.get(model_name)
+        return float("inf") if last_seen is None else time.monotonic() - last_seen
+
+    def percentile(self, model_name: str, q: float) -> Optional[float]:
+        """
+        Return the q-th percentile (0-100) of a model's answer latency.
+
+        Returns:
+            float: Latency in seconds, or None without any answers
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(model_name, ()))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))]
+
+    def error_rate(self, model_name: str) -> float:
+        """Return the fraction of a model's recent requests that failed."""
+        with self._lock:
+            outcomes = self._outcomes.get(model_name)
+            if not outcomes:
+                return 0.0
+            return 1 - sum(outcomes) / len(outcomes)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Return p50/p95 latency, error rate and sample count for every model.
+        """
+        with self._lock:
+            model_names = list(self._outcomes)
+        return {
+            model_name: {
+                "p50": self.percentile(model_name, 50),
+                "p95": self.percentile(model_name, 95),
+                "error_rate": self.error_rate(model_name),
+                "samples": self.samples(model_name)
+            }
+            for model_name in model_names
+        }
+
+
+class AttemptAbandoned(Exception):
+    """Raised inside a request the router gave up on (it went quiet or lost a hedge)."""
+
+
+class Attempt:
+    """
+    One request to one model, as seen by both the router and the request.
+
+    The request calls chunk() for every chunk it receives. That keeps the
+    attempt from timing out, and forwards the text to the caller's stream
+    while the attempt is live; otherwise the text is buffered, and flushed
+    if the attempt takes over. Once the router abandons an attempt, its
+    cleanups run right away (e.g. to give back a concurrency slot) and the
+    request's next chunk() raises AttemptAbandoned.
+    """
+
+    def __init__(self, model_name: str, emit: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Args:
+            model_name: Model the request goes to
+            emit: Stream to forward text to straight away; None buffers it
+        """
+        self.model_name = model_name
+        self.started = time.monotonic()
+        self.last_activity = self.started
+        self.first_token_at = None
+        self._emit = emit
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._abandoned = False
+        self._cleanups = []
+
+    @property
+    def abandoned(self) -> bool:
+        return self._abandoned
+
+    def chunk(self, text: str):
+        """
+        Report a chunk received from the model.
+
+        Raises:
+            AttemptAbandoned: When the router no longer wants this request
+        """
+        if self._abandoned:
+            raise AttemptAbandoned(f"{self.model_name} request abandoned")
+        now = time.monotonic()
+        with self._lock:
+            self.last_activity = now
+            if not text:
+                return
+            if self.first_token_at is None:
+                self.first_token_at = now
+            if self._emit is not None:
+                self._emit({"delta": text})
+            else:
+                self._buffer.append(text)
+
+    def go_live(self, emit: Callable[[Dict[str, Any]], None]):
+        """Forward the buffered text, and every later chunk, to a stream."""
+        with self._lock:
+            if self._buffer:
+                emit({"delta": "".join(self._buffer)})
+                self._buffer = []
+            self._emit = emit
+
+    def mute(self):
+        """Stop forwarding text; later chunks are buffered."""
+        with self._lock:
+            self._emit = None
+
+    def on_abandon(self, cleanup: Callable[[], None]):
+        """Run cleanup if the router abandons this attempt (right away if it already has)."""
+        with self._lock:
+            if not self._abandoned:
+                self._cleanups.append(cleanup)
+                return
+        cleanup()
+
+    def abandon(self):
+        """Give up on the request: stop forwarding its text and run its cleanups."""
+        with self._lock:
+            if self._abandoned:
+                return
+            self._abandoned = True
+            self._emit = None
+            cleanups, self._cleanups = self._cleanups, []
+        for cleanup in cleanups:
+            try:
+                cleanup()
+            except Exception as e:
+                print(f"Error releasing abandoned {self.model_name} request: {e}")
+
+
+class _Output:
+    # The caller's stream for one routed request; remembers whether any text
+    # was shown, so a takeover only sends a reset when there is something to clear
+
+    def __init__(self, emit: Optional[Callable[[Dict[str, Any]], None]]):
+        self.emit = emit
+        self.shown = False
+
+    def __call__(self, event: Dict[str, Any]):
+        self.shown = True
+        if self.emit is not None:
+            self.emit(event)
+
+    def reset(self):
+        if self.shown and self.emit is not None:
+            self.emit({"reset": True})
+        self.shown = False
+
+
+class ModelRouter:
+    """
+    Runs a request against a model and its fallbacks.
+
+    ``call(attempt)`` performs one request to ``attempt.model_name``,
+    reporting each streamed chunk through ``attempt.chunk()``, and returns
+    the response. An attempt times out when it goes ``timeout`` seconds
+    without a chunk, whether it hasn't started answering or stalled
+    mid-answer; a request that keeps streaming is never cut off. A
+    thread-based request can't be interrupted, so an abandoned one releases
+    what it holds through its on_abandon() cleanups and stops at its next
+    chunk. Abandoned asyncio requests are cancelled.
+    """
+
+    def __init__(
+        self,
+        fallbacks: Optional[Dict[str, List[str]]] = None,
+        hedge: bool = False,
+        hedge_delay: float = 5.0,
+        min_hedge_delay: float = 0.5,
+        timeout: float = 60.0,
+        window: int = 200,
+        min_samples: int = 20,
+        max_error_rate: float = 0.5,
+        cooldown: float = 30.0,
+        max_workers: int = 64
+    ):
+        """
+        Args:
+            fallbacks: Mapping of model name to equivalent models, in order of preference
+            hedge: Start a backup request when the primary is slower than usual to start answering
+            hedge_delay: Hedge delay used until the primary has min_samples answers
+            min_hedge_delay: Lower bound of the p95-based hedge delay
+            timeout: Seconds an attempt may go without a chunk before it counts as failed; 0 waits forever
+            window: Number of recent requests kept per model
+            min_samples: Requests needed before percentiles and error rates are trusted
+            max_error_rate: Error rate above which a model is tried after its equivalents
+            cooldown: Seconds after which an unhealthy model is tried first again
+            max_workers: Threads available to the sync path
+        """
+        self.fallbacks = dict(fallbacks or {})
+        self.hedge = hedge
+        self.default_hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.timeout = timeout
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.stats = LatencyStats(window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-router")
+
+    def is_healthy(self, model_name: str) -> bool:
+        """Return False for a model whose recent error rate is too high."""
+        if self.stats.samples(model_name) < self.min_samples:
+            return True
+        # A demoted model gets few requests, so let one through now and then to probe it
+        if self.stats.idle_seconds(model_name) >= self.cooldown:
+            return True
+        return self.stats.error_rate(model_name) <= self.max_error_rate
+
+    def candidates(self, model_name: str) -> List[str]:
+        """
+        Return the models to try for a request, best first.
+
+        The requested model comes first, followed by its fallbacks; unhealthy
+        models keep their relative order but move behind the healthy ones.
+        """
+        models = [model_name] + [name for name in self.fallbacks.get(model_name, []) if name != model_name]
+        return sorted(models, key=lambda name: not self.is_healthy(name))
+
+    def hedge_delay(self, model_name: str) -> float:
+        """Return how long to wait for a model's first token before starting a backup request."""
+        if self.stats.samples(model_name) < self.min_samples:
+            return self.default_hedge_delay
+        p95 = self.stats.percentile(model_name, 95)
+        if p95 is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, p95)
+
+    def _next_wakeup(self, attempts: Iterable[Attempt], hedge_at: Optional[float]) -> Optional[float]:
+        # Seconds until the next idle deadline or hedge, None for no limit
+        moments = [attempt.last_activity + self.timeout for attempt in attempts] if self.timeout else []
+        if hedge_at is not None:
+            moments.append(hedge_at)
+        if not moments:
+            return None
+        return max(0.0, min(moments) - time.monotonic())
+
+    def _expired(self, attempt: Attempt, now: float) -> bool:
+        return bool(self.timeout) and now - attempt.last_activity >= self.timeout
+
+    def _timeout_error(self) -> TimeoutError:
+        return TimeoutError(f"No output for {self.timeout:g} seconds")
+
+    def _failed(self, errors, attempt: Attempt, error: Exception):
+        self.stats.record(attempt.model_name, time.monotonic() - attempt.started, ok=False)
+        errors.append((attempt.model_name, error))
+        print(f"Model {attempt.model_name} failed: {error}")
+
+    def _succeeded(self, attempt: Attempt):
+        # Streamed answers take as long as they are long, so the latency
+        # that matters for hedging is the time to the first token
+        answered_at = attempt.first_token_at or time.monotonic()
+        self.stats.record(attempt.model_name, answered_at - attempt.started, ok=True)
+
+    def invoke(
+        self,
+        candidates: List[str],
+        call: Callable[[Attempt], Any],
+        emit: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[str, Any]:
+        """
+        Run a request on worker threads, failing over and hedging as configured.
+
+        With a single candidate there is nothing to route; call the model
+        directly instead.
+
+        Args:
+            candidates: Models to try, best first (see candidates())
+            call: Function performing one request, ``call(attempt)``
+            emit: Receives ``{"delta": text}`` for the live attempt's text and
+                ``{"reset": True}`` when another attempt takes over
+
+        Returns:
+            tuple: Name of the model that answered and its response
+
+        Raises:
+            RoutingError: When every candidate failed
+        """
+        output = _Output(emit)
+        queue = list(candidates)
+        errors = []
+        pending = {}
+        live = None
+        hedge_at = None
+
+        def launch():
+            attempt = Attempt(queue.pop(0))
+            # Copy the context so the run's callbacks reach the worker thread
+            future = self._executor.submit(contextvars.copy_context().run, call, attempt)
+            pending[future] = attempt
+            return attempt
+
+        def take_over(attempt):
+            nonlocal live
+            if live is attempt:
+                return
+            if live is not None:
+                live.mute()
+            output.reset()
+            attempt.go_live(output)
+            live = attempt
+
+        primary = launch()
+        take_over(primary)
+        if self.hedge and queue:
+            hedge_at = primary.started + self.hedge_delay(primary.model_name)
+
+        try:
+            while pending:
+                timeout = self._next_wakeup(pending.values(), hedge_at)
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    attempt = pending.pop(future)
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        self._failed(errors, attempt, e)
+                        continue
+                    self._succeeded(attempt)
+                    # A winning hedge replaces whatever the primary streamed
+                    take_over(attempt)
+                    return attempt.model_name, response
+
+                now = time.monotonic()
+                for future, attempt in list(pending.items()):
+                    if self._expired(attempt, now):
+                        del pending[future]
+                        attempt.abandon()
+                        self._failed(errors, attempt, self._timeout_error())
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    # Hedge only a request that hasn't started answering; the
+                    # backup stays silent unless it takes over
+                    if pending and queue and live.first_token_at is None:
+                        print(f"Hedging slow request to {live.model_name} with {queue[0]}")
+                        launch()
+                if pending and live not in pending.values():
+                    # The live attempt failed while a hedge was running
+                    take_over(next(iter(pending.values())))
+                if not pending and queue:
+                    take_over(launch())
+        finally:
+            for attempt in pending.values():
+                attempt.abandon()
+
+        raise RoutingError(errors)
+
+    async def ainvoke(
+        self,
+        candidates: List[str],
+        acall: Callable[[Attempt], Any],
+        emit: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[str, Any]:
+        """
+        Async version of invoke(); ``acall`` returns an awaitable.
+        """
+        output = _Output(emit)
+        queue = list(candidates)
+        errors = []
+        pending = {}
+        live = None
+        hedge_at = None
+
+        def launch():
+            attempt = Attempt(queue.pop(0))
+            task = asyncio.ensure_future(acall(attempt))
+            pending[task] = attempt
+            return attempt
+
+        def take_over(attempt):
+            nonlocal live
+            if live is attempt:
+                return
+            if live is not None:
+                live.mute()
+            output.reset()
+            attempt.go_live(output)
+            live = attempt
+
+        primary = launch()
+        take_over(primary)
+        if self.hedge and queue:
+            hedge_at = primary.started + self.hedge_delay(primary.model_name)
+
+        try:
+            while pending:
+                timeout = self._next_wakeup(pending.values(), hedge_at)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    attempt = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        self._failed(errors, attempt, e)
+                        continue
+                    self._succeeded(attempt)
+                    take_over(attempt)
+                    return attempt.model_name, response
+
+                now = time.monotonic()
+                for task, attempt in list(pending.items()):
+                    if self._expired(attempt, now):
+                        del pending[task]
+                        attempt.abandon()
+                        task.cancel()
+                        self._failed(errors, attempt, self._timeout_error())
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    if pending and queue and live.first_token_at is None:
+                        print(f"Hedging slow request to {live.model_name} with {queue[0]}")
+                        launch()
+                if pending and live not in pending.values():
+                    take_over(next(iter(pending.values())))
+                if not pending and queue:
+                    take_over(launch())
+        finally:
+            # Cancel the losing request, or everything if the caller was cancelled
+            for task, attempt in pending.items():
+                attempt.abandon()
+                task.cancel()
+
+        raise RoutingError(errors)
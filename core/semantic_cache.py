@@ -0,0 +1,203 @@
+"""
+Semantic Response Cache.
+
+This module answers paraphrased questions ("python s3 upload example" vs.
+"how to upload a file to S3 in python") from earlier answers. The last user
+turn is embedded with a local hashing vectorizer and compared by cosine
+similarity against a per-model array index held in NumPy. Namespaces are
+themselves kept in LRU order and capped, so memory stays bounded however
+many tenants (API keys) use the cache.
+"""
+
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Words that carry no meaning for matching coding questions
+STOP_WORDS = frozenset("""
+a an and are as at be by can code do does example examples for from give how i in is it me my
+of on or please sample show simple snippet so that the this to tutorial use using what when
+where which with write you your
+""".split())
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_+#.]+")
+
+
+class HashingEmbedder:
+    """
+    Offline text embedder based on the hashing trick.
+
+    Words are lower-cased, stop words removed, and each remaining word and
+    adjacent word pair is hashed into a fixed-size vector with a stable
+    signed hash. Term counts are dampened with ``1 + log(tf)`` and the
+    vector is L2-normalized, so a dot product is the cosine similarity.
+    """
+
+    def __init__(self, dim: int = 1024, bigram_weight: float = 0.25):
+        self.dim = dim
+        self.bigram_weight = bigram_weight
+
+    def tokens(self, text: str) -> List[str]:
+        words = [word.strip(".") for word in TOKEN_PATTERN.findall(text.lower())]
+        return [word for word in words if word and word not in STOP_WORDS]
+
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        digest = zlib.crc32(feature.encode("utf-8"))
+        sign = 1.0 if digest & 0x80000000 else -1.0
+        vector[digest % self.dim] += sign * weight
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single text into a unit-length float32 vector."""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = self.tokens(text)
+        for word, count in Counter(words).items():
+            self._add(vector, word, 1.0 + math.log(count))
+        for pair, count in Counter(zip(words, words[1:])).items():
+            self._add(vector, " ".join(pair), self.bigram_weight * (1.0 + math.log(count)))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Embed several texts into a (len(texts), dim) matrix."""
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.embed(text) for text in texts])
+
+
+class _Namespace:
+    """Fixed-capacity vector index for one model."""
+
+    def __init__(self, dim: int, capacity: int):
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, 64), dim), dtype=np.float32)
+        self.last_used = np.zeros(len(self.vectors), dtype=np.float64)
+        self.answers = []
+
+    def slot_for_insert(self) -> int:
+        size = len(self.answers)
+        if size < len(self.vectors):
+            self.answers.append(None)
+            return size
+        if size < self.capacity:
+            # Grow the preallocated arrays geometrically up to the capacity
+            grown = min(self.capacity, len(self.vectors) * 2)
+            self.vectors = np.resize(self.vectors, (grown, self.vectors.shape[1]))
+            self.vectors[size:] = 0
+            self.last_used = np.resize(self.last_used, grown)
+            self.last_used[size:] = 0
+            self.answers.append(None)
+            return size
+        # Full: replace the least recently used entry
+        return int(np.argmin(self.last_used))
+
+
+class SemanticCache:
+    """
+    Cosine-similarity cache of answers, namespaced per model and tenant.
+
+    Each namespace holds at most max_entries answers, and at most
+    max_namespaces namespaces are kept; storing into a new one beyond that
+    drops the least recently used namespace whole.
+
+    Attributes:
+        stats: Hit, miss, store and eviction counters (entry and whole-namespace evictions)
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        max_entries: int = 2000,
+        embedder: Optional[HashingEmbedder] = None,
+        max_namespaces: int = 16
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_namespaces = max(1, max_namespaces)
+        self.embedder = embedder or HashingEmbedder()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "namespace_evictions": 0}
+        self._namespaces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup_many(self, namespace: str, texts: List[str]) -> List[Tuple[Optional[str], float]]:
+        """
+        Find the closest cached answer for several questions at once.
+
+        Args:
+            namespace: Cache namespace, normally the full model name and the
+                credential fingerprint of the API key used
+            texts: Questions to look up
+
+        Returns:
+            list: (answer or None, similarity) for each question
+        """
+        queries = self.embedder.embed_many(texts)
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            size = len(index.answers) if index else 0
+            if not size:
+                self.stats["misses"] += len(texts)
+                return [(None, 0.0)] * len(texts)
+            self._namespaces.move_to_end(namespace)
+
+            similarities = queries @ index.vectors[:size].T
+            best = similarities.argmax(axis=1)
+            now = time.time()
+            results = []
+            for row, slot in enumerate(best):
+                score = float(similarities[row, slot])
+                if score >= self.threshold:
+                    index.last_used[slot] = now
+                    self.stats["hits"] += 1
+                    results.append((index.answers[slot], score))
+                else:
+                    self.stats["misses"] += 1
+                    results.append((None, score))
+            return results
+
+    def lookup(self, namespace: str, text: str) -> Optional[str]:
+        """Return the cached answer for a question, or None on a miss."""
+        return self.lookup_many(namespace, [text])[0][0]
+
+    def put(self, namespace: str, text: str, answer: str):
+        """
+        Store an answer for a question.
+
+        Args:
+            namespace: Cache namespace (see lookup_many())
+            text: The question
+            answer: The model's answer
+        """
+        vector = self.embedder.embed(text)
+        if not vector.any():
+            # Nothing but stop words; it would match everything equally badly
+            return
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            if index is None:
+                index = self._namespaces[namespace] = _Namespace(self.embedder.dim, self.max_entries)
+                while len(self._namespaces) > self.max_namespaces:
+                    self._namespaces.popitem(last=False)
+                    self.stats["namespace_evictions"] += 1
+            self._namespaces.move_to_end(namespace)
+            evicting = len(index.answers) >= self.max_entries
+            slot = index.slot_for_insert()
+            index.vectors[slot] = vector
+            index.last_used[slot] = time.time()
+            index.answers[slot] = answer
+            self.stats["stores"] += 1
+            if evicting:
+                self.stats["evictions"] += 1
+
+    def clear(self, namespace: Optional[str] = None):
+        """Drop one namespace, or every namespace if None."""
+        with self._lock:
+            if namespace is None:
+                self._namespaces.clear()
+            else:
+                self._namespaces.pop(namespace, None)
@@ -0,0 +1,312 @@
+"""
+Shared HTTP Transport.
+
+This module gives the provider SDK clients one shared, pooled HTTP client
+(sync and async) instead of a fresh connection pool per model client, so
+connections (and their DNS, TCP and TLS setup) are reused across models,
+API keys and sessions. Pool size, keep-alive and timeouts are configurable,
+and every request and new connection is counted so reuse can be checked.
+
+The OpenAI and Anthropic SDKs are built on httpx and accept the shared
+clients. The Google client talks gRPC through its own channel and is left
+as it is.
+
+An asyncio connection pool belongs to the event loop that opened its
+connections, so the async client keeps a separate pool for every running
+loop: a model client built once can be used from any loop.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+from core.metrics import get_metrics
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+def _per_loop_transport(**options):
+    # Built on first use so httpx is only imported when a client is needed
+    import httpx
+
+    class PerLoopTransport(httpx.AsyncBaseTransport):
+        """Async transport with a separate connection pool for each event loop."""
+
+        def __init__(self):
+            self._pools = weakref.WeakKeyDictionary()
+            self._lock = threading.Lock()
+
+        def _pool(self) -> "httpx.AsyncHTTPTransport":
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                pool = self._pools.get(loop)
+                if pool is None:
+                    pool = self._pools[loop] = httpx.AsyncHTTPTransport(**options)
+                return pool
+
+        async def handle_async_request(self, request):
+            return await self._pool().handle_async_request(request)
+
+        async def aclose(self):
+            # Only the running loop's connections can be closed from here
+            loop = asyncio.get_running_loop()
+            with self._lock:
+                pool = self._pools.pop(loop, None)
+            if pool is not None:
+                await pool.aclose()
+
+    return PerLoopTransport()
+
+
+class HttpTransport:
+    """
+    Lazily created, shared httpx clients with connection reuse counters.
+
+    A request that opens no new TCP connection reused a pooled one, so
+    ``requests - connections`` is the number of reused connections.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 60.0,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+        pool_timeout: float = 30.0,
+        http2: bool = False
+    ):
+        """
+        Args:
+            max_connections: Most open connections in the pool
+            max_keepalive: Most idle connections kept open for reuse
+            keepalive_expiry: Seconds an idle connection is kept open
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait between bytes of a response
+            pool_timeout: Seconds to wait for a free connection from the pool
+            http2: Negotiate HTTP/2 when the server supports it (needs the h2 package)
+        """
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_timeout = pool_timeout
+        self.http2 = http2
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "connections": 0, "tls_handshakes": 0}
+        self._metrics = get_metrics()
+
+    def _pool_options(self) -> Dict[str, Any]:
+        import httpx
+
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                print("HTTP/2 needs the h2 package (pip install 'httpx[http2]'); using HTTP/1.1")
+                http2 = False
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            "http2": http2
+        }
+
+    def _client_options(self) -> Dict[str, Any]:
+        import httpx
+
+        return {
+            "timeout": httpx.Timeout(
+                connect=self.connect_timeout,
+                read=self.read_timeout,
+                write=self.read_timeout,
+                pool=self.pool_timeout
+            ),
+            "follow_redirects": True
+        }
+
+    # httpcore reports each connection it opens through the request's trace extension
+    def _record(self, host: str, event: str):
+        stat = "connections" if event == "connection.connect_tcp.complete" else "tls_handshakes"
+        with self._stats_lock:
+            self._stats[stat] += 1
+        self._metrics.http_connection(host, "connect" if stat == "connections" else "tls")
+
+    def _count_request(self, host: str):
+        with self._stats_lock:
+            self._stats["requests"] += 1
+        self._metrics.http_request(host)
+
+    def _on_request(self, request):
+        host = request.url.host
+        self._count_request(host)
+
+        def trace(event, info):
+            if event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                self._record(host, event)
+
+        request.extensions["trace"] = trace
+
+    async def _aon_request(self, request):
+        host = request.url.host
+        self._count_request(host)
+
+        async def trace(event, info):
+            if event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+                self._record(host, event)
+
+        request.extensions["trace"] = trace
+
+    @property
+    def client(self):
+        """The shared synchronous httpx client."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    self._client = httpx.Client(
+                        event_hooks={"request": [self._on_request]},
+                        **self._pool_options(),
+                        **self._client_options()
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        """The shared asynchronous httpx client; it keeps one connection pool per event loop."""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    self._async_client = httpx.AsyncClient(
+                        transport=_per_loop_transport(**self._pool_options()),
+                        event_hooks={"request": [self._aon_request]},
+                        **self._client_options()
+                    )
+        return self._async_client
+
+    def model_kwargs(self, provider: str) -> Dict[str, Any]:
+        """
+        Extra ``init_chat_model`` arguments making a provider's client use the shared pool.
+
+        Args:
+            provider: Provider prefix of the model name
+
+        Returns:
+            dict: Keyword arguments for the chat model (empty if the provider can't take them)
+        """
+        if provider == "openai":
+            # The SDK would otherwise send its own (unbounded) timeout with every request
+            return {"http_client": self.client, "http_async_client": self.async_client, "timeout": self.client.timeout}
+        return {}
+
+    def attach(self, provider: str, llm):
+        """
+        Point an already built chat model at the shared pool where it can't be passed in.
+
+        langchain_anthropic (pinned to 0.3.x) takes no HTTP client and
+        builds its SDK clients lazily, in the ``_client`` and
+        ``_async_client`` cached properties. The SDK clients are built here
+        from the model's public settings with the shared httpx clients, and
+        stored where the cached properties keep their values. If a release
+        changes that layout, the model is left unchanged and keeps its own
+        pool. Models this doesn't apply to are returned unchanged.
+        """
+        if provider != "anthropic":
+            return llm
+        slots = [getattr(type(llm), name, None) for name in ("_client", "_async_client")]
+        if not all(isinstance(slot, functools.cached_property) for slot in slots) or not hasattr(llm, "__dict__"):
+            print(f"Anthropic client keeps its own connection pool: unsupported {type(llm).__name__} layout")
+            return llm
+        try:
+            import anthropic
+            params = {
+                "api_key": llm.anthropic_api_key.get_secret_value(),
+                "base_url": llm.anthropic_api_url,
+                "max_retries": llm.max_retries,
+                "default_headers": llm.default_headers or None,
+                # Unset (None or <= 0) means the pool's timeouts rather than none at all
+                "timeout": llm.default_request_timeout if (llm.default_request_timeout or 0) > 0 else self.client.timeout
+            }
+            llm.__dict__["_client"] = anthropic.Client(http_client=self.client, **params)
+            llm.__dict__["_async_client"] = anthropic.AsyncClient(http_client=self.async_client, **params)
+        except Exception as e:
+            print(f"Anthropic client keeps its own connection pool: {e}")
+        return llm
+
+    def endpoint(self, provider: str, llm) -> Optional[str]:
+        """
+        Return the base URL a chat model sends its requests to through this
+        transport, or None if its provider doesn't use the shared pool.
+        """
+        if provider not in ("openai", "anthropic"):
+            return None
+        # The SDK client has the base URL after environment overrides are applied
+        client = getattr(llm, "root_client", None) or llm.__dict__.get("_client")
+        if client is not None and getattr(client, "base_url", None):
+            return str(client.base_url)
+        return "https://api.openai.com/v1" if provider == "openai" else "https://api.anthropic.com"
+
+    def prewarm(self, url: str):
+        """
+        Open a pooled connection to a provider ahead of its first request.
+
+        The request is an unauthenticated HEAD, so any response (even an
+        error status) means DNS, TCP and TLS are done and the connection
+        stays in the pool for the next request to reuse.
+        """
+        self.client.head(url).close()
+
+    async def aprewarm(self, url: str):
+        """Async version of prewarm, for the async client's pool; call it on the app's event loop."""
+        response = await self.async_client.head(url)
+        await response.aclose()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the request, connection and TLS handshake counts, plus reused connections."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["reused"] = max(0, stats["requests"] - stats["connections"])
+        return stats
+
+    def close(self):
+        """Close the sync client; the async one is closed with the event loop's shutdown."""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+# Application-wide transport, created on first use from the environment
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport() -> Optional[HttpTransport]:
+    """Return the application-wide HTTP transport, or None when SHARED_HTTP_POOL is off."""
+    global _transport
+    if not _env_flag("SHARED_HTTP_POOL", "true"):
+        return None
+    with _transport_lock:
+        if _transport is None:
+            _transport = HttpTransport(
+                max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+                max_keepalive=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60")),
+                connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "10")),
+                read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "120")),
+                pool_timeout=float(os.getenv("HTTP_POOL_TIMEOUT", "30")),
+                http2=_env_flag("HTTP2", "false")
+            )
+        return _transport
@@ -0,0 +1,298 @@
+"""
+Token and Cost Accounting.
+
+This module records every answered turn's input/output tokens, latency and
+estimated cost, rolled up per model, per session and per day, both overall
+and per tenant (the API keys a session uses), so a session can be shown
+only its own usage. The rollups are SQLite rows updated in place on every
+turn, so reports never rescan the chat histories. Latencies are also kept
+as a per-model histogram, which is enough to tell which models meet a
+latency target.
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# List prices in USD per million (input, output) tokens; override with MODEL_PRICES
+DEFAULT_PRICES = {
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-pro": (0.50, 1.50),
+    "gemini-pro-vision": (0.50, 1.50),
+    "claude-3-opus-20240229": (15.00, 75.00),
+    "claude-3-sonnet-20240229": (3.00, 15.00),
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50)
+}
+
+# Latency histogram buckets grow by 20%, starting at 10 ms
+LATENCY_BASE = 0.01
+LATENCY_GROWTH = 1.2
+
+
+def parse_prices(spec: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse a price specification such as ``"gpt-4o=2.5/10,claude-3-haiku-20240307=0.25/1.25"``.
+
+    Args:
+        spec: Comma separated ``model=input/output`` prices in USD per million tokens
+
+    Returns:
+        dict: Mapping of model name (without provider) to (input, output) prices
+    """
+    prices = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        model, value = item.split("=", 1)
+        input_price, _, output_price = value.partition("/")
+        try:
+            prices[model.strip().split(":")[-1]] = (float(input_price), float(output_price or input_price))
+        except ValueError:
+            print(f"Ignoring invalid model price: {item}")
+    return prices
+
+
+def usage_tenant(api_keys: Optional[Dict[str, str]] = None) -> str:
+    """
+    Identify whose usage a turn is: a fingerprint of the session's own API
+    keys, the same for every session using the process defaults.
+    """
+    text = "\n".join(f"{name}={key}" for name, key in sorted((api_keys or {}).items()) if key)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _latency_bucket(seconds: float) -> int:
+    if seconds <= LATENCY_BASE:
+        return 0
+    return int(math.ceil(math.log(seconds / LATENCY_BASE, LATENCY_GROWTH)))
+
+
+def _bucket_seconds(bucket: int) -> float:
+    # Upper bound of a latency bucket
+    return LATENCY_BASE * LATENCY_GROWTH ** bucket
+
+
+class UsageTracker:
+    """
+    Incremental usage rollups in SQLite.
+
+    Each turn updates one row per rollup (the model overall, the model in the
+    session, the model on the day, and the model overall and on the day for
+    the tenant) and one latency bucket.
+    """
+
+    def __init__(self, db_path: str, prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        """
+        Args:
+            db_path: SQLite file holding the rollups
+            prices: USD per million (input, output) tokens per model, merged over DEFAULT_PRICES
+        """
+        self.db_path = db_path
+        self.prices = dict(DEFAULT_PRICES)
+        self.prices.update(prices or {})
+        self._lock = threading.Lock()
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage_rollup ("
+                "scope TEXT NOT NULL, key TEXT NOT NULL, model TEXT NOT NULL, "
+                "turns INTEGER NOT NULL, input_tokens INTEGER NOT NULL, output_tokens INTEGER NOT NULL, "
+                "cost REAL NOT NULL, latency_sum REAL NOT NULL, "
+                "PRIMARY KEY (scope, key, model))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage_latency ("
+                "model TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL, "
+                "PRIMARY KEY (model, bucket))"
+            )
+
+    def cost(self, model_name: str, input_tokens: int, output_tokens: int) -> float:
+        """
+        Estimate the cost of a request in USD; 0 for models without a known price.
+        """
+        input_price, output_price = self.prices.get(model_name.split(":", 1)[-1], (0.0, 0.0))
+        return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def record(
+        self,
+        model_name: str,
+        session: str,
+        input_tokens: int,
+        output_tokens: int,
+        latency: float,
+        day: Optional[str] = None,
+        tenant: str = ""
+    ):
+        """
+        Add one answered turn to the rollups.
+
+        Args:
+            model_name: Model that answered
+            session: Conversation thread ID ("" when there is none)
+            input_tokens: Prompt tokens
+            output_tokens: Completion tokens
+            latency: Seconds from the request to the full answer
+            day: ISO date to book the turn on; today by default
+            tenant: Whose usage it is (see usage_tenant())
+        """
+        cost = self.cost(model_name, input_tokens, output_tokens)
+        day = day or date.today().isoformat()
+        rows = [
+            ("model", "", model_name, input_tokens, output_tokens, cost, latency),
+            ("session", session or "", model_name, input_tokens, output_tokens, cost, latency),
+            ("day", day, model_name, input_tokens, output_tokens, cost, latency),
+            ("tenant", tenant, model_name, input_tokens, output_tokens, cost, latency),
+            # Keyed tenant first, so one tenant's days are a key range
+            ("tenant_day", f"{tenant}|{day}", model_name, input_tokens, output_tokens, cost, latency)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO usage_rollup (scope, key, model, turns, input_tokens, output_tokens, cost, latency_sum) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?, ?) "
+                "ON CONFLICT (scope, key, model) DO UPDATE SET "
+                "turns = turns + 1, input_tokens = input_tokens + excluded.input_tokens, "
+                "output_tokens = output_tokens + excluded.output_tokens, "
+                "cost = cost + excluded.cost, latency_sum = latency_sum + excluded.latency_sum",
+                rows
+            )
+            self._conn.execute(
+                "INSERT INTO usage_latency (model, bucket, count) VALUES (?, ?, 1) "
+                "ON CONFLICT (model, bucket) DO UPDATE SET count = count + 1",
+                (model_name, _latency_bucket(latency))
+            )
+
+    def _rollup(self, scope: str, key: Optional[str] = None, prefix: str = "") -> List[Dict]:
+        query = (
+            "SELECT key, model, turns, input_tokens, output_tokens, cost, latency_sum "
+            "FROM usage_rollup WHERE scope = ?"
+        )
+        params = [scope]
+        if key is not None:
+            query += " AND key = ?"
+            params.append(key)
+        if prefix:
+            query += " AND key LIKE ?"
+            params.append(prefix + "%")
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY key DESC, cost DESC", params).fetchall()
+        return [
+            {
+                "key": row[0][len(prefix):],
+                "model": row[1],
+                "turns": row[2],
+                "input_tokens": row[3],
+                "output_tokens": row[4],
+                "cost": row[5],
+                "avg_latency": row[6] / row[2] if row[2] else 0.0
+            }
+            for row in rows
+        ]
+
+    def by_model(self, tenant: Optional[str] = None) -> List[Dict]:
+        """
+        Return all-time totals per model, each with its p50/p95 latency.
+
+        Args:
+            tenant: Only this tenant's usage (see usage_tenant()); everyone's if None.
+                Latencies are the model's overall ones either way.
+        """
+        rows = self._rollup("model") if tenant is None else self._rollup("tenant", tenant)
+        for row in rows:
+            row["p50_latency"] = self.latency_percentile(row["model"], 50)
+            row["p95_latency"] = self.latency_percentile(row["model"], 95)
+        return rows
+
+    def by_session(self, session: str) -> List[Dict]:
+        """Return the totals per model for one conversation thread."""
+        return self._rollup("session", session)
+
+    def by_day(self, days: int = 7, tenant: Optional[str] = None) -> List[Dict]:
+        """Return the totals per model for the most recent days with usage, optionally for one tenant."""
+        scope, prefix = ("day", "") if tenant is None else ("tenant_day", f"{tenant}|")
+        with self._lock:
+            recent = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT key FROM usage_rollup WHERE scope = ? AND key LIKE ? ORDER BY key DESC LIMIT ?",
+                (scope, prefix + "%", days)
+            )]
+        if not recent:
+            return []
+        return [row for row in self._rollup(scope, prefix=prefix) if row["key"] >= recent[-1][len(prefix):]]
+
+    def delete_sessions(self, sessions: Iterable[str]):
+        """Drop the per-session rollups of conversation threads that are gone (e.g. deleted chats)."""
+        sessions = [(session,) for session in sessions]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM usage_rollup WHERE scope = 'session' AND key = ?", sessions)
+
+    def latency_percentile(self, model_name: str, q: float) -> Optional[float]:
+        """
+        Return the approximate q-th percentile (0-100) of a model's turn latency.
+
+        The result is the upper bound of the histogram bucket (within 20%).
+        """
+        with self._lock:
+            buckets = self._conn.execute(
+                "SELECT bucket, count FROM usage_latency WHERE model = ? ORDER BY bucket", (model_name,)
+            ).fetchall()
+        total = sum(count for _, count in buckets)
+        if not total:
+            return None
+        threshold, seen = total * q / 100, 0
+        for bucket, count in buckets:
+            seen += count
+            if seen >= threshold:
+                return _bucket_seconds(bucket)
+        return _bucket_seconds(buckets[-1][0])
+
+    def cheapest_within(self, latency_slo: float, percentile: float = 95, tenant: Optional[str] = None) -> Optional[Dict]:
+        """
+        Return the model with the lowest average cost per turn whose latency
+        percentile meets the target, or None if no model does. With a tenant,
+        costs per turn are that tenant's.
+        """
+        best = None
+        for row in self.by_model(tenant):
+            latency = self.latency_percentile(row["model"], percentile)
+            if latency is None or latency > latency_slo or not row["turns"]:
+                continue
+            row["cost_per_turn"] = row["cost"] / row["turns"]
+            if best is None or row["cost_per_turn"] < best["cost_per_turn"]:
+                best = row
+        return best
+
+
+# Application-wide usage tracker, opened on first use
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def _usage_db() -> str:
+    return os.getenv("USAGE_DB") or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chat_histories", ".db", "usage.sqlite"
+    )
+
+def get_usage_tracker() -> UsageTracker:
+    """Return the application-wide usage tracker (USAGE_DB, MODEL_PRICES)."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = UsageTracker(_usage_db(), parse_prices(os.getenv("MODEL_PRICES")))
+        return _tracker
+
+def delete_sessions(sessions: Iterable[str]):
+    """Drop the per-session rollups of deleted chats; nothing to do if no usage was ever recorded."""
+    if _tracker is None and not os.path.exists(_usage_db()):
+        return
+    get_usage_tracker().delete_sessions(sessions)
@@ -0,0 +1,121 @@
+"""
+Model Warm-up.
+
+This module prepares chat model clients before they are needed: building
+the client (which imports the provider SDK on first use) and opening a
+connection to the provider. Warm-ups run on a small background thread pool,
+so neither the UI's event loop nor a chat request waits for them, and a
+model that is already warming is not warmed twice.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+# Readiness of a model client
+COLD = "cold"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+
+# Warm-up results remembered, most recent last
+MAX_TRACKED = 256
+
+
+def _keys_fingerprint(api_keys: Optional[Dict[str, str]]) -> str:
+    # Sessions with different keys get different clients, so they warm separately
+    text = "\n".join(f"{name}={key}" for name, key in sorted((api_keys or {}).items()) if key)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class ModelWarmer:
+    """
+    Runs model warm-ups in the background and tracks their readiness.
+    """
+
+    def __init__(
+        self,
+        warm_fn: Callable[[str, Optional[Dict[str, str]]], None],
+        max_workers: int = 2,
+        is_warm: Optional[Callable[[str, Optional[Dict[str, str]]], bool]] = None
+    ):
+        """
+        Args:
+            warm_fn: Called with (model_name, api_keys) to warm one model; raises on failure
+            max_workers: Warm-ups running at once
+            is_warm: Called with (model_name, api_keys) to check that a ready model is still
+                warm (e.g. its client wasn't evicted); a model that isn't is cold again
+        """
+        self.warm_fn = warm_fn
+        self.is_warm = is_warm
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="model-warmup")
+        self._lock = threading.Lock()
+        # (model_name, keys fingerprint) -> (state, future, error text)
+        self._entries = OrderedDict()
+
+    def warm(self, model_name: str, api_keys: Optional[Dict[str, str]] = None) -> Future:
+        """
+        Start warming a model unless it is already warming or ready.
+
+        Args:
+            model_name: Full model name in ``provider:model`` form
+            api_keys: The session's API keys, if it has its own
+
+        Returns:
+            Future: Resolves when the warm-up is done; raises what the warm-up raised
+        """
+        key = (model_name, _keys_fingerprint(api_keys))
+        # Checked outside the lock, since it may take the registry's lock
+        still_warm = self.is_warm is None or self.is_warm(model_name, api_keys)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] == WARMING or entry[0] == READY and still_warm):
+                self._entries.move_to_end(key)
+                return entry[1]
+            future = self._executor.submit(self.warm_fn, model_name, api_keys)
+            self._entries[key] = (WARMING, future, "")
+            self._entries.move_to_end(key)
+            while len(self._entries) > MAX_TRACKED:
+                self._entries.popitem(last=False)
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    def _finish(self, key, future: Future):
+        error = future.exception()
+        with self._lock:
+            entry = self._entries.get(key)
+            # A newer warm-up may have replaced this one
+            if entry is None or entry[1] is not future:
+                return
+            if error is None:
+                self._entries[key] = (READY, future, "")
+            else:
+                print(f"Error warming up {key[0]}: {error}")
+                self._entries[key] = (FAILED, future, str(error))
+
+    def preload(self, model_names: Iterable[str]):
+        """Start warming each model with the process default API keys."""
+        for model_name in model_names:
+            self.warm(model_name)
+
+    def status(self, model_name: str, api_keys: Optional[Dict[str, str]] = None):
+        """
+        Return a model's readiness.
+
+        Returns:
+            tuple: (state, error text); the state is one of COLD, WARMING, READY, FAILED
+        """
+        with self._lock:
+            entry = self._entries.get((model_name, _keys_fingerprint(api_keys)))
+        if entry is None:
+            return COLD, ""
+        if entry[0] == READY and self.is_warm is not None and not self.is_warm(model_name, api_keys):
+            # Warmed once, but its client has been evicted since
+            return COLD, ""
+        return entry[0], entry[2]
+
+    def shutdown(self):
+        """Stop accepting warm-ups; running ones finish in the background."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,219 @@
+"""
+Chat history maintenance.
+
+Offline commands for the saved chat histories:
+
+    stats       Count the history files and their size per storage format
+    migrate     Rewrite histories in the compact format (HISTORY_FORMAT by default);
+                older pretty-printed JSON files are converted in place
+    train-dict  Train a zstd dictionary on the saved histories for new zstd files
+    export      Stream histories to NDJSON or Parquet, filtered by date and model
+    import      Bulk-import an NDJSON or Parquet export, handling ID collisions
+    sweep       Apply the retention limits (RETENTION_*) once, archiving evicted chats
+
+Usage:
+    python history_cli.py stats
+    python history_cli.py migrate --format zstd --train-dict
+    python history_cli.py migrate --dry-run
+    python history_cli.py export chats.ndjson --since 2024-01-01 --model openai:gpt-4o
+    python history_cli.py export chats.ndjson --resume
+    python history_cli.py import chats.ndjson --on-conflict rename
+    python history_cli.py sweep --max-chats 5000 --dry-run
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from ui import chat_history
+from ui.history_export import (
+    CONFLICT_POLICIES, FORMATS, detect_format, export_histories, import_histories, iter_ndjson, iter_parquet
+)
+from ui.history_retention import get_history_sweeper
+from ui.history_store import (
+    EXTENSIONS, current_dictionary_id, iter_history_files, read_history, resolve_format,
+    train_dictionary, write_history
+)
+
+def format_size(size):
+    size = float(size)
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+def stats(history_dir):
+    totals = {}
+    for _, fmt, path in iter_history_files(history_dir):
+        count, size = totals.get(fmt, (0, 0))
+        totals[fmt] = (count + 1, size + os.path.getsize(path))
+    for fmt in EXTENSIONS:
+        count, size = totals.get(fmt, (0, 0))
+        print(f"{fmt:6} {count:8} files {format_size(size):>12}")
+    dict_id = current_dictionary_id(history_dir)
+    if dict_id is not None:
+        print(f"Current zstd dictionary: {dict_id}")
+    return totals
+
+# Rewrite every history not yet stored in the target format. With force,
+# histories already in the format are rewritten too (e.g. to use a newly
+# trained dictionary).
+def migrate(history_dir, fmt, dry_run=False, force=False):
+    fmt = resolve_format(fmt)
+    started = time.perf_counter()
+    converted, failed, bytes_before, bytes_after = 0, 0, 0, 0
+    for history_id, current, path in sorted(iter_history_files(history_dir)):
+        if current == fmt and not force:
+            continue
+        try:
+            size = os.path.getsize(path)
+            history = read_history(path)
+            if not dry_run:
+                # Writing the new file also removes the old one
+                path = write_history(history_dir, history, fmt)
+                bytes_after += os.path.getsize(path)
+            bytes_before += size
+            converted += 1
+        except Exception as e:
+            failed += 1
+            print(f"Error migrating {history_id}: {e}")
+    if converted and not dry_run:
+        # The file names changed; rebuild the index from the new files
+        chat_history.get_history_index().rebuild()
+    elapsed = time.perf_counter() - started
+    if dry_run:
+        print(f"Would migrate {converted} histories ({format_size(bytes_before)}) to {fmt}")
+    else:
+        saved = f" ({bytes_after / bytes_before:.1%} of the original size)" if bytes_before else ""
+        print(
+            f"Migrated {converted} histories to {fmt} in {elapsed:.1f}s: "
+            f"{format_size(bytes_before)} -> {format_size(bytes_after)}{saved}"
+        )
+    if failed:
+        print(f"{failed} histories could not be migrated")
+    return converted, failed
+
+def export(args):
+    fmt = args.format or detect_format(args.output)
+    started = time.perf_counter()
+    result = export_histories(
+        args.output, fmt, after=args.after, since=args.since, until=args.until,
+        models=args.model, resume=args.resume
+    )
+    print(f"Exported {result['count']} histories to {args.output} in {time.perf_counter() - started:.1f}s")
+    if result["cursor"]:
+        # Passing this to --after continues with the chats saved since
+        print(f"Cursor: {result['cursor']}")
+    return result
+
+def import_file(args):
+    fmt = args.format or detect_format(args.input)
+    histories = iter_parquet(args.input) if fmt == "parquet" else iter_ndjson(args.input)
+    counts = import_histories(histories, on_conflict=args.on_conflict, dry_run=args.dry_run)
+    print(("Would import: " if args.dry_run else "Imported: ") + ", ".join(f"{count} {name}" for name, count in counts.items()))
+    return counts
+
+def sweep(args):
+    sweeper = get_history_sweeper()
+    # Command line limits override the RETENTION_* settings
+    if args.max_age_days is not None:
+        sweeper.max_age_days = args.max_age_days
+    if args.max_mb is not None:
+        sweeper.max_bytes = int(args.max_mb * 1024 * 1024)
+    if args.max_chats is not None:
+        sweeper.max_chats = args.max_chats
+    if args.no_archive:
+        sweeper.archive = False
+    if not sweeper.enabled:
+        print("No retention limits set (RETENTION_MAX_AGE_DAYS, RETENTION_MAX_MB, RETENTION_MAX_CHATS)")
+        return None
+    result = sweeper.sweep(dry_run=args.dry_run)
+    reasons = ", ".join(f"{count} by {reason}" for reason, count in sorted(result["by_reason"].items()))
+    print(
+        f"{'Would evict' if args.dry_run else 'Evicted'} {result['evicted']} histories "
+        f"({format_size(result['bytes_reclaimed'])}){': ' + reasons if reasons else ''}"
+    )
+    if result["archive"]:
+        print(f"Archived to {result['archive']}")
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the saved chat histories.")
+    parser.add_argument("--dir", default=chat_history.HISTORY_DIR, help="Chat history directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("stats", help="Count history files and bytes per format")
+
+    migrate_parser = commands.add_parser("migrate", help="Rewrite histories in the compact format")
+    migrate_parser.add_argument("--format", choices=list(EXTENSIONS), help="Target format (default: HISTORY_FORMAT)")
+    migrate_parser.add_argument("--train-dict", action="store_true", help="Train a zstd dictionary first (zstd only)")
+    migrate_parser.add_argument("--force", action="store_true", help="Also rewrite histories already in the target format")
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Only report what would be migrated")
+
+    train_parser = commands.add_parser("train-dict", help="Train a zstd dictionary on the saved histories")
+    train_parser.add_argument("--size", type=int, default=112640, help="Dictionary size in bytes")
+
+    export_parser = commands.add_parser("export", help="Export histories to NDJSON or Parquet")
+    export_parser.add_argument("output", help="Output file (.ndjson or .parquet)")
+    export_parser.add_argument("--format", choices=FORMATS, help="Output format (default: from the file extension)")
+    export_parser.add_argument("--since", help="Only chats saved at or after this ISO date/time")
+    export_parser.add_argument("--until", help="Only chats saved before this ISO date/time")
+    export_parser.add_argument("--model", action="append", help="Only chats of this model (repeatable)")
+    export_parser.add_argument("--after", help="Only chats after this cursor (history ID)")
+    export_parser.add_argument("--resume", action="store_true", help="Continue an interrupted NDJSON export")
+
+    import_parser = commands.add_parser("import", help="Import an NDJSON or Parquet export")
+    import_parser.add_argument("input", help="Export file to import")
+    import_parser.add_argument("--format", choices=FORMATS, help="Input format (default: from the file extension)")
+    import_parser.add_argument(
+        "--on-conflict", choices=CONFLICT_POLICIES, default="skip",
+        help="What to do with a chat whose ID exists with different content"
+    )
+    import_parser.add_argument("--dry-run", action="store_true", help="Only report what would be imported")
+
+    sweep_parser = commands.add_parser("sweep", help="Evict histories beyond the retention limits")
+    sweep_parser.add_argument("--max-age-days", type=float, help="Evict chats inactive for longer (default: RETENTION_MAX_AGE_DAYS)")
+    sweep_parser.add_argument("--max-mb", type=float, help="Most MiB of history files and checkpoints to keep (default: RETENTION_MAX_MB)")
+    sweep_parser.add_argument("--max-chats", type=int, help="Most chats to keep (default: RETENTION_MAX_CHATS)")
+    sweep_parser.add_argument("--no-archive", action="store_true", help="Delete evicted chats without archiving them")
+    sweep_parser.add_argument("--dry-run", action="store_true", help="Only report what would be evicted")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "import":
+        os.makedirs(args.dir, exist_ok=True)
+    if not os.path.isdir(args.dir):
+        print(f"No chat history directory at {args.dir}")
+        sys.exit(1)
+    # The CLI works on --dir, which may not be the app's default
+    chat_history.HISTORY_DIR = args.dir
+
+    if args.command == "stats":
+        stats(args.dir)
+    elif args.command == "train-dict":
+        dict_id = train_dictionary(args.dir, size=args.size)
+        print(f"Trained zstd dictionary {dict_id}" if dict_id else "Too few histories to train a dictionary")
+    elif args.command == "migrate":
+        fmt = resolve_format(args.format)
+        if args.train_dict and fmt == "zstd" and not args.dry_run:
+            dict_id = train_dictionary(args.dir)
+            print(f"Trained zstd dictionary {dict_id}" if dict_id else "Too few histories to train a dictionary")
+        _, failed = migrate(args.dir, fmt, dry_run=args.dry_run, force=args.force)
+        sys.exit(1 if failed else 0)
+    elif args.command == "export":
+        try:
+            export(args)
+        except (ValueError, RuntimeError) as e:
+            print(e)
+            sys.exit(1)
+    elif args.command == "import":
+        try:
+            import_file(args)
+        except (ValueError, RuntimeError, OSError) as e:
+            print(e)
+            sys.exit(1)
+    elif args.command == "sweep":
+        sweep(args)
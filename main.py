@@ -1,21 +1,40 @@
 import os
-import gradio as gr
+import time
+import asyncio
+import uuid
+import threading
 from typing import Annotated, Dict, List, Optional
 from typing_extensions import TypedDict
 
 from langgraph.graph import StateGraph, START
 from langgraph.graph.message import add_messages
-from langchain.chat_models import init_chat_model
-from langchain.schema import HumanMessage, AIMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.config import get_stream_writer
+from langchain_core.messages import HumanMessage, AIMessage, message_chunk_to_message
 from dotenv import load_dotenv
 
-# Import the UI components
-from ui.interface import create_interface
-
-# Load environment variables from .env file
+# Load environment variables from .env file before importing modules that read settings
 load_dotenv()
 
-# Define API keys - initialize with env vars if available
+# Import the runtime components. The UI (gradio) and the provider SDKs are
+# imported on first use, so headless entry points such as batch.py start
+# without them
+from ui.chat_history import CHECKPOINT_DB
+from ui.chat_log import CHAT_AUTOSAVE, get_chat_log
+from core.model_registry import ModelRegistry, credential_fingerprint
+from core.concurrency import ProviderLimiter, parse_limits
+from core.checkpoints import ThreadTracker, get_checkpointer
+from core.response_cache import ResponseCache, cache_key
+from core.context_window import TokenCounter, content_text, plan_context, summary_message, summary_request
+from core.router import Attempt, ModelRouter, parse_fallbacks
+from core.rate_limit import RateLimiter, parse_rate_limits
+from core.metrics import get_metrics
+from core.usage import get_usage_tracker, usage_tenant
+from core.transport import get_transport
+from core.warmup import ModelWarmer
+
+# Process default API keys, used by sessions that haven't entered their own;
+# initialized with env vars if available
 API_KEYS = {
     "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", ""),
     "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY", ""),
@@ -29,116 +48,821 @@ AVAILABLE_MODELS = {
     "openai": ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"]
 }
 
+# Stream tokens to the UI as they are generated instead of waiting for the full answer
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() in ("1", "true", "yes")
+
+# Serve chat requests from the asyncio event loop instead of worker threads
+ASYNC_CHAT = os.getenv("ASYNC_CHAT", "true").lower() in ("1", "true", "yes")
+
+# Gradio queue settings: concurrent chat events, and the default for all other events
+CHAT_CONCURRENCY_LIMIT = int(os.getenv("CHAT_CONCURRENCY_LIMIT", "200"))
+UI_CONCURRENCY_LIMIT = int(os.getenv("UI_CONCURRENCY_LIMIT", "8"))
+
+# Environment variable holding the API key for each provider
+PROVIDER_API_KEYS = {
+    "google_genai": "GOOGLE_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+    "openai": "OPENAI_API_KEY"
+}
+
+# Also write keys saved in the UI to .env as the process defaults. Off by
+# default: keys entered in one browser session only apply to that session.
+PERSIST_API_KEYS = os.getenv("PERSIST_API_KEYS", "false").lower() in ("1", "true", "yes")
+
+# Process-wide cache of initialized chat models, bounded by MODEL_CACHE_SIZE
+MODEL_REGISTRY = ModelRegistry(max_models=int(os.getenv("MODEL_CACHE_SIZE", "8")))
+
+# Connection pool shared by every provider client (SHARED_HTTP_POOL, HTTP_* settings)
+HTTP_TRANSPORT = get_transport()
+
+# Maximum in-flight requests per provider, e.g. PROVIDER_CONCURRENCY="anthropic=8,openai=32"
+PROVIDER_LIMITS = ProviderLimiter(
+    limits=parse_limits(os.getenv("PROVIDER_CONCURRENCY")),
+    default_limit=int(os.getenv("DEFAULT_PROVIDER_CONCURRENCY", "16"))
+)
+
+# Requests and tokens per minute per provider and API key, e.g. RATE_LIMITS="openai=500/30000,anthropic=50/40000";
+# requests that would wait longer than RATE_LIMIT_MAX_WAIT seconds are rejected
+RATE_LIMITER = RateLimiter(
+    limits=parse_rate_limits(os.getenv("RATE_LIMITS")),
+    max_wait=float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+)
+
+# Completion tokens reserved per request until the real usage is known
+RATE_LIMIT_COMPLETION_TOKENS = int(os.getenv("RATE_LIMIT_COMPLETION_TOKENS", "1024"))
+
+# Threads known to have stored state in this process
+THREADS = ThreadTracker()
+
+# Prompt token budget per turn; 0 (the default) sends the whole conversation
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+
+# Fold turns that leave the window into a running summary instead of dropping them
+CONTEXT_SUMMARIZE = os.getenv("CONTEXT_SUMMARIZE", "false").lower() in ("1", "true", "yes")
+
+# Model used to write the running summary; defaults to the chat model
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "")
+
+# Shared token counter, caching per-message counts across turns
+TOKEN_COUNTER = TokenCounter()
+
+# Opt-in exact-match cache of model answers (memory LRU + SQLite), shared by every entry point
+RESPONSE_CACHE = None
+if os.getenv("RESPONSE_CACHE", "false").lower() in ("1", "true", "yes"):
+    RESPONSE_CACHE = ResponseCache(
+        db_path=os.getenv(
+            "RESPONSE_CACHE_DB",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_histories", ".db", "response_cache.sqlite")
+        ),
+        ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        memory_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "512")),
+        max_disk_bytes=int(float(os.getenv("RESPONSE_CACHE_DISK_MB", "256")) * 1024 * 1024)
+    )
+
+# Opt-in cache answering paraphrases of earlier standalone questions, namespaced per model
+SEMANTIC_CACHE = None
+if os.getenv("SEMANTIC_CACHE", "false").lower() in ("1", "true", "yes"):
+    # Imported here so numpy is only loaded when the cache is enabled
+    from core.semantic_cache import SemanticCache
+    SEMANTIC_CACHE = SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000")),
+        max_namespaces=int(os.getenv("SEMANTIC_CACHE_MAX_NAMESPACES", "16"))
+    )
+
+# Per-stage latencies and counters, served on /metrics when METRICS_PORT is set
+METRICS = get_metrics()
+
+# Per-turn tokens, latency and cost rolled up per model, session and day
+USAGE_TRACKING = os.getenv("USAGE_TRACKING", "true").lower() in ("1", "true", "yes")
+
+# Routes each chat request across the chosen model and its equivalents,
+# e.g. MODEL_FALLBACKS="openai:gpt-4o=anthropic:claude-3-opus-20240229,google_genai:gemini-1.5-pro"
+MODEL_ROUTER = ModelRouter(
+    fallbacks=parse_fallbacks(os.getenv("MODEL_FALLBACKS")),
+    hedge=os.getenv("ROUTER_HEDGE", "false").lower() in ("1", "true", "yes"),
+    hedge_delay=float(os.getenv("ROUTER_HEDGE_DELAY", "5")),
+    min_hedge_delay=float(os.getenv("ROUTER_MIN_HEDGE_DELAY", "0.5")),
+    timeout=float(os.getenv("ROUTER_TIMEOUT", "60")),
+    max_error_rate=float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.5"))
+)
+
 # StateGraph definition for the chatbot
 class State(TypedDict):
     messages: Annotated[list, add_messages]
     model_name: str
+    # Running summary of the messages before summarized_upto
+    summary: str
+    summarized_upto: int
+    # Index of the first message sent to the model this turn
+    context_start: int
+    # Prompt tokens saved this turn by trimming and summarization
+    tokens_saved: int
+
+# langchain's model factory, imported on the first model request; provider
+# packages are in turn only imported for the providers actually used
+def init_chat_model(model_name, **kwargs):
+    from langchain.chat_models import init_chat_model as langchain_init_chat_model
+    return langchain_init_chat_model(model_name, **kwargs)
+
+# The API key for a provider: the session's own key if it entered one,
+# otherwise the process default
+def provider_key(provider, api_keys=None):
+    key_name = PROVIDER_API_KEYS.get(provider)
+    if not key_name:
+        return ""
+    return (api_keys or {}).get(key_name) or API_KEYS.get(key_name, "")
+
+# The session's API keys, passed to the graph in the run config
+def session_api_keys(config):
+    return (config or {}).get("configurable", {}).get("api_keys")
+
+# Initialize the LLM with the selected model, reusing a cached client when possible.
+# The key is handed to the client itself rather than through os.environ, so
+# sessions with different keys can build clients at the same time; clients
+# are cached per key, so a session never gets one built with another's key.
+def get_llm(model_name: str, api_keys=None):
+    provider = model_name.split(":", 1)[0]
+    api_key = provider_key(provider, api_keys)
+
+    def create_llm():
+        kwargs = {"api_key": api_key} if api_key else {}
+        if provider == "openai":
+            # Answers are streamed, and OpenAI only reports streamed usage on request
+            kwargs["stream_usage"] = True
+        if HTTP_TRANSPORT is None:
+            return init_chat_model(model_name, **kwargs)
+        kwargs.update(HTTP_TRANSPORT.model_kwargs(provider))
+        return HTTP_TRANSPORT.attach(provider, init_chat_model(model_name, **kwargs))
+
+    return MODEL_REGISTRY.get(model_name, api_key, create_llm)
+
+# Async version of get_llm. Building a client (provider SDK import, HTTP
+# client setup) blocks, so a client that isn't cached yet is built in a
+# worker thread
+async def aget_llm(model_name: str, api_keys=None):
+    llm = MODEL_REGISTRY.cached(model_name, provider_key(model_name.split(":", 1)[0], api_keys))
+    if llm is not None:
+        return llm
+    return await asyncio.to_thread(get_llm, model_name, api_keys)
+
+# Build (or reuse) a model's client and open a pooled connection to its
+# provider, so the first message pays for neither
+def warm_up_model(model_name, api_keys=None):
+    llm = get_llm(model_name, api_keys)
+    # Load the model's tokenizer too (tiktoken may download it), so the
+    # first turn doesn't wait for it
+    TOKEN_COUNTER.preload(model_name)
+    if HTTP_TRANSPORT is not None:
+        url = HTTP_TRANSPORT.endpoint(model_name.split(":", 1)[0], llm)
+        if url:
+            HTTP_TRANSPORT.prewarm(url)
 
-# Initialize the LLM with the selected model
-def get_llm(model_name: str):
-    provider, model = model_name.split(":", 1)
+# Background warm-ups: the model a session selects, and WARM_MODELS at startup
+# A ready model whose client the registry has since evicted is cold again
+def model_is_warm(model_name, api_keys=None):
+    return MODEL_REGISTRY.contains(model_name, provider_key(model_name.split(":", 1)[0], api_keys))
+
+MODEL_WARMER = ModelWarmer(warm_up_model, max_workers=int(os.getenv("WARMUP_WORKERS", "2")), is_warm=model_is_warm)
+WARM_MODELS = [name.strip() for name in os.getenv("WARM_MODELS", "").split(",") if name.strip()]
+
+# Warm a model for a session and wait until it's ready; raises if the warm-up failed
+def warm_model(model_name, api_keys=None):
+    MODEL_WARMER.warm(model_name, api_keys).result()
+
+# Async version of warm_model; the wait doesn't block the event loop, and the
+# async client's pool (used by the async chat path) gets its own connection
+async def awarm_model(model_name, api_keys=None):
+    await asyncio.wrap_future(MODEL_WARMER.warm(model_name, api_keys))
+    if HTTP_TRANSPORT is not None:
+        url = HTTP_TRANSPORT.endpoint(model_name.split(":", 1)[0], await aget_llm(model_name, api_keys))
+        if url:
+            await HTTP_TRANSPORT.aprewarm(url)
+
+# Messages actually sent to the model: the running summary (if any)
+# followed by the current context window
+def context_messages(state: State):
+    messages = state["messages"][state.get("context_start", 0):]
+    if state.get("summary"):
+        return [summary_message(state["summary"])] + messages
+    return messages
+
+# Choose the context window for a turn. Returns where the window starts and,
+# when turns just left it and must be folded into the running summary, the
+# fold: the summary model, the index summarized up to and the summary request
+def plan_window(state: State):
+    messages = state["messages"]
+    summary = state.get("summary", "")
+    summarized_upto = state.get("summarized_upto", 0)
+    start, fold_upto = plan_context(
+        messages, state["model_name"], TOKEN_COUNTER, CONTEXT_TOKEN_BUDGET,
+        summary=summary, summarized_upto=summarized_upto, summarize=CONTEXT_SUMMARIZE
+    )
+    if fold_upto <= summarized_upto:
+        return start, None
+    # Only the turns that just left the window are summarized
+    return start, (SUMMARY_MODEL or state["model_name"], fold_upto, summary_request(summary, messages[summarized_upto:fold_upto]))
+
+# Record the chosen window, with the summary model's response to the fold
+# (if any), and how many tokens it saved
+def finish_window(state: State, start: int, fold=None, response=None, error=None):
+    model_name = state["model_name"]
+    messages = state["messages"]
+    summary = state.get("summary", "")
+    summarized_upto = state.get("summarized_upto", 0)
+    if fold is not None:
+        if error is None:
+            summary, summarized_upto = content_text(response.content), fold[1]
+        else:
+            # Keep the previous summary and fall back to plain trimming
+            # for this turn; the fold is retried on the next one
+            print(f"Error updating conversation summary: {error}")
+            start, _ = plan_context(messages, model_name, TOKEN_COUNTER, CONTEXT_TOKEN_BUDGET)
+    full_tokens = TOKEN_COUNTER.count_messages(messages, model_name)
+    sent_tokens = TOKEN_COUNTER.count_messages(messages[start:], model_name)
+    if summary:
+        sent_tokens += TOKEN_COUNTER.count_message(summary_message(summary), model_name)
+    return {
+        "context_start": start,
+        "summary": summary,
+        "summarized_upto": summarized_upto,
+        "tokens_saved": max(0, full_tokens - sent_tokens)
+    }
+
+# Trim the conversation to the token budget, folding dropped turns into the summary
+@METRICS.timed("context_window")
+def context_window(state: State, config: RunnableConfig):
+    if not CONTEXT_TOKEN_BUDGET:
+        return {"context_start": 0, "tokens_saved": 0}
+    
+    start, fold = plan_window(state)
+    if fold is None:
+        return finish_window(state, start)
+    summary_model, _, request = fold
+    try:
+        with PROVIDER_LIMITS.limit(summary_model.split(":", 1)[0]):
+            response = get_llm(summary_model, session_api_keys(config)).invoke(request)
+    except Exception as e:
+        return finish_window(state, start, fold, error=e)
+    return finish_window(state, start, fold, response)
+
+# Async version of the context_window node. Token counting is CPU work (and
+# may load a tiktoken encoding), so it runs off the event loop.
+@METRICS.timed("context_window")
+async def acontext_window(state: State, config: RunnableConfig):
+    if not CONTEXT_TOKEN_BUDGET:
+        return {"context_start": 0, "tokens_saved": 0}
     
-    if provider == "google_genai":
-        os.environ["GOOGLE_API_KEY"] = API_KEYS["GOOGLE_API_KEY"]
-    elif provider == "anthropic":
-        os.environ["ANTHROPIC_API_KEY"] = API_KEYS["ANTHROPIC_API_KEY"]
-    elif provider == "openai":
-        os.environ["OPENAI_API_KEY"] = API_KEYS["OPENAI_API_KEY"]
+    start, fold = await asyncio.to_thread(plan_window, state)
+    if fold is None:
+        return await asyncio.to_thread(finish_window, state, start)
+    summary_model, _, request = fold
+    try:
+        async with PROVIDER_LIMITS.alimit(summary_model.split(":", 1)[0]):
+            llm = await aget_llm(summary_model, session_api_keys(config))
+            response = await llm.ainvoke(request)
+    except Exception as e:
+        return await asyncio.to_thread(finish_window, state, start, fold, None, e)
+    return await asyncio.to_thread(finish_window, state, start, fold, response)
+
+# The semantic cache only answers a question asked on its own: with earlier
+# turns in the prompt, the same words can mean something else
+def is_standalone(messages):
+    return len(messages) == 1 and isinstance(messages[0], HumanMessage)
+
+# Cached answers are only served to sessions using the same API key, so one
+# tenant never sees another's answers
+def cache_scope(model_name, api_keys=None):
+    return provider_credential(model_name.split(":", 1)[0], api_keys)
+
+def semantic_namespace(model_name, api_keys=None):
+    return f"{model_name}|{cache_scope(model_name, api_keys)}"
+
+# Look up the response caches for a request; returns the exact-match cache key
+# (None when that cache is disabled) and the cached answer as a message, if any
+def cached_response(model_name, llm, messages, api_keys=None):
+    key, answer = None, None
+    if RESPONSE_CACHE is not None:
+        # The client's identifying params carry the generation settings (temperature etc.)
+        key = cache_key(model_name, messages, getattr(llm, "_identifying_params", {}), cache_scope(model_name, api_keys))
+        answer = RESPONSE_CACHE.get(key)
+        METRICS.cache_lookup("exact", answer is not None)
+    if answer is None and SEMANTIC_CACHE is not None and is_standalone(messages):
+        answer = SEMANTIC_CACHE.lookup(semantic_namespace(model_name, api_keys), content_text(messages[0].content))
+        METRICS.cache_lookup("semantic", answer is not None)
+    return key, AIMessage(content=answer) if answer is not None else None
+
+# Store a fresh answer in the response caches
+def cache_response(key, model_name, messages, response, api_keys=None):
+    answer = content_text(response.content)
+    if not answer:
+        return
+    if key:
+        RESPONSE_CACHE.put(key, answer)
+    if SEMANTIC_CACHE is not None and is_standalone(messages):
+        SEMANTIC_CACHE.put(semantic_namespace(model_name, api_keys), content_text(messages[0].content), answer)
+
+# Models to try for a request: the chosen one first, then the equivalents
+# whose provider has an API key configured for the session
+def route_candidates(model_name, api_keys=None):
+    candidates = []
+    for name in MODEL_ROUTER.candidates(model_name):
+        provider = name.split(":", 1)[0]
+        if name == model_name or provider not in PROVIDER_API_KEYS or provider_key(provider, api_keys):
+            candidates.append(name)
+    return candidates
+
+# Rate limits are tracked per API key, identified by its fingerprint
+def provider_credential(provider, api_keys=None):
+    return credential_fingerprint(provider_key(provider, api_keys))
+
+# Tokens charged to the rate limit before a request: the prompt plus the
+# completion allowance, corrected with the real usage afterwards
+def request_tokens(model_name, messages):
+    return TOKEN_COUNTER.count_messages(messages, model_name) + RATE_LIMIT_COMPLETION_TOKENS
+
+# Give back what a request holds as soon as the router abandons it: the
+# concurrency slot, and the completion allowance of its rate-limit charge
+# (the prompt was probably sent, so that part stays charged)
+def release_on_abandon(attempt, reservation, slot=None):
+    if reservation is not None:
+        attempt.on_abandon(lambda: RATE_LIMITER.settle(reservation, max(0, reservation.tokens - RATE_LIMIT_COMPLETION_TOKENS)))
+    if slot is not None:
+        attempt.on_abandon(slot.release)
+
+def record_usage(model_name, reservation, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage and usage.get("total_tokens"):
+        RATE_LIMITER.settle(reservation, usage["total_tokens"])
+    METRICS.model_request(model_name, True, usage)
+
+# Collect a streamed answer into a single message, reporting every chunk to
+# the attempt (which forwards it to the UI while the attempt is live)
+def collect_stream(chunks, attempt):
+    response = None
+    try:
+        for chunk in chunks:
+            attempt.chunk(content_text(chunk.content))
+            response = chunk if response is None else response + chunk
+    finally:
+        chunks.close()
+    return AIMessage(content="") if response is None else message_chunk_to_message(response)
+
+async def acollect_stream(chunks, attempt):
+    response = None
+    try:
+        async for chunk in chunks:
+            attempt.chunk(content_text(chunk.content))
+            response = chunk if response is None else response + chunk
+    finally:
+        await chunks.aclose()
+    return AIMessage(content="") if response is None else message_chunk_to_message(response)
+
+# One model request, admitted by the provider's rate limit and held under its
+# concurrency limit. Requests are streamed unless nothing needs the chunks:
+# no caller reading the answer as it comes, and no router watching for stalls.
+def call_model(model_name, messages, attempt, api_keys=None, stream=True):
+    provider = model_name.split(":", 1)[0]
+    queued = time.perf_counter()
+    try:
+        with RATE_LIMITER.acquire(provider, provider_credential(provider, api_keys), request_tokens(model_name, messages)) as reservation:
+            with PROVIDER_LIMITS.limit(provider) as slot:
+                # A sync request can't be interrupted, so an abandoned one
+                # releases its slot and charge right away and stops at its next chunk
+                release_on_abandon(attempt, reservation, slot)
+                METRICS.observe("queue_wait", time.perf_counter() - queued, provider=provider)
+                with METRICS.span("generation", model=model_name):
+                    llm = get_llm(model_name, api_keys)
+                    response = collect_stream(llm.stream(messages), attempt) if stream else llm.invoke(messages)
+    except Exception:
+        METRICS.model_request(model_name, False)
+        raise
+    record_usage(model_name, reservation, response)
+    return response
+
+async def acall_model(model_name, messages, attempt, api_keys=None, stream=True):
+    provider = model_name.split(":", 1)[0]
+    queued = time.perf_counter()
+    try:
+        # Token counting is CPU work; keep it off the event loop
+        tokens = await asyncio.to_thread(request_tokens, model_name, messages)
+        llm = await aget_llm(model_name, api_keys)
+        async with RATE_LIMITER.aacquire(provider, provider_credential(provider, api_keys), tokens) as reservation:
+            # Abandoned async requests are cancelled, which releases the slot
+            release_on_abandon(attempt, reservation)
+            async with PROVIDER_LIMITS.alimit(provider):
+                METRICS.observe("queue_wait", time.perf_counter() - queued, provider=provider)
+                with METRICS.span("generation", model=model_name):
+                    if stream:
+                        response = await acollect_stream(llm.astream(messages), attempt)
+                    else:
+                        response = await llm.ainvoke(messages)
+    except Exception:
+        METRICS.model_request(model_name, False)
+        raise
+    record_usage(model_name, reservation, response)
+    return response
 
-    return init_chat_model(model_name)
+# Text shown in place of the answer while a request waits for the rate limit
+def rate_limit_notice(model_name, api_keys=None):
+    provider = model_name.split(":", 1)[0]
+    position, wait = RATE_LIMITER.estimate(provider, provider_credential(provider, api_keys), RATE_LIMIT_COMPLETION_TOKENS)
+    if wait < 1:
+        return ""
+    return f"_Waiting for the {provider} rate limit: {position} request(s) ahead, about {wait:.0f}s..._"
+
+# Book an answered turn in the usage rollups, estimating the token counts
+# when the provider reports no usage
+def record_turn_usage(model_name, config, messages, response, latency):
+    if not USAGE_TRACKING:
+        return
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens") or TOKEN_COUNTER.count_messages(messages, model_name)
+    output_tokens = usage.get("output_tokens") or TOKEN_COUNTER.count_message(response, model_name)
+    session = (config or {}).get("configurable", {}).get("thread_id", "")
+    try:
+        get_usage_tracker().record(
+            model_name, session, input_tokens, output_tokens, latency, tenant=usage_tenant(session_api_keys(config))
+        )
+    except Exception as e:
+        print(f"Error recording usage: {e}")
 
 # Create a chatbot node that processes messages
-def chatbot(state: State):
-    llm = get_llm(state["model_name"])
-    messages = state["messages"]
+def chatbot(state: State, config: RunnableConfig):
+    api_keys = session_api_keys(config)
+    llm = get_llm(state["model_name"], api_keys)
+    messages = context_messages(state)
+    # The answer's text goes to the graph's custom stream (a no-op unless streamed)
+    emit = get_stream_writer()
     
-    # Convert messages to the format expected by the LLM
-    response = llm.invoke(messages)
+    key, cached = cached_response(state["model_name"], llm, messages, api_keys)
+    if cached is not None:
+        emit({"delta": content_text(cached.content)})
+        return {"messages": [cached]}
+    
+    # Ask the chosen model, failing over to its equivalents if it errors or stalls;
+    # without equivalents there is nothing to route
+    started = time.perf_counter()
+    candidates = route_candidates(state["model_name"], api_keys)
+    if len(candidates) == 1:
+        answered_by = candidates[0]
+        stream = config["configurable"].get("stream_answer", False)
+        response = call_model(answered_by, messages, Attempt(answered_by, emit), api_keys, stream)
+    else:
+        answered_by, response = MODEL_ROUTER.invoke(
+            candidates,
+            lambda attempt: call_model(attempt.model_name, messages, attempt, api_keys),
+            emit
+        )
+    record_turn_usage(answered_by, config, messages, response, time.perf_counter() - started)
+    # Answers from a fallback model aren't cached under the chosen model
+    if answered_by == state["model_name"]:
+        cache_response(key, state["model_name"], messages, response, api_keys)
+    return {"messages": [response]}
+
+# Async version of the chatbot node, used when the graph runs with ainvoke/astream
+async def achatbot(state: State, config: RunnableConfig):
+    api_keys = session_api_keys(config)
+    llm = await aget_llm(state["model_name"], api_keys)
+    messages = context_messages(state)
+    emit = get_stream_writer()
+    
+    # The caches and the usage rollups are SQLite (and embedding) work, run in worker threads
+    key, cached = await asyncio.to_thread(cached_response, state["model_name"], llm, messages, api_keys)
+    if cached is not None:
+        emit({"delta": content_text(cached.content)})
+        return {"messages": [cached]}
+    
+    started = time.perf_counter()
+    candidates = route_candidates(state["model_name"], api_keys)
+    if len(candidates) == 1:
+        answered_by = candidates[0]
+        stream = config["configurable"].get("stream_answer", False)
+        response = await acall_model(answered_by, messages, Attempt(answered_by, emit), api_keys, stream)
+    else:
+        answered_by, response = await MODEL_ROUTER.ainvoke(
+            candidates,
+            lambda attempt: acall_model(attempt.model_name, messages, attempt, api_keys),
+            emit
+        )
+    await asyncio.to_thread(record_turn_usage, answered_by, config, messages, response, time.perf_counter() - started)
+    if answered_by == state["model_name"]:
+        await asyncio.to_thread(cache_response, key, state["model_name"], messages, response, api_keys)
     return {"messages": [response]}
 
 # Build the graph
-def build_graph(model_name):
+def build_graph(model_name=None, checkpointer=None):
     # Create a new graph builder
     graph_builder = StateGraph(State)
     
-    # Add the chatbot node
-    graph_builder.add_node("chatbot", chatbot)
+    # Add the nodes with both sync and async implementations
+    graph_builder.add_node("context_window", RunnableLambda(context_window, afunc=acontext_window, name="context_window"))
+    graph_builder.add_node("chatbot", RunnableLambda(chatbot, afunc=achatbot, name="chatbot"))
     
-    # Add an entry point
-    graph_builder.add_edge(START, "chatbot")
+    # Add an entry point; the context window is chosen before every model call
+    graph_builder.add_edge(START, "context_window")
+    graph_builder.add_edge("context_window", "chatbot")
     
     # Compile the graph without explicit end node
     # The graph will automatically end after the last node
-    return graph_builder.compile()
+    return graph_builder.compile(checkpointer=checkpointer)
 
-# Main function to run the chatbot with the given input and model
-def run_chatbot(user_input, chat_history, model_name):
-    # Skip empty inputs
-    if not user_input.strip():
-        return "", chat_history
-    
-    # Format the chat history for the LLM
+# The compiled graph is model-independent (the model travels in the state),
+# so it is compiled once and shared by every request
+_graph = None
+_graph_lock = threading.Lock()
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                with METRICS.span("graph_build"):
+                    _graph = build_graph(checkpointer=get_checkpointer(CHECKPOINT_DB))
+    return _graph
+
+# Build the graph input and config for a turn. A thread that already has
+# stored state only needs the new user message; a new or reloaded chat is
+# seeded once from the client-side history. The session's API keys, and
+# whether the answer is streamed to the caller, travel in the config, which
+# is never checkpointed.
+@METRICS.timed("history_conversion")
+def prepare_turn(user_input, chat_history, thread_id, has_state, api_keys=None, stream=False):
+    config = {"configurable": {"thread_id": thread_id or uuid.uuid4().hex}}
+    if api_keys:
+        config["configurable"]["api_keys"] = api_keys
+    if stream:
+        config["configurable"]["stream_answer"] = True
+    if has_state:
+        messages = [HumanMessage(content=user_input)]
+    else:
+        messages = to_langchain_messages(chat_history)
+        messages.append(HumanMessage(content=user_input))
+    return messages, config
+
+@METRICS.timed("checkpoint_lookup")
+def thread_has_state(graph, thread_id):
+    if not thread_id:
+        return False
+    if THREADS.is_known(thread_id):
+        return True
+    snapshot = graph.get_state({"configurable": {"thread_id": thread_id}})
+    return bool(snapshot.values.get("messages"))
+
+@METRICS.timed("checkpoint_lookup")
+async def athread_has_state(graph, thread_id):
+    if not thread_id:
+        return False
+    if THREADS.is_known(thread_id):
+        return True
+    snapshot = await graph.aget_state({"configurable": {"thread_id": thread_id}})
+    return bool(snapshot.values.get("messages"))
+
+# Convert a Gradio 'messages' chat history into LangChain messages
+def to_langchain_messages(chat_history):
     messages = []
     for message in chat_history:
         if message["role"] == "user":
             messages.append(HumanMessage(content=message["content"]))
         elif message["role"] == "assistant":
             messages.append(AIMessage(content=message["content"]))
+    return messages
+
+# Error text shown in the chat when a request fails
+def format_error(error_msg):
+    return f"Error: {error_msg}\n\nTry checking your API keys or selecting a different model."
+
+# Main function to run the chatbot with the given input and model
+@METRICS.timed("turn")
+def run_chatbot(user_input, chat_history, model_name, thread_id=None, api_keys=None):
+    # Skip empty inputs
+    if not user_input.strip():
+        return "", chat_history
     
-    # Add the current user input
-    messages.append(HumanMessage(content=user_input))
-    
-    # Initialize the graph with the selected model
-    graph = build_graph(model_name)
+    # Reuse the compiled graph
+    graph = get_graph()
     
     # Run the graph with the initial state
     try:
+        # Format the chat history for the LLM and add the current user input
+        messages, config = prepare_turn(user_input, chat_history, thread_id, thread_has_state(graph, thread_id), api_keys)
         result = graph.invoke({
             "messages": messages,
             "model_name": model_name
-        })
+        }, config)
+        THREADS.mark(config["configurable"]["thread_id"])
         
         # Extract the assistant's response
-        assistant_response = result["messages"][-1].content
+        assistant_response = content_text(result["messages"][-1].content)
         
         # Update chat history with proper format for 'messages' type chatbot
         chat_history.append({"role": "user", "content": user_input})
         chat_history.append({"role": "assistant", "content": assistant_response})
     except Exception as e:
+        METRICS.error("turn", e)
         error_msg = str(e)
         chat_history.append({"role": "user", "content": user_input})
-        chat_history.append({"role": "assistant", "content": f"Error: {error_msg}\n\nTry checking your API keys or selecting a different model."})
+        chat_history.append({"role": "assistant", "content": format_error(error_msg)})
+    
+    return "", chat_history
+
+# Async version of run_chatbot
+@METRICS.timed("turn")
+async def arun_chatbot(user_input, chat_history, model_name, thread_id=None, api_keys=None):
+    # Skip empty inputs
+    if not user_input.strip():
+        return "", chat_history
+    
+    graph = get_graph()
+    
+    try:
+        messages, config = prepare_turn(user_input, chat_history, thread_id, await athread_has_state(graph, thread_id), api_keys)
+        result = await graph.ainvoke({
+            "messages": messages,
+            "model_name": model_name
+        }, config)
+        THREADS.mark(config["configurable"]["thread_id"])
+        assistant_response = content_text(result["messages"][-1].content)
+        chat_history.append({"role": "user", "content": user_input})
+        chat_history.append({"role": "assistant", "content": assistant_response})
+    except Exception as e:
+        METRICS.error("turn", e)
+        chat_history.append({"role": "user", "content": user_input})
+        chat_history.append({"role": "assistant", "content": format_error(str(e))})
     
     return "", chat_history
 
-# Save API keys to .env file
-def save_api_keys(google_key, anthropic_key, openai_key):
-    # Update the global API keys
-    API_KEYS["GOOGLE_API_KEY"] = google_key
-    API_KEYS["ANTHROPIC_API_KEY"] = anthropic_key
-    API_KEYS["OPENAI_API_KEY"] = openai_key
+# Streaming variant of run_chatbot: yields the chat history after every token
+# so the UI can render the answer while it is being generated
+@METRICS.timed("turn")
+def stream_chatbot(user_input, chat_history, model_name, thread_id=None, api_keys=None):
+    # Skip empty inputs
+    if not user_input.strip():
+        yield "", chat_history
+        return
+    
+    graph = get_graph()
+    
+    # Format the chat history before it gets the new placeholder messages
+    history = list(chat_history)
+    
+    # Show the user message and an empty assistant message straight away
+    chat_history.append({"role": "user", "content": user_input})
+    chat_history.append({"role": "assistant", "content": ""})
+    yield "", chat_history
+    
+    # Show the expected wait until the first token replaces it
+    notice = rate_limit_notice(model_name, api_keys)
+    if notice:
+        chat_history[-1]["content"] = notice
+        yield "", chat_history
+    
+    started, first_token = time.perf_counter(), True
+    try:
+        messages, config = prepare_turn(user_input, history, thread_id, thread_has_state(graph, thread_id), api_keys, stream=True)
+        for event in graph.stream(
+            {"messages": messages, "model_name": model_name},
+            config,
+            stream_mode="custom"
+        ):
+            # The router switched to another model: drop its partial answer
+            if event.get("reset"):
+                chat_history[-1]["content"] = ""
+                yield "", chat_history
+                continue
+            text = event.get("delta", "")
+            if text:
+                if first_token:
+                    # As the user sees it: queueing, context and model latency included
+                    METRICS.observe("time_to_first_token", time.perf_counter() - started)
+                    first_token = False
+                if notice:
+                    chat_history[-1]["content"], notice = "", ""
+                chat_history[-1]["content"] += text
+                yield "", chat_history
+        THREADS.mark(config["configurable"]["thread_id"])
+    except Exception as e:
+        METRICS.error("turn", e)
+        error_msg = str(e)
+        chat_history[-1]["content"] = format_error(error_msg)
+        yield "", chat_history
+
+# Async version of stream_chatbot
+@METRICS.timed("turn")
+async def astream_chatbot(user_input, chat_history, model_name, thread_id=None, api_keys=None):
+    # Skip empty inputs
+    if not user_input.strip():
+        yield "", chat_history
+        return
+    
+    graph = get_graph()
+    history = list(chat_history)
+    
+    chat_history.append({"role": "user", "content": user_input})
+    chat_history.append({"role": "assistant", "content": ""})
+    yield "", chat_history
+    
+    # Show the expected wait until the first token replaces it
+    notice = rate_limit_notice(model_name, api_keys)
+    if notice:
+        chat_history[-1]["content"] = notice
+        yield "", chat_history
+    
+    started, first_token = time.perf_counter(), True
+    try:
+        messages, config = prepare_turn(user_input, history, thread_id, await athread_has_state(graph, thread_id), api_keys, stream=True)
+        async for event in graph.astream(
+            {"messages": messages, "model_name": model_name},
+            config,
+            stream_mode="custom"
+        ):
+            if event.get("reset"):
+                chat_history[-1]["content"] = ""
+                yield "", chat_history
+                continue
+            text = event.get("delta", "")
+            if text:
+                if first_token:
+                    # As the user sees it: queueing, context and model latency included
+                    METRICS.observe("time_to_first_token", time.perf_counter() - started)
+                    first_token = False
+                if notice:
+                    chat_history[-1]["content"], notice = "", ""
+                chat_history[-1]["content"] += text
+                yield "", chat_history
+        THREADS.mark(config["configurable"]["thread_id"])
+    except Exception as e:
+        METRICS.error("turn", e)
+        chat_history[-1]["content"] = format_error(str(e))
+        yield "", chat_history
+
+# Save the API keys entered in a session. They are returned as the session's
+# new keys (blank fields fall back to the process defaults); only with
+# PERSIST_API_KEYS are they also written to .env and made the defaults.
+# Clients built with a key that a session (or the process defaults) no
+# longer uses are dropped right away rather than left to age out of the LRU
+def release_replaced_keys(previous_keys, current_keys):
+    for provider in PROVIDER_API_KEYS:
+        old_key = provider_key(provider, previous_keys)
+        if old_key and old_key != provider_key(provider, current_keys):
+            MODEL_REGISTRY.invalidate(provider, old_key)
+
+def save_api_keys(google_key, anthropic_key, openai_key, previous_keys=None):
+    new_keys = {
+        "GOOGLE_API_KEY": google_key.strip(),
+        "ANTHROPIC_API_KEY": anthropic_key.strip(),
+        "OPENAI_API_KEY": openai_key.strip()
+    }
+    
+    if not PERSIST_API_KEYS:
+        release_replaced_keys(previous_keys, new_keys)
+        return "API keys saved for this session.", new_keys
+    
+    # Update the process defaults, keeping the current key for blank fields
+    old_defaults = dict(API_KEYS)
+    API_KEYS.update({name: key for name, key in new_keys.items() if key})
+    release_replaced_keys(old_defaults, API_KEYS)
+    release_replaced_keys(previous_keys, new_keys)
     
     # Write to .env file
     with open(".env", "w") as f:
-        f.write(f"GOOGLE_API_KEY={google_key}\n")
-        f.write(f"ANTHROPIC_API_KEY={anthropic_key}\n")
-        f.write(f"OPENAI_API_KEY={openai_key}\n")
-    
-    # Also set environment variables for the current session
-    os.environ["GOOGLE_API_KEY"] = google_key
-    os.environ["ANTHROPIC_API_KEY"] = anthropic_key
-    os.environ["OPENAI_API_KEY"] = openai_key
+        f.write(f"GOOGLE_API_KEY={API_KEYS['GOOGLE_API_KEY']}\n")
+        f.write(f"ANTHROPIC_API_KEY={API_KEYS['ANTHROPIC_API_KEY']}\n")
+        f.write(f"OPENAI_API_KEY={API_KEYS['OPENAI_API_KEY']}\n")
     
-    return "API keys saved successfully!"
+    return "API keys saved successfully!", new_keys
 
 # Add main entry point for application launch
 if __name__ == "__main__":
     # Create the Gradio interface using the imported function from ui.interface
+    if ASYNC_CHAT:
+        chat_fn, stream_fn = arun_chatbot, astream_chatbot
+    else:
+        chat_fn, stream_fn = run_chatbot, stream_chatbot
+    from ui.interface import create_interface
     app = create_interface(
-        run_chatbot=run_chatbot,
+        run_chatbot=chat_fn,
+        stream_chatbot=stream_fn if STREAM_RESPONSES else None,
         save_api_keys=save_api_keys,
+        warm_model=awarm_model if ASYNC_CHAT else warm_model,
         api_keys=API_KEYS,
-        available_models=AVAILABLE_MODELS
+        available_models=AVAILABLE_MODELS,
+        chat_concurrency_limit=CHAT_CONCURRENCY_LIMIT
     )
+    # Start warming the preloaded models while the UI starts
+    MODEL_WARMER.preload(WARM_MODELS)
+    # Recover chats left in the autosave log and start background compaction
+    if CHAT_AUTOSAVE:
+        get_chat_log().start()
+    # Evict chats beyond the retention limits in the background, if any are set
+    from ui.history_retention import get_history_sweeper
+    history_sweeper = get_history_sweeper()
+    if history_sweeper.enabled:
+        history_sweeper.start()
+    # Serve per-stage metrics next to the app
+    if METRICS.enabled:
+        METRICS.serve(int(os.getenv("METRICS_PORT")), os.getenv("METRICS_HOST", "127.0.0.1"))
+    # Explicit queue limits so chat traffic doesn't starve the other events
+    app.queue(default_concurrency_limit=UI_CONCURRENCY_LIMIT)
     # Launch the app
     app.launch(server_name="127.0.0.1", share=True,pwa=True)
\ No newline at end of file
@@ -0,0 +1,74 @@
+"""
+Tests for the chat autosave log and its compaction.
+
+Run with ``python -m unittest discover tests`` (or pytest).
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ui import chat_history
+from ui.chat_log import ChatLog
+from ui.history_store import find_history_file, read_history
+
+
+class Crash(Exception):
+    pass
+
+
+class ChatLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.history_dir = self.temp_dir.name
+        patcher = mock.patch.object(chat_history, "HISTORY_DIR", self.history_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+        self.log = ChatLog(self.history_dir)
+
+    def turn(self, n):
+        return [{"role": "user", "content": f"question {n}"}, {"role": "assistant", "content": f"answer {n}"}]
+
+    def saved_messages(self, history_id):
+        return read_history(find_history_file(self.history_dir, history_id))["messages"]
+
+    def test_compaction_appends_to_the_snapshot(self):
+        self.log.append_turn("chat_a", self.turn(1), "openai:gpt-4o")
+        self.assertEqual(self.log.compact("chat_a"), "chat_a")
+        self.log.append_turn("chat_a", self.turn(2), "openai:gpt-4o")
+        self.assertEqual(self.log.compact("chat_a"), "chat_a")
+
+        self.assertEqual(self.saved_messages("chat_a"), self.turn(1) + self.turn(2))
+        self.assertIsNone(self.log.compact("chat_a"))
+
+    def test_fold_interrupted_after_the_save_is_not_applied_twice(self):
+        self.log.append_turn("chat_a", self.turn(1), "openai:gpt-4o")
+        self.log.compact("chat_a")
+        self.log.append_turn("chat_a", self.turn(2), "openai:gpt-4o")
+
+        # Crash after the snapshot is saved but before the detached log is removed
+        save = chat_history.save_chat_history
+
+        def save_then_crash(*args, **kwargs):
+            save(*args, **kwargs)
+            raise Crash()
+
+        with mock.patch.object(chat_history, "save_chat_history", save_then_crash):
+            with self.assertRaises(Crash):
+                self.log.compact("chat_a")
+        detached_path = os.path.join(self.log.log_dir, "chat_a.jsonl.compacting")
+        self.assertTrue(os.path.exists(detached_path))
+
+        # A restarted process finishes the compaction
+        restarted = ChatLog(self.history_dir)
+        restarted.append_turn("chat_a", self.turn(3), "openai:gpt-4o")
+        self.assertEqual(restarted.compact("chat_a"), "chat_a")
+        self.assertFalse(os.path.exists(detached_path))
+        self.assertEqual(self.saved_messages("chat_a"), self.turn(1) + self.turn(2) + self.turn(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
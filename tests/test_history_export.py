@@ -0,0 +1,52 @@
+"""
+Tests for chat history export and import.
+
+Run with ``python -m unittest discover tests`` (or pytest).
+"""
+
+import importlib.util
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ui import chat_history
+from ui.history_export import export_histories, import_histories, iter_ndjson, iter_parquet
+
+MESSAGES = [
+    {"role": "user", "content": [{"type": "text", "text": "What is in this image?"}]},
+    {"role": "assistant", "content": "A cat."},
+    {"role": "user", "content": "[1, 2]"}
+]
+
+
+class HistoryExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.history_dir = os.path.join(self.temp_dir.name, "histories")
+        patcher = mock.patch.object(chat_history, "HISTORY_DIR", self.history_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        chat_history.save_chat_history(MESSAGES, "openai:gpt-4o", history_id="chat_20260101_120000_abc123")
+
+    def round_trip(self, fmt, read):
+        path = os.path.join(self.temp_dir.name, f"export.{fmt}")
+        self.assertEqual(export_histories(path, fmt)["count"], 1)
+        self.assertEqual([history["messages"] for history in read(path)], [MESSAGES])
+        # Importing the export over the same chats finds nothing new
+        counts = import_histories(read(path))
+        self.assertEqual(counts["duplicate"], 1)
+        self.assertEqual(counts["skipped"] + counts["renamed"] + counts["imported"], 0)
+
+    def test_ndjson_round_trip(self):
+        self.round_trip("ndjson", iter_ndjson)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "needs pyarrow")
+    def test_parquet_round_trip_keeps_structured_content(self):
+        self.round_trip("parquet", iter_parquet)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+"""
+Tests for the semantic response cache.
+
+Run with ``python -m unittest discover tests`` (or pytest).
+"""
+
+import unittest
+
+from core.semantic_cache import SemanticCache
+
+
+class SemanticCacheTest(unittest.TestCase):
+
+    def test_paraphrase_hits_only_its_namespace(self):
+        cache = SemanticCache()
+        cache.put("openai:gpt-4o|key-a", "how to upload a file to S3 in python", "use boto3")
+        self.assertEqual(cache.lookup("openai:gpt-4o|key-a", "python s3 upload file example"), "use boto3")
+        self.assertIsNone(cache.lookup("openai:gpt-4o|key-b", "python s3 upload file example"))
+
+    def test_least_recently_used_namespace_is_dropped(self):
+        cache = SemanticCache(max_namespaces=2)
+        for tenant in ("a", "b"):
+            cache.put(f"model|{tenant}", "how to upload a file to S3 in python", f"answer {tenant}")
+        # Using tenant a makes b the least recently used
+        self.assertEqual(cache.lookup("model|a", "upload a file to S3 in python"), "answer a")
+        cache.put("model|c", "how to upload a file to S3 in python", "answer c")
+
+        self.assertEqual(cache.lookup("model|a", "upload a file to S3 in python"), "answer a")
+        self.assertIsNone(cache.lookup("model|b", "upload a file to S3 in python"))
+        self.assertEqual(cache.lookup("model|c", "upload a file to S3 in python"), "answer c")
+        self.assertEqual(cache.stats["namespace_evictions"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
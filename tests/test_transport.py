@@ -0,0 +1,123 @@
+"""
+Tests for the shared HTTP transport against a local stub provider server.
+
+Run with ``python -m unittest discover tests`` (or pytest).
+"""
+
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.transport import HttpTransport
+
+
+class StubProvider(BaseHTTPRequestHandler):
+    """Answers the OpenAI and Anthropic chat endpoints with canned responses."""
+
+    # Keep-alive, so pooled connections can be reused
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._send(404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.endswith("/chat/completions"):
+            response = {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "openai stub"}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+            }
+        elif self.path.endswith("/messages"):
+            response = {
+                "id": "msg_stub", "type": "message", "role": "assistant", "model": request["model"],
+                "content": [{"type": "text", "text": "anthropic stub"}],
+                "stop_reason": "end_turn", "usage": {"input_tokens": 3, "output_tokens": 2}
+            }
+        else:
+            self._send(404)
+            return
+        self._send(200, json.dumps(response).encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpTransportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubProvider)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.transport = HttpTransport()
+
+    def tearDown(self):
+        self.transport.close()
+
+    def anthropic_model(self):
+        from langchain_anthropic import ChatAnthropic
+        llm = ChatAnthropic(model="claude-3-haiku-20240307", api_key="test", base_url=self.url, max_retries=0)
+        return self.transport.attach("anthropic", llm)
+
+    def test_anthropic_requests_share_one_connection(self):
+        llm = self.anthropic_model()
+        self.assertIs(llm._client._client, self.transport.client)
+
+        self.assertEqual(llm.invoke("hi").content, "anthropic stub")
+        self.assertEqual(llm.invoke("hi again").content, "anthropic stub")
+        stats = self.transport.stats()
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["reused"], 1)
+
+    def test_openai_uses_the_shared_pool(self):
+        from langchain_openai import ChatOpenAI
+        llm = ChatOpenAI(model="gpt-4o", api_key="test", base_url=self.url + "/v1", max_retries=0, **self.transport.model_kwargs("openai"))
+
+        self.assertEqual(llm.invoke("hi").content, "openai stub")
+        self.assertEqual(self.transport.stats()["requests"], 1)
+        self.assertEqual(self.transport.endpoint("openai", llm), self.url + "/v1/")
+
+    def test_async_client_works_across_event_loops(self):
+        llm = self.anthropic_model()
+
+        async def ask():
+            await self.transport.aprewarm(self.url)
+            return (await llm.ainvoke("hi")).content
+
+        # Each loop gets its own pool; a connection from a closed loop is never reused
+        self.assertEqual(asyncio.run(ask()), "anthropic stub")
+        self.assertEqual(asyncio.run(ask()), "anthropic stub")
+        stats = self.transport.stats()
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["connections"], 2)
+
+    def test_attach_leaves_unknown_models_unchanged(self):
+        class OtherModel:
+            _client = None
+
+        llm = OtherModel()
+        self.assertIs(self.transport.attach("anthropic", llm), llm)
+        self.assertNotIn("_client", vars(llm))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Tests for the token and cost rollups.
+
+Run with ``python -m unittest discover tests`` (or pytest).
+"""
+
+import os
+import tempfile
+import unittest
+
+from core.usage import UsageTracker, usage_tenant
+
+
+class UsageTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.tracker = UsageTracker(os.path.join(self.temp_dir.name, "usage.sqlite"))
+        self.addCleanup(self.tracker._conn.close)
+        self.alice = usage_tenant({"OPENAI_API_KEY": "sk-alice"})
+        self.bob = usage_tenant({"OPENAI_API_KEY": "sk-bob"})
+
+    def test_tenants_see_only_their_own_usage(self):
+        self.tracker.record("openai:gpt-4o", "chat_a", 100, 10, 1.0, day="2026-01-01", tenant=self.alice)
+        self.tracker.record("openai:gpt-4o", "chat_a", 100, 10, 1.0, day="2026-01-02", tenant=self.alice)
+        self.tracker.record("openai:gpt-4o", "chat_b", 500, 50, 1.0, day="2026-01-02", tenant=self.bob)
+
+        alice = self.tracker.by_model(self.alice)
+        self.assertEqual([(row["model"], row["turns"], row["input_tokens"]) for row in alice], [("openai:gpt-4o", 2, 200)])
+        self.assertEqual([row["key"] for row in self.tracker.by_day(7, self.alice)], ["2026-01-02", "2026-01-01"])
+        self.assertEqual([row["input_tokens"] for row in self.tracker.by_day(1, self.bob)], [500])
+        # The unscoped view still covers everyone
+        self.assertEqual(self.tracker.by_model()[0]["turns"], 3)
+
+    def test_default_keys_share_one_tenant(self):
+        self.assertEqual(usage_tenant(None), usage_tenant({"OPENAI_API_KEY": ""}))
+        self.assertNotEqual(self.alice, self.bob)
+
+    def test_delete_sessions(self):
+        self.tracker.record("openai:gpt-4o", "chat_a", 100, 10, 1.0)
+        self.tracker.record("openai:gpt-4o", "chat_b", 100, 10, 1.0)
+        self.tracker.delete_sessions(["chat_a"])
+        self.assertEqual(self.tracker.by_session("chat_a"), [])
+        self.assertEqual(len(self.tracker.by_session("chat_b")), 1)
+        self.assertEqual(self.tracker.by_model()[0]["turns"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
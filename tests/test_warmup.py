@@ -0,0 +1,49 @@
+"""
+Tests for model warm-up readiness tracking.
+
+Run with ``python -m unittest discover tests`` (or pytest).
+"""
+
+import unittest
+
+from core.model_registry import ModelRegistry
+from core.warmup import COLD, READY, ModelWarmer
+
+
+class ModelWarmerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ModelRegistry(max_models=1)
+        self.built = []
+
+        def warm(model_name, api_keys):
+            self.built.append(model_name)
+            self.registry.get(model_name, "key", object)
+
+        self.warmer = ModelWarmer(warm, is_warm=lambda model_name, api_keys: self.registry.contains(model_name, "key"))
+
+    def tearDown(self):
+        self.warmer.shutdown()
+
+    def test_ready_until_the_client_is_evicted(self):
+        self.warmer.warm("openai:a").result()
+        self.assertEqual(self.warmer.status("openai:a"), (READY, ""))
+
+        # Warming a second model evicts the first from the one-model registry
+        self.warmer.warm("openai:b").result()
+        self.assertEqual(self.warmer.status("openai:a"), (COLD, ""))
+        self.assertEqual(self.warmer.status("openai:b"), (READY, ""))
+
+    def test_evicted_model_is_warmed_again(self):
+        self.warmer.warm("openai:a").result()
+        self.warmer.warm("openai:a").result()
+        self.assertEqual(self.built, ["openai:a"])
+
+        self.warmer.warm("openai:b").result()
+        self.warmer.warm("openai:a").result()
+        self.assertEqual(self.built, ["openai:a", "openai:b", "openai:a"])
+        self.assertEqual(self.warmer.status("openai:a"), (READY, ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,4 +2,10 @@
 UI components for the Coding Agent application.
 """
 
-from .interface import create_interface
+# create_interface is loaded on first access, so modules such as
+# ui.chat_history can be used without importing gradio
+def __getattr__(name):
+    if name == "create_interface":
+        from .interface import create_interface
+        return create_interface
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -6,24 +6,55 @@ This module manages the storage and retrieval of chat histories.
 
 import os
 import json
+import uuid
+import threading
 from datetime import datetime
 from typing import List, Dict, Any
 
-import os
+from core.checkpoints import delete_threads
+from core.metrics import get_metrics
+from core.usage import delete_sessions
+from .history_index import HistoryIndex
+from .history_store import find_history_file, read_history, remove_history, write_history
 
 # Directory to store chat histories - using an absolute path
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 HISTORY_DIR = os.path.join(BASE_DIR, "chat_histories")
 
+# SQLite file holding per-thread conversation state (see core.checkpoints);
+# a chat's thread has the chat's ID. Empty keeps threads in memory only.
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(HISTORY_DIR, ".db", "checkpoints.sqlite"))
+
+# Number of histories per page in the Histories tab
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+
+# Stage timings for the history I/O functions (no-ops unless metrics are enabled)
+METRICS = get_metrics()
+
+# Metadata index over HISTORY_DIR, opened on first use
+_index = None
+_index_lock = threading.Lock()
+
 def ensure_history_dir():
     """Ensure the chat history directory exists."""
     if not os.path.exists(HISTORY_DIR):
         os.makedirs(HISTORY_DIR)
 
+def get_history_index():
+    """Return the metadata index for the current history directory."""
+    global _index
+    with _index_lock:
+        if _index is None or _index.history_dir != HISTORY_DIR:
+            ensure_history_dir()
+            _index = HistoryIndex(HISTORY_DIR)
+        return _index
+
 def generate_history_id():
     """Generate a unique ID for a new chat history."""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return f"chat_{timestamp}"
+    # The random suffix keeps IDs unique when several chats start in the same
+    # second; IDs still sort chronologically
+    return f"chat_{timestamp}_{uuid.uuid4().hex[:6]}"
 
 
 def generate_chat_title(chat_history):
@@ -104,13 +135,24 @@ def generate_chat_title(chat_history):
     
     return title
 
-def save_chat_history(chat_history: List[Dict[str, Any]], model_name: str = None):
+@METRICS.timed("history_save")
+def save_chat_history(
+    chat_history: List[Dict[str, Any]],
+    model_name: str = None,
+    history_id: str = None,
+    title: str = None,
+    folded_log: str = None
+):
     """
     Save the current chat history.
     
     Args:
         chat_history: List of message dictionaries
         model_name: The model used for this chat
+        history_id: ID to save under, replacing any existing history with that ID;
+            a new ID is generated if omitted
+        title: Title to keep; generated from the content if omitted
+        folded_log: Digest of the autosave log folded into this save (see chat_log)
         
     Returns:
         str: The ID of the saved history
@@ -121,10 +163,10 @@ def save_chat_history(chat_history: List[Dict[str, Any]], model_name: str = None
     if not chat_history:
         return None
     
-    history_id = generate_history_id()
+    history_id = history_id or generate_history_id()
     
     # Generate a descriptive title based on the chat content
-    title = generate_chat_title(chat_history)
+    title = title or generate_chat_title(chat_history)
     
     # Create a history object with metadata
     history_obj = {
@@ -134,14 +176,19 @@ def save_chat_history(chat_history: List[Dict[str, Any]], model_name: str = None
         "title": title,
         "messages": chat_history
     }
+    if folded_log:
+        history_obj["folded_log"] = folded_log
+    
+    # Written compactly (HISTORY_FORMAT) through a temporary file, so readers
+    # never see a partial file
+    write_history(HISTORY_DIR, history_obj)
     
-    # Save to file
-    history_path = os.path.join(HISTORY_DIR, f"{history_id}.json")
-    with open(history_path, "w") as f:
-        json.dump(history_obj, f, indent=2)
+    # Keep the metadata index in step with the files
+    get_history_index().upsert(history_obj)
     
     return history_id
 
+@METRICS.timed("history_list")
 def get_chat_histories():
     """
     Get a list of all saved chat histories.
@@ -149,56 +196,78 @@ def get_chat_histories():
     Returns:
         List of tuples (id, title)
     """
-    ensure_history_dir()
+    # Served from the metadata index, sorted by ID (which contains the
+    # timestamp) in reverse order
+    return get_history_index().list()
+
+@METRICS.timed("history_list")
+def get_chat_histories_page(cursor=None, page_size=None):
+    """
+    Get one page of saved chat histories, newest first.
     
-    histories = []
-    for filename in os.listdir(HISTORY_DIR):
-        if filename.endswith(".json"):
-            try:
-                with open(os.path.join(HISTORY_DIR, filename), "r") as f:
-                    history = json.load(f)
-                    histories.append((history["id"], history.get("title", "Untitled Chat")))
-            except Exception as e:
-                print(f"Error loading history {filename}: {e}")
-    
-    # Sort by ID (which contains timestamp) in reverse order
-    histories.sort(reverse=True)
-    return histories
-
-def load_chat_history(history_id):
+    Args:
+        cursor: Cursor returned with the previous page; None for the first page
+        page_size: Number of histories per page (defaults to HISTORY_PAGE_SIZE)
+        
+    Returns:
+        tuple: (list of tuples (id, title), cursor of the next page or None)
+    """
+    return get_history_index().page(cursor, page_size or HISTORY_PAGE_SIZE)
+
+@METRICS.timed("history_search")
+def search_chat_histories(query, limit=20):
+    """
+    Search saved chat histories by title and message content.
+    
+    Args:
+        query: Free-text query; every word must match
+        limit: Maximum number of results
+        
+    Returns:
+        List of dicts with id, title, snippet and score, best match first
+    """
+    return get_history_index().search(query, limit)
+
+@METRICS.timed("history_load")
+def load_chat_history(history_id, record_access=False):
     """
     Load a specific chat history.
     
     Args:
         history_id: ID of the history to load
+        record_access: Count this as the user opening the chat, which keeps it
+            from being evicted first (see history_retention); previews don't
         
     Returns:
         tuple: (chat_history, model_name)
     """
     try:
-        history_path = os.path.join(HISTORY_DIR, f"{history_id}.json")
+        # Compressed and older pretty-printed files are read alike
+        history_path = find_history_file(HISTORY_DIR, history_id)
         print(f"Attempting to load history from: {history_path}")
         
-        if not os.path.exists(history_path):
-            print(f"History file not found: {history_path}")
+        if history_path is None:
+            print(f"History file not found: {history_id}")
             return [], None
             
-        with open(history_path, "r") as f:
-            history = json.load(f)
-            messages = history.get("messages", [])
-            model = history.get("model", None)
-            
-            # Ensure messages are in the correct format
-            for msg in messages:
-                if not isinstance(msg, dict) or "role" not in msg or "content" not in msg:
-                    print(f"Invalid message format in history: {msg}")
-                    # Try to fix the format if possible
-                    if isinstance(msg, dict):
-                        msg["role"] = msg.get("role", "assistant")
-                        msg["content"] = msg.get("content", "")
-            
-            print(f"Successfully loaded history with {len(messages)} messages")
-            return messages, model
+        history = read_history(history_path)
+        messages = history.get("messages", [])
+        model = history.get("model", None)
+        
+        # Ensure messages are in the correct format
+        for msg in messages:
+            if not isinstance(msg, dict) or "role" not in msg or "content" not in msg:
+                print(f"Invalid message format in history: {msg}")
+                # Try to fix the format if possible
+                if isinstance(msg, dict):
+                    msg["role"] = msg.get("role", "assistant")
+                    msg["content"] = msg.get("content", "")
+        
+        if record_access:
+            get_history_index().touch(history_id)
+        
+        print(f"Successfully loaded history with {len(messages)} messages")
+        return messages, model
     except json.JSONDecodeError as e:
         print(f"JSON error loading history {history_id}: {e}")
         return [], None
@@ -206,9 +275,10 @@ def load_chat_history(history_id):
         print(f"Error loading history {history_id}: {str(e)}")
         return [], None
 
+@METRICS.timed("history_delete")
 def delete_chat_history(history_id):
     """
-    Delete a specific chat history.
+    Delete a specific chat history, its conversation state and its usage rollup.
     
     Args:
         history_id: ID of the history to delete
@@ -217,9 +287,11 @@ def delete_chat_history(history_id):
         bool: True if successful, False otherwise
     """
     try:
-        history_path = os.path.join(HISTORY_DIR, f"{history_id}.json")
-        if os.path.exists(history_path):
-            os.remove(history_path)
+        # The chat's conversation state goes too, even if its file is already gone
+        delete_threads(CHECKPOINT_DB, [history_id])
+        delete_sessions([history_id])
+        if remove_history(HISTORY_DIR, history_id):
+            get_history_index().delete(history_id)
             return True
     except Exception as e:
         print(f"Error deleting history {history_id}: {e}")
@@ -0,0 +1,236 @@
+"""
+Chat Autosave Log.
+
+This module records every completed turn in an append-only JSONL log per
+chat, so a crash loses at most the turn in flight and each save costs only
+the size of the new messages. Logs are fsynced in batches and a background
+compactor folds them into the regular history snapshots.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from core.metrics import get_metrics
+from . import chat_history
+from .history_store import find_history_file, read_history
+
+# Subdirectory of the history directory holding the per-chat logs
+LOG_SUBDIR = ".logs"
+
+# Log every completed turn instead of saving chats only on New Chat
+CHAT_AUTOSAVE = os.getenv("CHAT_AUTOSAVE", "true").lower() in ("1", "true", "yes")
+
+
+class ChatLog:
+    """
+    Append-only per-chat turn log with batched fsync and background compaction.
+    """
+
+    def __init__(self, history_dir: str, fsync_interval: float = 1.0, idle_seconds: float = 300, compact_interval: float = 30):
+        self.history_dir = history_dir
+        self.log_dir = os.path.join(history_dir, LOG_SUBDIR)
+        self.fsync_interval = fsync_interval
+        self.idle_seconds = idle_seconds
+        self.compact_interval = compact_interval
+        self._files = {}
+        self._dirty = set()
+        self._last_write = {}
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(self.log_dir, exist_ok=True)
+
+    def _log_path(self, history_id: str) -> str:
+        return os.path.join(self.log_dir, f"{history_id}.jsonl")
+
+    @get_metrics().timed("history_autosave")
+    def append_turn(self, history_id: str, messages: List[Dict[str, Any]], model_name: Optional[str] = None):
+        """
+        Append the messages of a completed turn to the chat's log.
+
+        Args:
+            history_id: ID of the chat (also used for its snapshot)
+            messages: The new messages, normally the user message and the answer
+            model_name: The model that produced the answer
+        """
+        record = {"time": datetime.now().isoformat(), "model": model_name, "messages": messages}
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            f = self._files.get(history_id)
+            if f is None:
+                f = self._files[history_id] = open(self._log_path(history_id), "a", encoding="utf-8")
+            f.write(line)
+            # Hand the data to the OS right away; the fsync is batched
+            f.flush()
+            self._dirty.add(history_id)
+            self._last_write[history_id] = time.time()
+            if self._thread is None:
+                # Without the background thread, sync on every write
+                self.sync()
+
+    def sync(self):
+        """fsync every log written since the last sync."""
+        with self._lock:
+            for history_id in self._dirty:
+                f = self._files.get(history_id)
+                if f is not None:
+                    os.fsync(f.fileno())
+            self._dirty.clear()
+
+    def _read_log(self, path: str):
+        # Also returns a digest of the log, which identifies it once folded
+        messages, model_name = [], None
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for line in f:
+                digest.update(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn last line from a crash mid-write
+                    print(f"Skipping damaged log record in {path}")
+                    continue
+                messages.extend(record.get("messages", []))
+                model_name = record.get("model") or model_name
+        return messages, model_name, digest.hexdigest()
+
+    def _fold(self, history_id: str, path: str) -> bool:
+        # Merge a detached log into the chat's snapshot, keeping its messages and
+        # title. The snapshot records the log's digest, so a log whose removal
+        # was cut short by a crash is recognized and not appended a second time.
+        new_messages, model_name, digest = self._read_log(path)
+        if new_messages:
+            history_path = find_history_file(self.history_dir, history_id)
+            snapshot = read_history(history_path) if history_path is not None else None
+            if snapshot is None or snapshot.get("folded_log") != digest:
+                messages, title = [], None
+                if snapshot is not None:
+                    messages = snapshot.get("messages", [])
+                    model_name = model_name or snapshot.get("model")
+                    title = snapshot.get("title")
+                chat_history.save_chat_history(
+                    messages + new_messages, model_name, history_id=history_id, title=title, folded_log=digest
+                )
+        os.remove(path)
+        return bool(new_messages)
+
+    @get_metrics().timed("history_compact")
+    def compact(self, history_id: str) -> Optional[str]:
+        """
+        Fold a chat's log into its JSON snapshot and remove the log.
+
+        The log is detached under the write lock and folded outside of it,
+        so compaction never blocks turns being logged for other chats.
+
+        Args:
+            history_id: ID of the chat
+
+        Returns:
+            str: The history ID, or None if there was nothing to compact
+        """
+        log_path = self._log_path(history_id)
+        detached_path = log_path + ".compacting"
+        with self._compact_lock:
+            folded = False
+            # Finish a compaction interrupted by a crash first, to keep turns in order
+            if os.path.exists(detached_path):
+                folded = self._fold(history_id, detached_path)
+
+            with self._lock:
+                f = self._files.pop(history_id, None)
+                if f is not None:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+                self._dirty.discard(history_id)
+                self._last_write.pop(history_id, None)
+                if not os.path.exists(log_path):
+                    return history_id if folded else None
+                os.replace(log_path, detached_path)
+
+            folded = self._fold(history_id, detached_path) or folded
+            return history_id if folded else None
+
+    def compact_idle(self, all_logs: bool = False) -> int:
+        """
+        Compact logs that have not been written to for idle_seconds.
+
+        Args:
+            all_logs: Compact every log regardless of activity
+
+        Returns:
+            int: Number of compacted logs
+        """
+        now = time.time()
+        compacted = 0
+        for filename in os.listdir(self.log_dir):
+            if filename.endswith(".jsonl"):
+                history_id = filename[:-len(".jsonl")]
+            elif filename.endswith(".jsonl.compacting"):
+                history_id = filename[:-len(".jsonl.compacting")]
+            else:
+                continue
+            with self._lock:
+                last_write = self._last_write.get(history_id)
+            if last_write is None:
+                # A log left behind by an earlier process, or a detached one
+                # whose compaction was interrupted
+                path = os.path.join(self.log_dir, filename)
+                last_write = os.path.getmtime(path) if filename.endswith(".jsonl") else 0.0
+            if all_logs or now - last_write >= self.idle_seconds:
+                try:
+                    if self.compact(history_id):
+                        compacted += 1
+                except Exception as e:
+                    print(f"Error compacting chat log {history_id}: {e}")
+        return compacted
+
+    def _run(self):
+        last_compaction = 0.0
+        while not self._stop.wait(self.fsync_interval):
+            self.sync()
+            if time.time() - last_compaction >= self.compact_interval:
+                last_compaction = time.time()
+                self.compact_idle()
+
+    def start(self):
+        """Recover logs left by a previous run and start the background sync/compaction thread."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="chat-log-compactor", daemon=True)
+        recovered = self.compact_idle(all_logs=True)
+        if recovered:
+            print(f"Recovered {recovered} chat(s) from the autosave log")
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and sync outstanding writes."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sync()
+
+
+_chat_log = None
+_chat_log_lock = threading.Lock()
+
+
+def get_chat_log() -> ChatLog:
+    """Return the autosave log for the current history directory."""
+    global _chat_log
+    with _chat_log_lock:
+        if _chat_log is None or _chat_log.history_dir != chat_history.HISTORY_DIR:
+            _chat_log = ChatLog(
+                chat_history.HISTORY_DIR,
+                fsync_interval=float(os.getenv("CHAT_LOG_FSYNC_INTERVAL", "1.0")),
+                idle_seconds=float(os.getenv("CHAT_LOG_IDLE_SECONDS", "300")),
+                compact_interval=float(os.getenv("CHAT_LOG_COMPACT_INTERVAL", "30"))
+            )
+        return _chat_log
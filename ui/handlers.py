@@ -4,11 +4,47 @@ Event handlers for the Coding Agent UI.
 This file contains all the event handler functions and registrations.
 """
 
+import os
+import asyncio
+import json
+import uuid
+import inspect
 import gradio as gr
 from typing import Dict, List, Any
 
 # Import the chat history management module
-from .chat_history import save_chat_history, get_chat_histories, load_chat_history, delete_chat_history
+from .chat_history import save_chat_history, get_chat_histories_page, load_chat_history, delete_chat_history, generate_history_id, search_chat_histories
+from .chat_log import CHAT_AUTOSAVE, get_chat_log
+from core.usage import get_usage_tracker, usage_tenant
+
+# p95 turn latency (seconds) a model must meet to be suggested as the cheapest option
+USAGE_LATENCY_SLO = float(os.getenv("USAGE_LATENCY_SLO", "10"))
+
+# Show every session the usage of all sessions, not just the usage of its own
+# API keys (for single-user or admin deployments)
+USAGE_REPORT_ALL = os.getenv("USAGE_REPORT_ALL", "false").lower() in ("1", "true", "yes")
+
+# Model information shown for each provider in the Model Settings tab
+PROVIDER_INFO = {
+    "gemini": """
+    #### Google Gemini
+    Gemini is Google's family of multimodal AI models, capable of understanding text, code, audio, images, and video.
+    
+    Learn more: [Google AI Gemini](https://ai.google.dev/models/gemini)
+    """,
+    "claude": """
+    #### Anthropic Claude
+    Claude is a family of AI assistants created by Anthropic to be helpful, harmless, and honest.
+    
+    Learn more: [Anthropic Claude](https://www.anthropic.com/claude)
+    """,
+    "openai": """
+    #### OpenAI GPT
+    GPT (Generative Pre-trained Transformer) models are a series of large language models developed by OpenAI.
+    
+    Learn more: [OpenAI](https://platform.openai.com/docs/models)
+    """
+}
 
 def register_handlers(
     coding_tab: Dict[str, Any],
@@ -18,7 +54,12 @@ def register_handlers(
     available_models: Dict[str, List[str]],
     run_chatbot=None,
     save_api_keys=None,
-    shared_state=None
+    shared_state=None,
+    stream_chatbot=None,
+    chat_concurrency_limit=None,
+    usage_tab=None,
+    app=None,
+    warm_model=None
 ):
     """
     Register all event handlers for the UI components.
@@ -29,34 +70,47 @@ def register_handlers(
         model_settings: Dictionary of model settings components
         api_settings: Dictionary of API settings components
         available_models: Dictionary mapping provider names to lists of available models
+        stream_chatbot: Optional generator version of run_chatbot; when given, answers
+            are streamed into the chat token by token (sync or async generator)
+        chat_concurrency_limit: Maximum number of chat messages processed at once
+        usage_tab: Optional dictionary of usage tab components
+        app: The Blocks app, used to fill in the saved histories on page load
+        warm_model: Optional function (sync or async) taking (model_name, api_keys) that
+            warms the model's client and raises if it can't
     """
     # Extract components from dictionaries for convenience
     chatbot = coding_tab["chatbot"]
+    chat_state = coding_tab["chat_state"]
+    chat_delta_box = coding_tab["chat_delta"]
     msg = coding_tab["msg"]
     new_chat_btn = coding_tab["new_chat_btn"]
     current_model = coding_tab["current_model"]
+    thread_id = coding_tab["thread_id"]
     
     chat_history_dropdown = histories_tab["chat_history_dropdown"]
     load_history_btn = histories_tab["load_history_btn"]
     delete_history_btn = histories_tab["delete_history_btn"]
     history_display = histories_tab["history_display"]
+    newer_page_btn = histories_tab["newer_page_btn"]
+    older_page_btn = histories_tab["older_page_btn"]
+    page_info = histories_tab["page_info"]
+    history_page = histories_tab["history_page"]
+    search_box = histories_tab["search_box"]
+    search_btn = histories_tab["search_btn"]
+    search_results = histories_tab["search_results"]
     
     provider = model_settings["provider"]
     model = model_settings["model"]
     apply_model_btn = model_settings["apply_model_btn"]
     provider_info = model_settings["provider_info"]
+    model_status = model_settings["model_status"]
     
     google_key = api_settings["google_key"]
     anthropic_key = api_settings["anthropic_key"]
     openai_key = api_settings["openai_key"]
     save_btn = api_settings["save_btn"]
     api_result = api_settings["api_result"]
-    
-    # Update model choices when provider changes
-    def update_model_choices(provider_name):
-        return gr.Dropdown(choices=available_models[provider_name], value=available_models[provider_name][0])
-    
-    provider.change(update_model_choices, inputs=provider, outputs=model)
+    session_keys = api_settings["session_keys"]
     
     # Function to get full model name (provider:model)
     def get_full_model_name(provider_name, model_name):
@@ -66,16 +120,120 @@ def register_handlers(
             return f"{provider_name}:{model_name}"
     
     # Send message on Enter - use provided function or fall back to placeholder
-    chat_fn = run_chatbot if run_chatbot else lambda user_input, chat_history, model_name: placeholder_run_chatbot(user_input, chat_history, model_name)
+    chat_fn = run_chatbot if run_chatbot else placeholder_run_chatbot
+    
+    # Append a completed turn to the chat's autosave log. The first turn of a
+    # session also logs the history it was started from (e.g. a loaded chat).
+    def record_turn(session_thread, new_thread, user_input, history, model_name):
+        if not CHAT_AUTOSAVE or not user_input.strip():
+            return
+        try:
+            get_chat_log().append_turn(session_thread, history if new_thread else history[-2:], model_name)
+        except Exception as e:
+            print(f"Error autosaving chat {session_thread}: {e}")
+    
+    # The full history lives server-side in chat_state; the browser only gets
+    # each turn as a delta: a JSON header line (the turn's position, a unique
+    # ID and the user message) followed by the assistant's text so far.
+    # While streaming the text only grows, so Gradio sends just the new
+    # tokens, and the delta is applied to the chatbot in the browser.
+    def new_delta_id():
+        return uuid.uuid4().hex[:8]
+    
+    def chat_delta(history, start, delta_id):
+        if len(history) <= start:
+            # Nothing was added (e.g. an empty message)
+            return gr.skip()
+        header = json.dumps({"start": start, "id": delta_id, "user": history[start]["content"]})
+        return header + "\n" + "".join(message["content"] for message in history[start + 1:])
+    
+    chat_delta_box.change(
+        fn=None,
+        js="""(delta, history) => {
+            if (!delta) return history;
+            const split = delta.indexOf("\\n");
+            const turn = JSON.parse(delta.slice(0, split));
+            const messages = (history || []).slice(0, turn.start);
+            messages.push({role: "user", content: turn.user});
+            messages.push({role: "assistant", content: delta.slice(split + 1)});
+            return messages;
+        }""",
+        inputs=[chat_delta_box, chatbot],
+        outputs=[chatbot]
+    )
+    
+    # Gradio picks sync/async and streaming/blocking from the handler's own
+    # signature, so the wrapper has to match the kind of function it wraps.
+    # Each session gets a thread ID on its first message so the server keeps
+    # the conversation state between turns; the same ID names the saved chat.
+    # The session's own API keys go along with every request.
+    if stream_chatbot and inspect.isasyncgenfunction(stream_chatbot):
+        async def submit_message(user_input, chat_history, provider_name, model_name, session_thread, api_keys):
+            new_thread = not session_thread
+            session_thread = session_thread or generate_history_id()
+            full_model_name = get_full_model_name(provider_name, model_name)
+            start, delta_id = len(chat_history), new_delta_id()
+            async for text, history in stream_chatbot(
+                user_input,
+                chat_history,
+                full_model_name,
+                thread_id=session_thread,
+                api_keys=api_keys
+            ):
+                yield text, chat_delta(history, start, delta_id), history, session_thread
+            # The autosave log write blocks, so it runs off the event loop
+            await asyncio.to_thread(record_turn, session_thread, new_thread, user_input, history, full_model_name)
+    elif stream_chatbot:
+        def submit_message(user_input, chat_history, provider_name, model_name, session_thread, api_keys):
+            new_thread = not session_thread
+            session_thread = session_thread or generate_history_id()
+            full_model_name = get_full_model_name(provider_name, model_name)
+            start, delta_id = len(chat_history), new_delta_id()
+            for text, history in stream_chatbot(
+                user_input,
+                chat_history,
+                full_model_name,
+                thread_id=session_thread,
+                api_keys=api_keys
+            ):
+                yield text, chat_delta(history, start, delta_id), history, session_thread
+            record_turn(session_thread, new_thread, user_input, history, full_model_name)
+    elif inspect.iscoroutinefunction(chat_fn):
+        async def submit_message(user_input, chat_history, provider_name, model_name, session_thread, api_keys):
+            new_thread = not session_thread
+            session_thread = session_thread or generate_history_id()
+            full_model_name = get_full_model_name(provider_name, model_name)
+            start = len(chat_history)
+            text, history = await chat_fn(
+                user_input,
+                chat_history,
+                full_model_name,
+                thread_id=session_thread,
+                api_keys=api_keys
+            )
+            await asyncio.to_thread(record_turn, session_thread, new_thread, user_input, history, full_model_name)
+            return text, chat_delta(history, start, new_delta_id()), history, session_thread
+    else:
+        def submit_message(user_input, chat_history, provider_name, model_name, session_thread, api_keys):
+            new_thread = not session_thread
+            session_thread = session_thread or generate_history_id()
+            full_model_name = get_full_model_name(provider_name, model_name)
+            start = len(chat_history)
+            text, history = chat_fn(
+                user_input,
+                chat_history,
+                full_model_name,
+                thread_id=session_thread,
+                api_keys=api_keys
+            )
+            record_turn(session_thread, new_thread, user_input, history, full_model_name)
+            return text, chat_delta(history, start, new_delta_id()), history, session_thread
     
     msg.submit(
-        fn=lambda user_input, chat_history, provider_name, model_name: chat_fn(
-            user_input, 
-            chat_history, 
-            get_full_model_name(provider_name, model_name)
-        ),
-        inputs=[msg, chatbot, provider, model],
-        outputs=[msg, chatbot]
+        fn=submit_message,
+        inputs=[msg, chat_state, provider, model, thread_id, session_keys],
+        outputs=[msg, chat_delta_box, chat_state, thread_id],
+        concurrency_limit=chat_concurrency_limit if chat_concurrency_limit else "default"
     )
     
     # Function to generate the model display text consistently
@@ -103,180 +261,285 @@ def register_handlers(
         outputs=current_model
     )
     
-    # Keep track of the currently selected model globally
-    # This is necessary because the model selection happens in a different tab
-    # than where it's displayed in the Coding Agent tab
-    global_model_state = {
-        "provider": provider.value,
-        "model": model.value
-    }
-    
-    # Event handler that fires when a new model provider is selected
+    # One round trip per provider change: the model choices and the provider
+    # description are updated together
     def on_provider_change(provider_name):
-        global_model_state["provider"] = provider_name
-        return gr.update(choices=available_models[provider_name], value=available_models[provider_name][0])
+        return (
+            gr.update(choices=available_models[provider_name], value=available_models[provider_name][0]),
+            PROVIDER_INFO.get(provider_name, "Select a provider to see more information.")
+        )
     
-    # Event handler that fires when a specific model is selected
-    def on_model_change(model_name):
-        global_model_state["model"] = model_name
-        return None  # No UI updates
+    provider.change(fn=on_provider_change, inputs=provider, outputs=[model, provider_info])
     
-    # Register additional change events to track model selection
-    provider.change(fn=on_provider_change, inputs=provider, outputs=model)
-    model.change(fn=on_model_change, inputs=model, outputs=None)
-    
-    # Save API keys function - use provided function or fall back to placeholder
+    # Save API keys function - use provided function or fall back to placeholder.
+    # It gets the session's current keys too, and the saved keys become this
+    # session's keys.
     api_fn = save_api_keys if save_api_keys else placeholder_save_api_keys
     
-    save_btn.click(
+    save_event = save_btn.click(
         fn=api_fn,
-        inputs=[google_key, anthropic_key, openai_key],
-        outputs=api_result
+        inputs=[google_key, anthropic_key, openai_key, session_keys],
+        outputs=[api_result, session_keys]
     )
     
+    # Warm the selected model's client in the background whenever the
+    # selection (or the session's keys) changes, and show when it's ready.
+    # The handler only waits on the warm-up, so it never blocks the event loop.
+    if warm_model is not None:
+        if inspect.iscoroutinefunction(warm_model):
+            async def warm_selected_model(provider_name, model_name, api_keys):
+                full_model_name = get_full_model_name(provider_name, model_name)
+                yield f"_Warming up {full_model_name}..._"
+                try:
+                    await warm_model(full_model_name, api_keys)
+                except Exception as e:
+                    yield f"Could not warm up {full_model_name}: {e}"
+                    return
+                yield f"**{full_model_name}** is ready."
+        else:
+            def warm_selected_model(provider_name, model_name, api_keys):
+                full_model_name = get_full_model_name(provider_name, model_name)
+                yield f"_Warming up {full_model_name}..._"
+                try:
+                    warm_model(full_model_name, api_keys)
+                except Exception as e:
+                    yield f"Could not warm up {full_model_name}: {e}"
+                    return
+                yield f"**{full_model_name}** is ready."
+        
+        warm_inputs = [provider, model, session_keys]
+        model.change(fn=warm_selected_model, inputs=warm_inputs, outputs=model_status)
+        save_event.then(fn=warm_selected_model, inputs=warm_inputs, outputs=model_status)
+        # The default selection is warmed as soon as the page loads
+        if app is not None:
+            app.load(fn=warm_selected_model, inputs=warm_inputs, outputs=model_status)
+    
+    # Render one page of the histories dropdown. The dropdown values are
+    # history IDs, so selection never depends on (possibly duplicate) titles.
+    def history_page_updates(cursors):
+        histories, next_cursor = get_chat_histories_page(cursors[-1])
+        # Step back if the page became empty, e.g. after deleting its last chat
+        while not histories and len(cursors) > 1:
+            cursors = cursors[:-1]
+            histories, next_cursor = get_chat_histories_page(cursors[-1])
+        history_choices = [("Current Session", "Current Session")]
+        history_choices.extend((title, hist_id) for hist_id, title in histories)
+        return (
+            gr.update(choices=history_choices, value="Current Session"),
+            {"cursors": cursors, "next": next_cursor},
+            f"Page {len(cursors)}",
+            gr.update(interactive=len(cursors) > 1),
+            gr.update(interactive=next_cursor is not None)
+        )
+    
+    history_page_outputs = [chat_history_dropdown, history_page, page_info, newer_page_btn, older_page_btn]
+    
+    def show_older_page(page_state):
+        if page_state["next"] is None:
+            return history_page_updates(page_state["cursors"])
+        return history_page_updates(page_state["cursors"] + [page_state["next"]])
+    
+    def show_newer_page(page_state):
+        return history_page_updates(page_state["cursors"][:-1] or [None])
+    
+    # List the first page of saved histories once the page has loaded
+    if app is not None:
+        app.load(fn=lambda: history_page_updates([None]), outputs=history_page_outputs)
+    
+    older_page_btn.click(fn=show_older_page, inputs=[history_page], outputs=history_page_outputs)
+    newer_page_btn.click(fn=show_newer_page, inputs=[history_page], outputs=history_page_outputs)
+    
+    # Search saved chats; matches replace the dropdown choices (best match
+    # first) and their snippets are listed below the search box. An empty
+    # query goes back to browsing the first page.
+    def search_histories(query):
+        if not query or not query.strip():
+            return ("",) + history_page_updates([None])
+        
+        results = search_chat_histories(query)
+        if not results:
+            summary = f"No saved chats match **{query.strip()}**."
+        else:
+            lines = [f"Found {len(results)} matching chat(s):"]
+            lines.extend(f"- **{result['title']}**: {result['snippet']}" for result in results)
+            summary = "\n".join(lines)
+        
+        history_choices = [("Current Session", "Current Session")]
+        history_choices.extend((result["title"], result["id"]) for result in results)
+        # Paging doesn't apply to search results
+        return (
+            summary,
+            gr.update(choices=history_choices, value="Current Session"),
+            {"cursors": [None], "next": None},
+            "Search results",
+            gr.update(interactive=False),
+            gr.update(interactive=False)
+        )
+    
+    search_box.submit(fn=search_histories, inputs=[search_box], outputs=[search_results] + history_page_outputs)
+    search_btn.click(fn=search_histories, inputs=[search_box], outputs=[search_results] + history_page_outputs)
+    
     # New chat functionality with history saving
-    def create_new_chat(chat_history, provider_name, model_name):
+    def create_new_chat(chat_history, provider_name, model_name, session_thread):
         saved_id = None
         
-        # Save the current chat if it's not empty
-        if chat_history:
+        if CHAT_AUTOSAVE:
+            # Turns are already logged; fold this chat's log into its saved history
+            if session_thread:
+                saved_id = get_chat_log().compact(session_thread)
+        elif chat_history:
+            # Save the current chat if it's not empty
             full_model_name = get_full_model_name(provider_name, model_name)
             saved_id = save_chat_history(chat_history, full_model_name)
+        if saved_id:
             print(f"Saved chat history with ID: {saved_id}")
         
-        # Update the histories dropdown with fresh data
-        histories = get_chat_histories()
-        
-        # Make sure Current Session is always first in the list
-        history_choices = ["Current Session"]
-        if histories:
-            history_titles = [title for _, title in histories]
-            history_choices.extend(history_titles)
-            print(f"Available histories: {history_choices}")
-        
-        # Return empty chat, current model name, and updated dropdown choices
+        # Return empty chat, current model name, the first page of histories
+        # (where the chat just saved appears) and a cleared thread so the next
+        # message starts a new conversation
         # Always set value to "Current Session" for a new chat
-        return [], f"Current Model: {model_name}", gr.update(choices=history_choices, value="Current Session")
+        return ([], [], f"Current Model: {model_name}", None) + history_page_updates([None])
     
     new_chat_btn.click(
         fn=create_new_chat,
-        inputs=[chatbot, provider, model],
-        outputs=[chatbot, current_model, chat_history_dropdown]
+        inputs=[chat_state, provider, model, thread_id],
+        outputs=[chatbot, chat_state, current_model, thread_id] + history_page_outputs
+    )
+    
+    # Preview the selected history when the selection changes; only the
+    # selected chat is read from disk
+    def preview_history(selected_id):
+        if not selected_id or selected_id == "Current Session":
+            return []
+        chat_messages, _ = load_chat_history(selected_id)
+        return chat_messages
+    
+    chat_history_dropdown.change(
+        fn=preview_history,
+        inputs=[chat_history_dropdown],
+        outputs=[history_display]
     )
     
     # Load selected chat history
-    def load_history(selected_history):
+    def load_history(selected_id):
         # Skip if "Current Session" is selected
-        if selected_history == "Current Session":
-            return gr.update(), gr.update(value="Please select a saved chat history."), gr.update()
-        
-        # Get all histories
-        histories = get_chat_histories()
-        
-        # Find the selected history ID
-        selected_id = None
-        for hist_id, title in histories:
-            if title == selected_history:
-                selected_id = hist_id
-                break
-        
-        if not selected_id:
-            return gr.update(), gr.update(value="History not found."), gr.update()
+        if not selected_id or selected_id == "Current Session":
+            return gr.update(), gr.update(), gr.update(value="Please select a saved chat history."), gr.update(), gr.update()
         
         # Load the chat history
-        chat_messages, model_name = load_chat_history(selected_id)
+        chat_messages, model_name = load_chat_history(selected_id, record_access=True)
         
         # Check if we got back a valid chat history
         if not chat_messages:
-            return gr.update(), gr.update(value="Failed to load chat history."), gr.update()
+            return gr.update(), gr.update(), gr.update(value="Failed to load chat history."), gr.update(), gr.update()
         
         # If a model was saved with this history, display it
         model_display = f"Current Model: {model_name}" if model_name else current_model.value
         
-        return chat_messages, gr.update(value=f"Successfully loaded {len(chat_messages)} messages."), model_display
+        # Clear the thread so the next message seeds a new one from the loaded history
+        return chat_messages, list(chat_messages), gr.update(value=f"Successfully loaded {len(chat_messages)} messages."), model_display, None
     
     load_history_btn.click(
         fn=load_history,
         inputs=[chat_history_dropdown],
-        outputs=[chatbot, api_result, current_model]
+        outputs=[chatbot, chat_state, api_result, current_model, thread_id]
     )
     
     # Delete selected chat history
-    def delete_history(selected_history):
+    def delete_history(selected_id, page_state):
         # Skip if "Current Session" is selected
-        if selected_history == "Current Session":
-            return gr.update(), gr.update(value="Cannot delete current session.")
-            
-        # Get all histories
-        histories = get_chat_histories()
-        
-        # Find the selected history ID
-        selected_id = None
-        for hist_id, title in histories:
-            if title == selected_history:
-                selected_id = hist_id
-                break
-        
-        if not selected_id:
-            return gr.update(), gr.update(value="History not found.")
+        if not selected_id or selected_id == "Current Session":
+            return (gr.update(value="Cannot delete current session."),) + tuple(gr.update() for _ in history_page_outputs)
         
         # Delete the chat history
         success = delete_chat_history(selected_id)
         print(f"Deleted history {selected_id}: {success}")
         
-        # Update the dropdown list
-        histories = get_chat_histories()
-        
-        # Make sure Current Session is always first in the list
-        history_choices = ["Current Session"]
-        if histories:
-            history_titles = [title for _, title in histories]
-            history_choices.extend(history_titles)
-        
         status_msg = "History deleted successfully." if success else "Failed to delete history."
-        print(f"Available histories after delete: {history_choices}")
         
-        return gr.update(choices=history_choices, value="Current Session"), \
-               gr.update(value=status_msg)
+        # Refresh the page the user is on
+        return (gr.update(value=status_msg),) + history_page_updates(page_state["cursors"])
     
     delete_history_btn.click(
         fn=delete_history,
-        inputs=[chat_history_dropdown],
-        outputs=[chat_history_dropdown, api_result]
+        inputs=[chat_history_dropdown, history_page],
+        outputs=[api_result] + history_page_outputs
     )
     
-    # Function to update the model information when provider changes
-    def update_provider_info(provider_name):
-        provider_info_text = {
-            "gemini": """
-            #### Google Gemini
-            Gemini is Google's family of multimodal AI models, capable of understanding text, code, audio, images, and video.
-            
-            Learn more: [Google AI Gemini](https://ai.google.dev/models/gemini)
-            """,
-            "claude": """
-            #### Anthropic Claude
-            Claude is a family of AI assistants created by Anthropic to be helpful, harmless, and honest.
-            
-            Learn more: [Anthropic Claude](https://www.anthropic.com/claude)
-            """,
-            "openai": """
-            #### OpenAI GPT
-            GPT (Generative Pre-trained Transformer) models are a series of large language models developed by OpenAI.
-            
-            Learn more: [OpenAI](https://platform.openai.com/docs/models)
-            """
-        }
-        return provider_info_text.get(provider_name, "Select a provider to see more information.")
-    
-    provider.change(
-        fn=update_provider_info,
-        inputs=[provider],
-        outputs=[provider_info]
-    )
+
+    # Show the usage rollups, refreshed on demand and by the tab's timer
+    if usage_tab:
+        usage_report = usage_tab["usage_report"]
+        usage_inputs = [thread_id, session_keys]
+        usage_tab["refresh_usage_btn"].click(fn=format_usage_report, inputs=usage_inputs, outputs=[usage_report])
+        usage_tab["usage_timer"].tick(fn=format_usage_report, inputs=usage_inputs, outputs=[usage_report])
+        if app is not None:
+            app.load(fn=format_usage_report, inputs=usage_inputs, outputs=[usage_report])
+
+def format_usage_report(session_thread=None, api_keys=None):
+    """
+    Render the token, latency and cost rollups as Markdown.
+    
+    The tables only cover the usage of the session's own API keys (or of the
+    process defaults, for sessions without their own), unless USAGE_REPORT_ALL is set.
+    
+    Args:
+        session_thread: Thread ID of the current chat, if it has one
+        api_keys: The session's API keys
+        
+    Returns:
+        str: Markdown report
+    """
+    tracker = get_usage_tracker()
+    tenant = None if USAGE_REPORT_ALL else usage_tenant(api_keys)
+    models = tracker.by_model(tenant)
+    if not models:
+        return "No usage recorded yet."
+    
+    def latency(value):
+        return f"{value:.2f}s" if value is not None else "-"
+    
+    lines = []
+    if session_thread:
+        session = tracker.by_session(session_thread)
+        if session:
+            lines.append(
+                f"**This chat:** {sum(r['turns'] for r in session)} turns, "
+                f"{sum(r['input_tokens'] for r in session):,} input / {sum(r['output_tokens'] for r in session):,} output tokens, "
+                f"${sum(r['cost'] for r in session):.4f}"
+            )
+    
+    lines.append("#### By model")
+    lines.append("| Model | Turns | Input tokens | Output tokens | Cost | Avg latency | p50 | p95 |")
+    lines.append("|---|---:|---:|---:|---:|---:|---:|---:|")
+    for row in models:
+        lines.append(
+            f"| {row['model']} | {row['turns']:,} | {row['input_tokens']:,} | {row['output_tokens']:,} | "
+            f"${row['cost']:.4f} | {latency(row['avg_latency'])} | {latency(row['p50_latency'])} | {latency(row['p95_latency'])} |"
+        )
+    
+    lines.append("#### Last 7 days")
+    lines.append("| Day | Model | Turns | Input tokens | Output tokens | Cost |")
+    lines.append("|---|---|---:|---:|---:|---:|")
+    for row in tracker.by_day(7, tenant):
+        lines.append(
+            f"| {row['key']} | {row['model']} | {row['turns']:,} | {row['input_tokens']:,} | "
+            f"{row['output_tokens']:,} | ${row['cost']:.4f} |"
+        )
+    
+    cheapest = tracker.cheapest_within(USAGE_LATENCY_SLO, tenant=tenant)
+    if cheapest:
+        lines.append(
+            f"\n**Cheapest model with p95 latency under {USAGE_LATENCY_SLO:g}s:** {cheapest['model']} "
+            f"(${cheapest['cost_per_turn']:.5f} per turn)"
+        )
+    else:
+        lines.append(f"\nNo model has met the {USAGE_LATENCY_SLO:g}s p95 latency target yet.")
+    lines.append("\n_Costs are estimates from list prices (override with MODEL_PRICES)._")
+    return "\n".join(lines)
 
 # Placeholder functions only used if real implementations aren't provided
-def placeholder_run_chatbot(user_input, chat_history, model_name):
+def placeholder_run_chatbot(user_input, chat_history, model_name, thread_id=None, api_keys=None):
     """Placeholder for the actual run_chatbot function from the main application."""
     # This would be imported from the main application
     # For now, just return a simple response
@@ -293,7 +556,8 @@ def placeholder_run_chatbot(user_input, chat_history, model_name):
     
     return "", chat_history
 
-def placeholder_save_api_keys(google_key, anthropic_key, openai_key):
+def placeholder_save_api_keys(google_key, anthropic_key, openai_key, previous_keys=None):
     """Placeholder for the actual save_api_keys function from the main application."""
     # This would be imported from the main application
-    return "API keys saved successfully (placeholder implementation)"
+    keys = {"GOOGLE_API_KEY": google_key, "ANTHROPIC_API_KEY": anthropic_key, "OPENAI_API_KEY": openai_key}
+    return "API keys saved successfully (placeholder implementation)", keys
@@ -0,0 +1,401 @@
+"""
+Chat History Export and Import.
+
+This module streams the saved chat histories out to NDJSON (one chat per
+line) or Parquet (one message per row, for columnar analytics tools) and
+bulk-imports such files back into the history directory. Everything works
+on generators, one chat at a time, so memory use stays flat however many
+chats there are: exports walk the metadata index in keyset batches and only
+open the files that pass the date and model filters.
+
+Exports are ordered by history ID, which sorts chronologically, so the last
+exported ID is a cursor: an export can continue after it, and NDJSON exports
+keep a cursor file next to the output to resume after an interruption.
+"""
+
+import gzip
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from . import chat_history
+from .history_store import find_history_file, read_history, write_history
+
+# Export/import file formats
+FORMATS = ("ndjson", "parquet")
+
+# What to do with an imported chat whose ID already exists (and differs)
+CONFLICT_POLICIES = ("skip", "overwrite", "rename")
+
+# Chats exported between cursor checkpoints, and imported per index transaction
+CHECKPOINT_EVERY = 200
+
+# Messages buffered per Parquet row group
+PARQUET_ROW_GROUP = 10000
+
+# IDs become file names, so imported IDs must not contain path separators
+VALID_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+GENERATED_ID = re.compile(r"^chat_(\d{8}_\d{6})_[0-9a-f]+$")
+
+# content_json marks content that isn't a string (e.g. a list of content
+# blocks) and is stored JSON-encoded; files without the column have only strings
+PARQUET_COLUMNS = ("history_id", "timestamp", "model", "title", "message_index", "role", "content", "content_json")
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+def iter_histories(
+    after: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    models: Optional[List[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the full history objects matching the filters, oldest first.
+
+    Args:
+        after: Only histories after this ID (a cursor from an earlier export)
+        since: Only histories saved at or after this ISO date/time
+        until: Only histories saved before this ISO date/time
+        models: Only histories of these models
+
+    Yields:
+        dict: One history object at a time
+    """
+    index = chat_history.get_history_index()
+    for entry in index.scan(after_id=after, since=since, until=until, models=models):
+        path = find_history_file(chat_history.HISTORY_DIR, entry["id"])
+        if path is None:
+            # Deleted since the scan's batch was fetched
+            continue
+        try:
+            yield read_history(path)
+        except Exception as e:
+            print(f"Error reading history {entry['id']}: {e}")
+
+
+def _read_cursor(cursor_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(cursor_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_cursor(cursor_path: str, cursor: Dict[str, Any]):
+    temp_path = cursor_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(cursor, f)
+    os.replace(temp_path, cursor_path)
+
+
+def export_ndjson(
+    output_path: str,
+    histories: Iterable[Dict[str, Any]],
+    cursor_path: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    resume: bool = False
+) -> Dict[str, Any]:
+    """
+    Write histories to an NDJSON file, one chat per line.
+
+    With a cursor file, the last exported ID and the output size are saved
+    every CHECKPOINT_EVERY chats. Resuming truncates the output back to the
+    last checkpoint (dropping a half-written tail) and continues after its ID;
+    the caller must pass histories starting after that ID (see export_histories).
+
+    Args:
+        output_path: The NDJSON file to write
+        histories: History objects in ID order
+        cursor_path: Cursor file to checkpoint to, if any
+        filters: The export's filters, stored in the cursor so a resume can check them
+        resume: Append to the output from the cursor's checkpoint instead of overwriting it
+
+    Returns:
+        dict: count (chats written this run) and cursor (last exported ID)
+    """
+    cursor = _read_cursor(cursor_path) if resume and cursor_path else None
+    last_id = cursor["after"] if cursor else None
+    with open(output_path, "r+b" if cursor else "wb") as f:
+        if cursor:
+            f.truncate(cursor["offset"])
+            f.seek(cursor["offset"])
+        count = 0
+        for history in histories:
+            f.write(json.dumps(history, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n")
+            last_id = history["id"]
+            count += 1
+            if cursor_path and count % CHECKPOINT_EVERY == 0:
+                f.flush()
+                os.fsync(f.fileno())
+                _write_cursor(cursor_path, {"after": last_id, "offset": f.tell(), "filters": filters or {}})
+        f.flush()
+        os.fsync(f.fileno())
+        if cursor_path:
+            _write_cursor(cursor_path, {"after": last_id, "offset": f.tell(), "filters": filters or {}})
+    return {"count": count, "cursor": last_id}
+
+
+def export_parquet(output_path: str, histories: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Write histories to a Parquet file with one row per message.
+
+    Rows are buffered and written one row group at a time, so memory use is
+    bounded by PARQUET_ROW_GROUP rather than the size of the export. Content
+    that isn't a string is stored as JSON and flagged in content_json, so
+    iter_parquet gives it back unchanged.
+
+    Args:
+        output_path: The Parquet file to write
+        histories: History objects in ID order
+
+    Returns:
+        dict: count (chats written) and cursor (last exported ID)
+    """
+    pyarrow = _pyarrow()
+    schema = pyarrow.schema([
+        ("history_id", pyarrow.string()),
+        ("timestamp", pyarrow.string()),
+        ("model", pyarrow.string()),
+        ("title", pyarrow.string()),
+        ("message_index", pyarrow.int32()),
+        ("role", pyarrow.string()),
+        ("content", pyarrow.string()),
+        ("content_json", pyarrow.bool_())
+    ])
+    columns = {name: [] for name in PARQUET_COLUMNS}
+    count, last_id = 0, None
+
+    def flush(writer):
+        writer.write_table(pyarrow.table(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    with pyarrow.parquet.ParquetWriter(output_path, schema, compression="zstd") as writer:
+        for history in histories:
+            for i, message in enumerate(history.get("messages", [])):
+                columns["history_id"].append(history["id"])
+                columns["timestamp"].append(history.get("timestamp"))
+                columns["model"].append(history.get("model"))
+                columns["title"].append(history.get("title"))
+                columns["message_index"].append(i)
+                columns["role"].append(message.get("role"))
+                content = message.get("content")
+                encoded = not (isinstance(content, str) or content is None)
+                columns["content"].append(json.dumps(content) if encoded else content)
+                columns["content_json"].append(encoded)
+            last_id = history["id"]
+            count += 1
+            if len(columns["history_id"]) >= PARQUET_ROW_GROUP:
+                flush(writer)
+        if columns["history_id"]:
+            flush(writer)
+    return {"count": count, "cursor": last_id}
+
+
+def export_histories(
+    output_path: str,
+    fmt: str = "ndjson",
+    after: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    models: Optional[List[str]] = None,
+    resume: bool = False
+) -> Dict[str, Any]:
+    """
+    Export the matching histories to a file.
+
+    NDJSON exports keep a cursor file (``<output>.cursor``) while they run,
+    so ``resume=True`` continues an interrupted export with the same filters.
+    Parquet files can't be appended to; continue a Parquet export into a new
+    file with ``after`` set to the cursor the previous one returned.
+
+    Args:
+        output_path: The file to write
+        fmt: "ndjson" or "parquet"
+        after: Only histories after this ID
+        since: Only histories saved at or after this ISO date/time
+        until: Only histories saved before this ISO date/time
+        models: Only histories of these models
+        resume: Continue an interrupted NDJSON export
+
+    Returns:
+        dict: count (chats written this run) and cursor (last exported ID, or None)
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    filters = {"since": since, "until": until, "models": sorted(models or [])}
+    if fmt == "parquet":
+        if resume:
+            raise ValueError("Parquet exports can't be resumed; export into a new file with after=<cursor>")
+        return export_parquet(output_path, iter_histories(after, since, until, models))
+
+    cursor_path = output_path + ".cursor"
+    if resume:
+        cursor = _read_cursor(cursor_path)
+        if cursor is None or not os.path.exists(output_path):
+            raise ValueError(f"Nothing to resume: no cursor for {output_path}")
+        if cursor.get("filters") != filters:
+            raise ValueError(f"The export in {output_path} used different filters: {cursor.get('filters')}")
+        after = cursor["after"]
+    return export_ndjson(
+        output_path, iter_histories(after, since, until, models),
+        cursor_path=cursor_path, filters=filters, resume=resume
+    )
+
+
+def iter_ndjson(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the history objects of an NDJSON export, skipping lines that aren't valid JSON.
+
+    Gzipped files (``.ndjson.gz``, such as the retention archive segments) are read as well.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_number} of {path}: {e}")
+
+
+def iter_parquet(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the history objects of a Parquet export.
+
+    Rows are read batch by batch; a chat's messages are consecutive rows, so
+    only the chat being assembled is held in memory.
+    """
+    pyarrow = _pyarrow()
+    history = None
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    # Files from before content_json was added don't have every column
+    columns = [name for name in PARQUET_COLUMNS if name in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(columns=columns):
+        for row in batch.to_pylist():
+            if history is None or row["history_id"] != history["id"]:
+                if history is not None:
+                    yield history
+                history = {
+                    "id": row["history_id"],
+                    "timestamp": row["timestamp"],
+                    "model": row["model"],
+                    "title": row["title"],
+                    "messages": []
+                }
+            content = row["content"]
+            if row.get("content_json") and content is not None:
+                content = json.loads(content)
+            history["messages"].append({"role": row["role"], "content": content})
+    if history is not None:
+        yield history
+
+
+def detect_format(path: str) -> str:
+    """Return the export format of a file from its extension (NDJSON unless .parquet)."""
+    return "parquet" if path.endswith(".parquet") else "ndjson"
+
+
+def _valid_history(history: Any) -> bool:
+    if not isinstance(history, dict) or not isinstance(history.get("messages"), list):
+        return False
+    return all(isinstance(message, dict) and "role" in message and "content" in message for message in history["messages"])
+
+
+def _new_id(history: Dict[str, Any]) -> str:
+    # Keep the original timestamp part, so the chat keeps its place in the listing
+    match = GENERATED_ID.match(str(history.get("id", "")))
+    if match:
+        return f"chat_{match.group(1)}_{uuid.uuid4().hex[:6]}"
+    return chat_history.generate_history_id()
+
+
+def import_histories(
+    histories: Iterable[Dict[str, Any]],
+    on_conflict: str = "skip",
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """
+    Write histories into the history directory.
+
+    A chat whose ID is already taken by an identical chat is skipped as a
+    duplicate, so importing the same export twice is harmless. Otherwise
+    ``on_conflict`` decides: "skip" keeps the existing chat, "overwrite"
+    replaces it and "rename" imports the chat under a new ID. Chats without
+    a usable ID always get a new one. The index is updated once per batch
+    of CHECKPOINT_EVERY chats.
+
+    Args:
+        histories: History objects, e.g. from iter_ndjson or iter_parquet
+        on_conflict: "skip", "overwrite" or "rename"
+        dry_run: Only count what would happen
+
+    Returns:
+        dict: Counts of imported, overwritten, renamed, duplicate, skipped and invalid chats
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"Unknown conflict policy {on_conflict!r}; expected one of {', '.join(CONFLICT_POLICIES)}")
+    chat_history.ensure_history_dir()
+    history_dir = chat_history.HISTORY_DIR
+    index = chat_history.get_history_index()
+    counts = dict.fromkeys(("imported", "overwritten", "renamed", "duplicate", "skipped", "invalid"), 0)
+    batch = []
+    for history in histories:
+        if not _valid_history(history):
+            counts["invalid"] += 1
+            continue
+        history = {
+            "id": history.get("id"),
+            "timestamp": history.get("timestamp") or datetime.now().isoformat(),
+            "model": history.get("model"),
+            "title": history.get("title") or chat_history.generate_chat_title(history["messages"]),
+            "messages": history["messages"]
+        }
+        if not VALID_ID.match(str(history["id"] or "")):
+            history["id"] = _new_id(history)
+            counts["renamed"] += 1
+        else:
+            existing_path = find_history_file(history_dir, history["id"])
+            if existing_path is not None:
+                try:
+                    existing = read_history(existing_path)
+                except Exception:
+                    existing = None
+                # Compare only the fields an import keeps (not e.g. the autosave log digest)
+                if isinstance(existing, dict) and all(existing.get(key) == value for key, value in history.items()):
+                    counts["duplicate"] += 1
+                    continue
+                if on_conflict == "skip":
+                    counts["skipped"] += 1
+                    continue
+                if on_conflict == "rename":
+                    history["id"] = _new_id(history)
+                    while find_history_file(history_dir, history["id"]) is not None:
+                        history["id"] = _new_id(history)
+                    counts["renamed"] += 1
+                else:
+                    counts["overwritten"] += 1
+            else:
+                counts["imported"] += 1
+        if dry_run:
+            continue
+        write_history(history_dir, history)
+        batch.append(history)
+        if len(batch) >= CHECKPOINT_EVERY:
+            index.upsert_many(batch)
+            batch = []
+    if batch:
+        index.upsert_many(batch)
+    return counts
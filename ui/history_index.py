@@ -0,0 +1,362 @@
+"""
+Chat History Index.
+
+This module keeps a SQLite index of the saved chat histories (id, title,
+timestamp, model and message count) so listings don't have to open and
+parse every JSON file, plus an FTS5 full-text index over titles and message
+contents for ranked search. The index is updated alongside every save and
+delete, and rebuilds itself from the history files when it is missing or the
+history directory was changed behind its back.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .history_store import iter_history_files, read_history
+
+# The database lives in a subdirectory: SQLite's journal files come and go,
+# and doing that in the history directory itself would change its mtime,
+# which is what staleness detection relies on
+INDEX_PATH = os.path.join(".db", "index.sqlite3")
+
+# Bumped whenever the schema changes, which forces a rebuild of older indexes
+SCHEMA_VERSION = 2
+
+# Relative BM25 weights of the title and content columns
+SEARCH_WEIGHTS = (4.0, 1.0)
+
+# Buffered chat opens written to the index in one transaction
+ACCESS_FLUSH_SIZE = 64
+
+
+class HistoryIndex:
+    """
+    Metadata index over the history files of a chat history directory.
+    """
+
+    def __init__(self, history_dir: str, db_path: Optional[str] = None):
+        self.history_dir = history_dir
+        self.db_path = db_path or os.path.join(history_dir, INDEX_PATH)
+        self._lock = threading.RLock()
+        # Opens not yet written, by ID; see touch()
+        self._pending_access = {}
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS histories ("
+                "id TEXT PRIMARY KEY, title TEXT NOT NULL, timestamp TEXT, "
+                "model TEXT, message_count INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS histories_timestamp ON histories (timestamp)")
+            # Search rows share their rowid with the matching histories row
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS history_search USING fts5("
+                "title, content, tokenize = 'porter unicode61')"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value TEXT)")
+            # Last time each chat was opened; kept across rebuilds, since the files don't record it
+            self._conn.execute("CREATE TABLE IF NOT EXISTS history_access (id TEXT PRIMARY KEY, last_access TEXT NOT NULL)")
+
+    def _dir_signature(self) -> str:
+        # Adding, renaming or removing a file changes the directory's mtime
+        return f"{SCHEMA_VERSION}:{os.stat(self.history_dir).st_mtime_ns}"
+
+    def _mark_synced(self):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO index_state (key, value) VALUES ('dir_signature', ?)",
+            (self._dir_signature(),)
+        )
+
+    def is_stale(self) -> bool:
+        """Return True if the history directory changed since the index was last synced."""
+        row = self._conn.execute("SELECT value FROM index_state WHERE key = 'dir_signature'").fetchone()
+        return row is None or row[0] != self._dir_signature()
+
+    def ensure_fresh(self):
+        """Rebuild the index if it is missing or stale."""
+        with self._lock:
+            if self.is_stale():
+                self.rebuild()
+
+    def rebuild(self) -> int:
+        """
+        Rebuild the index from the history files.
+
+        Returns:
+            int: Number of indexed histories
+        """
+        count = 0
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM histories")
+            self._conn.execute("DELETE FROM history_search")
+            # Insert file by file so memory use doesn't grow with the number of chats
+            for _, _, path in iter_history_files(self.history_dir):
+                try:
+                    self._write(read_history(path))
+                    count += 1
+                except Exception as e:
+                    print(f"Error indexing history {os.path.basename(path)}: {e}")
+            self._mark_synced()
+        print(f"Rebuilt chat history index with {count} entries")
+        return count
+
+    def _write(self, history: Dict[str, Any]):
+        self._remove(history["id"])
+        rowid = self._conn.execute(
+            "INSERT INTO histories (id, title, timestamp, model, message_count) VALUES (?, ?, ?, ?, ?)",
+            self._row(history)
+        ).lastrowid
+        content = "\n".join(
+            str(message.get("content", "")) for message in history.get("messages", []) if isinstance(message, dict)
+        )
+        self._conn.execute(
+            "INSERT INTO history_search (rowid, title, content) VALUES (?, ?, ?)",
+            (rowid, history.get("title", "Untitled Chat"), content)
+        )
+
+    def _remove(self, history_id: str):
+        row = self._conn.execute("SELECT rowid FROM histories WHERE id = ?", (history_id,)).fetchone()
+        if row:
+            self._conn.execute("DELETE FROM history_search WHERE rowid = ?", row)
+            self._conn.execute("DELETE FROM histories WHERE rowid = ?", row)
+
+    @staticmethod
+    def _row(history: Dict[str, Any]) -> Tuple:
+        return (
+            history["id"],
+            history.get("title", "Untitled Chat"),
+            history.get("timestamp"),
+            history.get("model"),
+            len(history.get("messages", []))
+        )
+
+    def upsert(self, history: Dict[str, Any]):
+        """
+        Add or update the entry for a history that was just written.
+
+        Args:
+            history: The saved history object
+        """
+        with self._lock, self._conn:
+            self._write(history)
+            self._mark_synced()
+
+    def upsert_many(self, histories: List[Dict[str, Any]]):
+        """
+        Add or update the entries for a batch of written histories in one transaction.
+
+        Args:
+            histories: The saved history objects
+        """
+        with self._lock, self._conn:
+            for history in histories:
+                self._write(history)
+            self._mark_synced()
+
+    def delete(self, history_id: str):
+        """
+        Remove the entry for a history that was just deleted.
+
+        Args:
+            history_id: ID of the deleted history
+        """
+        with self._lock, self._conn:
+            self._remove(history_id)
+            self._pending_access.pop(history_id, None)
+            self._conn.execute("DELETE FROM history_access WHERE id = ?", (history_id,))
+            self._mark_synced()
+
+    def touch(self, history_id: str):
+        """
+        Record that a history was opened, for least-recently-used eviction.
+
+        Opens are buffered in memory and written in one transaction when
+        the buffer fills or the sweeper reads them (see by_last_activity()),
+        so opening a chat doesn't wait on a database write. Opens buffered
+        when the process exits are lost, which only makes eviction a little
+        less precise.
+
+        Args:
+            history_id: ID of the opened history
+        """
+        with self._lock:
+            self._pending_access[history_id] = datetime.now().isoformat()
+            if len(self._pending_access) >= ACCESS_FLUSH_SIZE:
+                self.flush_access()
+
+    def flush_access(self):
+        """Write the buffered opens recorded by touch()."""
+        with self._lock:
+            if not self._pending_access:
+                return
+            pending, self._pending_access = self._pending_access, {}
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO history_access (id, last_access) VALUES (?, ?)",
+                    pending.items()
+                )
+
+    def by_last_activity(self) -> List[Tuple[str, str]]:
+        """
+        List every indexed history by when it was last opened or saved, least recent first.
+
+        Returns:
+            List of tuples (id, last activity as an ISO timestamp)
+        """
+        self.ensure_fresh()
+        with self._lock:
+            self.flush_access()
+            with self._conn:
+                # Chats deleted behind the index's back leave access rows behind
+                self._conn.execute("DELETE FROM history_access WHERE id NOT IN (SELECT id FROM histories)")
+            return self._conn.execute(
+                "SELECT h.id, max(coalesce(a.last_access, ''), coalesce(h.timestamp, '')) AS last_active "
+                "FROM histories h LEFT JOIN history_access a ON a.id = h.id "
+                "ORDER BY last_active, h.id"
+            ).fetchall()
+
+    def list(self) -> List[Tuple[str, str]]:
+        """
+        List every indexed history, newest first.
+
+        Returns:
+            List of tuples (id, title)
+        """
+        self.ensure_fresh()
+        with self._lock:
+            return self._conn.execute("SELECT id, title FROM histories ORDER BY id DESC").fetchall()
+
+    def page(self, before_id: Optional[str] = None, limit: int = 20) -> Tuple[List[Tuple[str, str]], Optional[str]]:
+        """
+        Return one page of histories, newest first.
+
+        Pages are addressed by keyset (the last ID of the previous page)
+        rather than by offset, so each page is a primary-key range scan
+        whose cost doesn't grow with the number of stored chats.
+
+        Args:
+            before_id: Only return histories older than this ID; None for the first page
+            limit: Page size
+
+        Returns:
+            tuple: (list of (id, title), cursor for the next page or None)
+        """
+        self.ensure_fresh()
+        with self._lock:
+            if before_id is None:
+                rows = self._conn.execute(
+                    "SELECT id, title FROM histories ORDER BY id DESC LIMIT ?", (limit + 1,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT id, title FROM histories WHERE id < ? ORDER BY id DESC LIMIT ?",
+                    (before_id, limit + 1)
+                ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def scan(
+        self,
+        after_id: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        models: Optional[List[str]] = None,
+        batch_size: int = 500
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the metadata of every matching history, oldest first.
+
+        Rows are fetched in keyset batches and the lock is released between
+        them, so a scan over any number of chats uses constant memory and
+        doesn't hold up saves.
+
+        Args:
+            after_id: Only yield histories after this ID (a resume cursor)
+            since: Only histories with a timestamp at or after this ISO date/time
+            until: Only histories with a timestamp before this ISO date/time
+            models: Only histories of these models
+            batch_size: Rows fetched per query
+
+        Yields:
+            dict with id, title, timestamp, model and message_count
+        """
+        conditions, params = [], []
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        if models:
+            conditions.append(f"model IN ({', '.join('?' * len(models))})")
+            params.extend(models)
+        self.ensure_fresh()
+        cursor = after_id or ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, title, timestamp, model, message_count FROM histories "
+                    f"WHERE {' AND '.join(['id > ?'] + conditions)} ORDER BY id LIMIT ?",
+                    [cursor] + params + [batch_size]
+                ).fetchall()
+            for row in rows:
+                yield dict(zip(("id", "title", "timestamp", "model", "message_count"), row))
+            if len(rows) < batch_size:
+                return
+            cursor = rows[-1][0]
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Full-text search over titles and message contents, ranked by BM25.
+
+        Every word of the query must match (after stemming); title matches
+        rank higher than content matches.
+
+        Args:
+            query: Free-text query
+            limit: Maximum number of results
+
+        Returns:
+            list of dicts with id, title, snippet and score (lower is better)
+        """
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        # Quote every word so user input can't be parsed as FTS5 query syntax
+        match = " ".join('"' + word + '"' for word in words)
+        self.ensure_fresh()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT h.id, h.title, snippet(history_search, 1, '**', '**', ' ... ', 16), "
+                f"bm25(history_search, {', '.join(str(w) for w in SEARCH_WEIGHTS)}) AS score "
+                "FROM history_search JOIN histories h ON h.rowid = history_search.rowid "
+                "WHERE history_search MATCH ? ORDER BY score LIMIT ?",
+                (match, limit)
+            ).fetchall()
+        return [dict(zip(("id", "title", "snippet", "score"), row)) for row in rows]
+
+    def get(self, history_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the indexed metadata of a single history.
+
+        Args:
+            history_id: ID of the history
+
+        Returns:
+            dict with id, title, timestamp, model and message_count, or None
+        """
+        self.ensure_fresh()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, title, timestamp, model, message_count FROM histories WHERE id = ?",
+                (history_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "title", "timestamp", "model", "message_count"), row))
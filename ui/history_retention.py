@@ -0,0 +1,251 @@
+"""
+Chat History Retention.
+
+This module keeps the history directory bounded. A background sweeper
+evicts chats that exceed a maximum age (since they were last opened or
+saved), and then the least recently used chats until the directory is
+within its chat count and byte limits. A chat's bytes include its
+conversation checkpoints, which are deleted along with it (as is its
+usage rollup). Evicted chats
+are first appended to a gzipped NDJSON archive segment in ``.archive/``,
+which ``history_cli.py import`` can restore, and the reclaimed bytes are
+counted in the metrics.
+
+The sweeper runs off the request path on its own thread. Chats with
+unflushed autosave logs are never evicted, and a chat saved while a sweep
+archives it is kept.
+"""
+
+import gzip
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.checkpoints import delete_threads, thread_sizes
+from core.metrics import get_metrics
+from core.usage import delete_sessions
+from . import chat_history
+from .chat_log import LOG_SUBDIR
+from .history_store import find_history_file, iter_history_files, read_history, remove_history
+
+# Subdirectory of the history directory holding the archive segments
+ARCHIVE_SUBDIR = ".archive"
+
+
+class HistorySweeper:
+    """
+    Evicts chat histories beyond the retention limits, archiving them first.
+    """
+
+    def __init__(
+        self,
+        history_dir: str,
+        max_age_days: float = 0,
+        max_bytes: int = 0,
+        max_chats: int = 0,
+        archive: bool = True,
+        interval: float = 3600
+    ):
+        """
+        Args:
+            history_dir: The history directory
+            max_age_days: Evict chats not opened or saved for this many days (0 for no limit)
+            max_bytes: Most bytes of history files and checkpoints to keep (0 for no limit)
+            max_chats: Most chats to keep (0 for no limit)
+            archive: Archive chats before evicting them
+            interval: Seconds between sweeps
+        """
+        self.history_dir = history_dir
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.max_chats = max_chats
+        self.archive = archive
+        self.interval = interval
+        self.archive_dir = os.path.join(history_dir, ARCHIVE_SUBDIR)
+        self._sweep_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics = get_metrics()
+
+    @property
+    def enabled(self) -> bool:
+        """True if any retention limit is set."""
+        return bool(self.max_age_days or self.max_bytes or self.max_chats)
+
+    def _pending_logs(self) -> set:
+        # Chats whose latest turns are still only in the autosave log
+        try:
+            filenames = os.listdir(os.path.join(self.history_dir, LOG_SUBDIR))
+        except FileNotFoundError:
+            return set()
+        return {filename.split(".jsonl", 1)[0] for filename in filenames if ".jsonl" in filename}
+
+    def plan(self) -> List[Tuple[str, str, int]]:
+        """
+        Choose the chats to evict, least recently active first.
+
+        Returns:
+            list of (history ID, reason, bytes on disk); the reason is "age", "chats" or "bytes"
+        """
+        index = chat_history.get_history_index()
+        entries = index.by_last_activity()
+        sizes = {}
+        for history_id, _, path in iter_history_files(self.history_dir):
+            try:
+                sizes[history_id] = sizes.get(history_id, 0) + os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        # A chat's checkpoint thread has its ID; threads of unsaved chats aren't counted
+        indexed = {history_id for history_id, _ in entries}
+        for history_id, size in thread_sizes(chat_history.CHECKPOINT_DB).items():
+            if history_id in indexed:
+                sizes[history_id] = sizes.get(history_id, 0) + size
+        cutoff = (datetime.now() - timedelta(days=self.max_age_days)).isoformat() if self.max_age_days else None
+        protected = self._pending_logs()
+        count, total = len(entries), sum(sizes.values())
+
+        evictions = []
+        for history_id, last_active in entries:
+            if history_id in protected:
+                continue
+            if cutoff and last_active < cutoff:
+                reason = "age"
+            elif self.max_chats and count > self.max_chats:
+                reason = "chats"
+            elif self.max_bytes and total > self.max_bytes:
+                reason = "bytes"
+            else:
+                # Entries are in activity order and the limits only get looser from here
+                break
+            size = sizes.get(history_id, 0)
+            evictions.append((history_id, reason, size))
+            count -= 1
+            total -= size
+        return evictions
+
+    def _write_segment(self, evictions: List[Tuple[str, str, int]]) -> Tuple[Optional[str], Dict[str, int]]:
+        # Append each chat to a new gzipped NDJSON segment, one chat in memory at
+        # a time, and remember each file's mtime so later saves are noticed
+        os.makedirs(self.archive_dir, exist_ok=True)
+        name = f"segment_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.ndjson.gz"
+        path = os.path.join(self.archive_dir, name)
+        temp_path = os.path.join(self.archive_dir, f".{name}.tmp")
+        archived = {}
+        with open(temp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+                for history_id, _, _ in evictions:
+                    history_path = find_history_file(self.history_dir, history_id)
+                    if history_path is None:
+                        continue
+                    try:
+                        mtime = os.stat(history_path).st_mtime_ns
+                        history = read_history(history_path)
+                    except Exception as e:
+                        print(f"Error archiving history {history_id}: {e}")
+                        continue
+                    f.write(json.dumps(history, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n")
+                    archived[history_id] = mtime
+            raw.flush()
+            os.fsync(raw.fileno())
+        if not archived:
+            os.remove(temp_path)
+            return None, archived
+        os.replace(temp_path, path)
+        self._metrics.history_archive(os.path.getsize(path))
+        return path, archived
+
+    def sweep(self, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Evict the chats beyond the retention limits.
+
+        Args:
+            dry_run: Only report what would be evicted
+
+        Returns:
+            dict: evicted (count), bytes_reclaimed, by_reason counts and the archive segment path (or None)
+        """
+        with self._sweep_lock:
+            evictions = self.plan()
+            result = {"evicted": 0, "bytes_reclaimed": 0, "by_reason": {}, "archive": None}
+            if dry_run:
+                result["evicted"] = len(evictions)
+                result["bytes_reclaimed"] = sum(size for _, _, size in evictions)
+                for _, reason, _ in evictions:
+                    result["by_reason"][reason] = result["by_reason"].get(reason, 0) + 1
+                return result
+            if not evictions:
+                return result
+
+            archived = None
+            if self.archive:
+                result["archive"], archived = self._write_segment(evictions)
+
+            index = chat_history.get_history_index()
+            for history_id, reason, size in evictions:
+                if archived is not None:
+                    if history_id not in archived:
+                        continue
+                    # Saved again since it was archived: it's active, keep it
+                    path = find_history_file(self.history_dir, history_id)
+                    if path is None or os.stat(path).st_mtime_ns != archived[history_id]:
+                        continue
+                if remove_history(self.history_dir, history_id):
+                    index.delete(history_id)
+                    delete_threads(chat_history.CHECKPOINT_DB, [history_id])
+                    delete_sessions([history_id])
+                    result["evicted"] += 1
+                    result["bytes_reclaimed"] += size
+                    result["by_reason"][reason] = result["by_reason"].get(reason, 0) + 1
+                    self._metrics.history_eviction(reason, size)
+            return result
+
+    def _run(self):
+        while True:
+            try:
+                result = self.sweep()
+                if result["evicted"]:
+                    print(
+                        f"Retention: evicted {result['evicted']} chat(s), "
+                        f"reclaimed {result['bytes_reclaimed']} bytes"
+                        + (f", archived to {result['archive']}" if result["archive"] else "")
+                    )
+            except Exception as e:
+                print(f"Error sweeping chat histories: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """Start the background sweeper thread; the first sweep runs right away."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="history-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background sweeper after its current sweep."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def get_history_sweeper() -> HistorySweeper:
+    """Return the retention sweeper for the current history directory, configured from the environment."""
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or _sweeper.history_dir != chat_history.HISTORY_DIR:
+            _sweeper = HistorySweeper(
+                chat_history.HISTORY_DIR,
+                max_age_days=float(os.getenv("RETENTION_MAX_AGE_DAYS", "0")),
+                max_bytes=int(float(os.getenv("RETENTION_MAX_MB", "0")) * 1024 * 1024),
+                max_chats=int(os.getenv("RETENTION_MAX_CHATS", "0")),
+                archive=os.getenv("RETENTION_ARCHIVE", "true").lower() in ("1", "true", "yes"),
+                interval=float(os.getenv("RETENTION_SWEEP_INTERVAL", "3600"))
+            )
+        return _sweeper
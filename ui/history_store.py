@@ -0,0 +1,281 @@
+"""
+Chat History Storage Format.
+
+This module reads and writes the chat history files. Histories are stored
+as minified JSON, compressed with gzip (the default) or zstd. Zstd can use
+a dictionary trained on the saved chats, which pays off because every
+history repeats the same keys, roles and boilerplate. Files written by
+earlier versions (pretty-printed ``.json``) are still read as they are, and
+the history CLI migrates them.
+
+Every file is written to a temporary name, fsynced and swapped in, so
+readers never see a partial file and a saved history survives a power
+loss; saving a history removes its copies in other formats.
+"""
+
+import gzip
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# File extension per storage format; the order is the lookup order
+EXTENSIONS = {
+    "zstd": ".json.zst",
+    "gzip": ".json.gz",
+    "json": ".json"
+}
+
+# Format for new files: gzip, zstd (needs the zstandard package) or json
+HISTORY_FORMAT = os.getenv("HISTORY_FORMAT", "gzip").lower()
+
+# Compression levels; zstd levels above ~12 get slow for little gain
+GZIP_LEVEL = int(os.getenv("HISTORY_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("HISTORY_ZSTD_LEVEL", "9"))
+
+# Trained zstd dictionaries live next to the index, one file per dictionary ID;
+# CURRENT names the one new files are compressed with
+DICT_DIR = os.path.join(".db", "zstd")
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd chat histories need the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def resolve_format(fmt: Optional[str] = None) -> str:
+    """
+    Return the storage format to write, falling back to gzip when zstd isn't installed.
+
+    Args:
+        fmt: Requested format; HISTORY_FORMAT if omitted
+    """
+    fmt = (fmt or HISTORY_FORMAT).lower()
+    if fmt not in EXTENSIONS:
+        print(f"Unknown chat history format {fmt!r}; using gzip")
+        return "gzip"
+    if fmt == "zstd":
+        try:
+            _zstd()
+        except RuntimeError as e:
+            print(f"{e}; using gzip")
+            return "gzip"
+    return fmt
+
+
+def split_filename(filename: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a history file name into (history ID, format).
+
+    Returns:
+        tuple: The ID and format, or None for files that aren't histories
+    """
+    if filename.startswith("."):
+        return None
+    for fmt, extension in EXTENSIONS.items():
+        if filename.endswith(extension):
+            return filename[:-len(extension)], fmt
+    return None
+
+
+def iter_history_files(history_dir: str) -> Iterator[Tuple[str, str, str]]:
+    """
+    Yield (history ID, format, path) for every history file in a directory.
+
+    A history saved in several formats (e.g. after an interrupted
+    migration) is yielded once per file.
+    """
+    with os.scandir(history_dir) as entries:
+        for entry in entries:
+            parts = split_filename(entry.name)
+            if parts and entry.is_file():
+                yield parts[0], parts[1], entry.path
+
+
+def find_history_file(history_dir: str, history_id: str) -> Optional[str]:
+    """Return the path of a history's file in whichever format it's stored, or None."""
+    for extension in EXTENSIONS.values():
+        path = os.path.join(history_dir, history_id + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _dictionary(history_dir: str, dict_id: int):
+    key = (history_dir, dict_id)
+    with _dictionaries_lock:
+        if key not in _dictionaries:
+            path = os.path.join(history_dir, DICT_DIR, f"{dict_id}.dict")
+            with open(path, "rb") as f:
+                _dictionaries[key] = _zstd().ZstdCompressionDict(f.read())
+        return _dictionaries[key]
+
+
+def current_dictionary_id(history_dir: str) -> Optional[int]:
+    """Return the ID of the zstd dictionary new files use, or None if none was trained."""
+    try:
+        with open(os.path.join(history_dir, DICT_DIR, "CURRENT"), "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def encode_history(history: Dict[str, Any], fmt: str, history_dir: Optional[str] = None) -> bytes:
+    """
+    Serialize a history object in a storage format.
+
+    Args:
+        history: The history object
+        fmt: "json", "gzip" or "zstd"
+        history_dir: Directory whose trained zstd dictionary to use, if any
+    """
+    data = json.dumps(history, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if fmt == "gzip":
+        # mtime=0 keeps the output deterministic
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if fmt == "zstd":
+        zstandard = _zstd()
+        dict_id = current_dictionary_id(history_dir) if history_dir else None
+        if dict_id is not None:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_dictionary(history_dir, dict_id))
+        else:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return compressor.compress(data)
+    return data
+
+
+def decode_history(data: bytes, fmt: str, history_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parse a history file's contents.
+
+    Args:
+        data: The raw file contents
+        fmt: Format the file is stored in
+        history_dir: Directory holding the zstd dictionaries the file may need
+    """
+    if fmt == "gzip":
+        data = gzip.decompress(data)
+    elif fmt == "zstd":
+        zstandard = _zstd()
+        # Each frame records the dictionary it was compressed with (0 for none)
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        if dict_id:
+            decompressor = zstandard.ZstdDecompressor(dict_data=_dictionary(history_dir, dict_id))
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        data = decompressor.decompress(data)
+    return json.loads(data)
+
+
+def read_history(path: str) -> Dict[str, Any]:
+    """Read a history file in any supported format."""
+    fmt = split_filename(os.path.basename(path))[1]
+    with open(path, "rb") as f:
+        return decode_history(f.read(), fmt, os.path.dirname(path))
+
+
+def fsync_dir(path: str):
+    """fsync a directory, making renames and new files in it durable (a no-op where unsupported)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Windows can't open directories
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_history(history_dir: str, history: Dict[str, Any], fmt: Optional[str] = None) -> str:
+    """
+    Write a history object, replacing its file in any other format.
+
+    Args:
+        history_dir: The history directory
+        history: The history object; its "id" names the file
+        fmt: Storage format; HISTORY_FORMAT if omitted
+
+    Returns:
+        str: Path of the written file
+    """
+    fmt = resolve_format(fmt)
+    history_id = history["id"]
+    path = os.path.join(history_dir, history_id + EXTENSIONS[fmt])
+    temp_path = os.path.join(history_dir, f".{history_id}{EXTENSIONS[fmt]}.tmp")
+    with open(temp_path, "wb") as f:
+        f.write(encode_history(history, fmt, history_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    # Make the rename durable too: callers (e.g. the autosave compactor)
+    # delete their own copy of the data once this returns
+    fsync_dir(history_dir)
+    for other in EXTENSIONS.values():
+        if other != EXTENSIONS[fmt]:
+            try:
+                os.remove(os.path.join(history_dir, history_id + other))
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def remove_history(history_dir: str, history_id: str) -> bool:
+    """Delete a history's files in every format; returns True if any existed."""
+    removed = False
+    for extension in EXTENSIONS.values():
+        try:
+            os.remove(os.path.join(history_dir, history_id + extension))
+            removed = True
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def train_dictionary(history_dir: str, size: int = 112640, max_samples: int = 5000) -> Optional[int]:
+    """
+    Train a zstd dictionary on the saved histories and make it the current one.
+
+    Files already compressed with an older dictionary stay readable, since
+    every dictionary is kept.
+
+    Args:
+        history_dir: The history directory
+        size: Dictionary size in bytes
+        max_samples: Most histories to sample, newest first
+
+    Returns:
+        int: The new dictionary's ID, or None if there are too few histories
+    """
+    zstandard = _zstd()
+    files = sorted(iter_history_files(history_dir), reverse=True)[:max_samples]
+    samples = []
+    for _, fmt, path in files:
+        try:
+            history = read_history(path)
+        except Exception as e:
+            print(f"Skipping {path} for dictionary training: {e}")
+            continue
+        samples.append(encode_history(history, "json"))
+    # zstd needs a reasonable number of samples to find shared content
+    if len(samples) < 10:
+        return None
+    dictionary = zstandard.train_dictionary(size, samples)
+    dict_id = dictionary.dict_id()
+    dict_dir = os.path.join(history_dir, DICT_DIR)
+    os.makedirs(dict_dir, exist_ok=True)
+    with open(os.path.join(dict_dir, f"{dict_id}.dict"), "wb") as f:
+        f.write(dictionary.as_bytes())
+    temp_path = os.path.join(dict_dir, ".CURRENT.tmp")
+    with open(temp_path, "w") as f:
+        f.write(str(dict_id))
+    os.replace(temp_path, os.path.join(dict_dir, "CURRENT"))
+    return dict_id
@@ -11,24 +11,29 @@ from .tabs import (
     create_model_settings_tab,
     create_api_settings_tab,
     create_help_tab,
-    create_usage_info_tab
+    create_usage_info_tab,
+    CODING_TAB_CSS
 )
 from .handlers import register_handlers
 
-def create_interface(run_chatbot, save_api_keys, available_models: Dict[str, list], api_keys: Dict[str, str]) -> gr.Blocks:
+def create_interface(run_chatbot, save_api_keys, available_models: Dict[str, list], api_keys: Dict[str, str], stream_chatbot=None, chat_concurrency_limit=None, warm_model=None) -> gr.Blocks:
     """
     Creates the main Gradio interface with all tabs.
     
     Args:
         run_chatbot: Function to run the chatbot with user input
-        save_api_keys: Function to save API keys
+        save_api_keys: Function saving API keys, called with the three keys and the session's
+            current keys; returns a status message and the session's new keys
         available_models: Dictionary mapping provider names to lists of available models
-        api_keys: Dictionary of API keys for different providers
+        api_keys: The process default API keys for the different providers
+        stream_chatbot: Optional generator version of run_chatbot that yields partial answers
+        chat_concurrency_limit: Maximum number of chat messages processed at once
+        warm_model: Optional function (sync or async) warming a model's client for a session
         
     Returns:
         gr.Blocks: The complete Gradio interface
     """
-    with gr.Blocks() as app:
+    with gr.Blocks(css=CODING_TAB_CSS) as app:
         gr.Markdown("# Coding Agent Assistant")
         
         # Create tabs for different sections
@@ -39,7 +44,7 @@ def create_interface(run_chatbot, save_api_keys, available_models: Dict[str, lis
             model_settings_components = create_model_settings_tab(available_models)
             api_settings_components = create_api_settings_tab(api_keys)
             create_help_tab()
-            create_usage_info_tab()
+            usage_info_components = create_usage_info_tab()
         
         # Create a shared state dictionary to pass between components
         shared_state = {
@@ -53,8 +58,13 @@ def create_interface(run_chatbot, save_api_keys, available_models: Dict[str, lis
             model_settings_components,
             api_settings_components,
             available_models,
+            usage_tab=usage_info_components,
+            app=app,
             run_chatbot=run_chatbot,
+            stream_chatbot=stream_chatbot,
+            chat_concurrency_limit=chat_concurrency_limit,
             save_api_keys=save_api_keys,
+            warm_model=warm_model,
             shared_state=shared_state
         )
     
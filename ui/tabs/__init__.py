@@ -2,7 +2,7 @@
 Individual tab components for the Coding Agent UI.
 """
 
-from .coding_agent_tab import create_coding_agent_tab
+from .coding_agent_tab import create_coding_agent_tab, CODING_TAB_CSS
 from .histories_tab import create_histories_tab
 from .model_settings_tab import create_model_settings_tab
 from .api_settings_tab import create_api_settings_tab
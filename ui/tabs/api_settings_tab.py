@@ -7,44 +7,54 @@ This file contains the UI components for API key management.
 import gradio as gr
 from typing import Dict, Any
 
+def server_key_placeholder(api_keys: Dict[str, str], key_name: str) -> str:
+    """Hint for a key field; the server's own keys are never sent to the browser."""
+    return "Using the server's key" if api_keys.get(key_name) else ""
+
 def create_api_settings_tab(api_keys: Dict[str, str]) -> Dict[str, Any]:
     """
     Creates the API settings tab.
     
     Args:
-        api_keys: Dictionary of API keys for different providers
+        api_keys: The process default API keys; only whether each is set is shown
         
     Returns:
         Dictionary containing the tab components
     """
     with gr.TabItem("API Settings"):
         gr.Markdown("### API Keys Configuration")
-        gr.Markdown("Set your API keys for the different LLM providers. These will be saved in your .env file.")
+        gr.Markdown(
+            "Set your API keys for the different LLM providers. They apply to this browser session only; "
+            "leave a field blank to use the server's key, if it has one."
+        )
         
         with gr.Group():
             google_key = gr.Textbox(
                 label="Google API Key", 
-                value=api_keys["GOOGLE_API_KEY"],
+                placeholder=server_key_placeholder(api_keys, "GOOGLE_API_KEY"),
                 type="password",
                 container=True,
                 lines=1
             )
             anthropic_key = gr.Textbox(
                 label="Anthropic API Key", 
-                value=api_keys["ANTHROPIC_API_KEY"],
+                placeholder=server_key_placeholder(api_keys, "ANTHROPIC_API_KEY"),
                 type="password",
                 container=True,
                 lines=1
             )
             openai_key = gr.Textbox(
                 label="OpenAI API Key", 
-                value=api_keys["OPENAI_API_KEY"],
+                placeholder=server_key_placeholder(api_keys, "OPENAI_API_KEY"),
                 type="password",
                 container=True,
                 lines=1
             )
             save_btn = gr.Button("Save API Keys", variant="primary")
             api_result = gr.Markdown("")
+        
+        # The keys this session entered, sent with each of its chat requests
+        session_keys = gr.State({})
     
     # Return components that will be needed for event handlers
     return {
@@ -52,5 +62,6 @@ def create_api_settings_tab(api_keys: Dict[str, str]) -> Dict[str, Any]:
         "anthropic_key": anthropic_key,
         "openai_key": openai_key,
         "save_btn": save_btn,
-        "api_result": api_result
+        "api_result": api_result,
+        "session_keys": session_keys
     }
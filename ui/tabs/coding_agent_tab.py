@@ -7,6 +7,10 @@ This file contains the UI components for the main chat interface.
 import gradio as gr
 from typing import Dict, Tuple, Any
 
+# The chat delta box is hidden with CSS rather than visible=False, so it stays
+# mounted in the page and fires its change event
+CODING_TAB_CSS = "#chat-delta { display: none; }"
+
 def create_coding_agent_tab() -> Dict[str, Any]:
     """
     Creates the main coding agent chat interface tab.
@@ -34,11 +38,22 @@ def create_coding_agent_tab() -> Dict[str, Any]:
                     placeholder="Ask me about coding, development, or technology...",
                     show_label=True
                 )
+        
+        # Server-side ID of the conversation thread; assigned on the first message
+        thread_id = gr.State(None)
+        
+        # The full chat history, kept server-side so messages don't resend it
+        chat_state = gr.State([])
+        # The latest turn as sent to the browser, which applies it to the chatbot
+        chat_delta = gr.Textbox(elem_id="chat-delta", show_label=False, container=False, interactive=False)
     
     # Return components that will be needed for event handlers
     return {
         "chatbot": chatbot,
         "msg": msg,
         "new_chat_btn": new_chat_btn,
-        "current_model": current_model
+        "current_model": current_model,
+        "thread_id": thread_id,
+        "chat_state": chat_state,
+        "chat_delta": chat_delta
     }
@@ -7,9 +7,6 @@ This file contains the UI components for viewing and managing chat histories.
 import gradio as gr
 from typing import Dict, Any
 
-# Import the chat history management module
-from ..chat_history import get_chat_histories
-
 def create_histories_tab() -> Dict[str, Any]:
     """
     Creates the chat histories management tab.
@@ -20,9 +17,19 @@ def create_histories_tab() -> Dict[str, Any]:
     with gr.TabItem("Histories"):
         gr.Markdown("### Chat Histories")
         
-        # Get existing histories
-        histories = get_chat_histories()
-        history_choices = ["Current Session"] + [title for _, title in histories] if histories else ["Current Session"]
+        # The saved histories are listed when the page loads, not while the UI
+        # is built; choices are (title, id) pairs so histories with the same
+        # title stay distinguishable
+        history_choices = [("Current Session", "Current Session")]
+        
+        with gr.Row():
+            search_box = gr.Textbox(
+                placeholder="Search saved chats by title or content, then press Enter (clear to browse)",
+                label="Search",
+                scale=4
+            )
+            search_btn = gr.Button("Search", scale=1)
+        search_results = gr.Markdown()
         
         with gr.Row():
             chat_history_dropdown = gr.Dropdown(
@@ -34,13 +41,29 @@ def create_histories_tab() -> Dict[str, Any]:
             load_history_btn = gr.Button("Load Selected History")
             delete_history_btn = gr.Button("Delete Selected History", variant="stop")
         
+        with gr.Row():
+            newer_page_btn = gr.Button("< Newer", interactive=False)
+            page_info = gr.Markdown("Page 1")
+            older_page_btn = gr.Button("Older >", interactive=False)
+        
+        # Cursors of the pages visited so far (None is the first page) and
+        # the cursor of the next older page
+        history_page = gr.State({"cursors": [None], "next": None})
+        
         history_display = gr.Chatbot(height=500, type="messages")
-        gr.Markdown("Select a history from the dropdown above to view and load it.")
+        gr.Markdown("Select a history from the dropdown above to preview it, then load it into the chat.")
     
     # Return components that will be needed for event handlers
     return {
         "chat_history_dropdown": chat_history_dropdown,
         "load_history_btn": load_history_btn,
         "delete_history_btn": delete_history_btn,
-        "history_display": history_display
+        "history_display": history_display,
+        "newer_page_btn": newer_page_btn,
+        "older_page_btn": older_page_btn,
+        "page_info": page_info,
+        "history_page": history_page,
+        "search_box": search_box,
+        "search_btn": search_btn,
+        "search_results": search_results
     }
@@ -34,6 +34,8 @@ def create_model_settings_tab(available_models: Dict[str, List[str]]) -> Dict[st
                     value="gemini-2.0-flash"
                 )
                 apply_model_btn = gr.Button("Apply Model Selection", variant="primary")
+                # Readiness of the selected model's client, warmed in the background
+                model_status = gr.Markdown("")
             
             with gr.Column():
                 gr.Markdown("### Model Information")
@@ -51,5 +53,6 @@ def create_model_settings_tab(available_models: Dict[str, List[str]]) -> Dict[st
         "provider": provider,
         "model": model,
         "apply_model_btn": apply_model_btn,
-        "provider_info": provider_info
+        "provider_info": provider_info,
+        "model_status": model_status
     }
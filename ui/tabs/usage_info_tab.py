@@ -1,19 +1,27 @@
 """
 Usage & Information Tab Component.
 
-This file contains the UI components for displaying usage information and technology details.
+This file contains the UI components for displaying token usage and cost,
+usage information and technology details.
 """
 
 import gradio as gr
+from typing import Dict, Any
 
-def create_usage_info_tab():
+def create_usage_info_tab() -> Dict[str, Any]:
     """
-    Creates the usage and information tab with technology details.
+    Creates the usage and information tab with live usage figures and technology details.
     
     Returns:
-        None (no components need to be returned for event handlers)
+        Dictionary containing the tab components
     """
     with gr.TabItem("Usage & Information"):
+        gr.Markdown("### Token Usage & Cost")
+        usage_report = gr.Markdown("No usage recorded yet.")
+        refresh_usage_btn = gr.Button("Refresh Usage", size="sm")
+        # Keeps the figures live while the app is open
+        usage_timer = gr.Timer(10)
+        
         gr.Markdown("### Coding Agent Capabilities")
         gr.Markdown("""
         This coding agent is designed to help with a variety of programming and technology topics.
@@ -140,5 +148,9 @@ def create_usage_info_tab():
             **Resources:** [Scikit-learn Documentation](https://scikit-learn.org/stable/user_guide.html), [ML Mastery](https://machinelearningmastery.com/)
             """)
     
-    # This tab has no components that need event handlers
-    return None
+    # Return components that will be needed for event handlers
+    return {
+        "usage_report": usage_report,
+        "refresh_usage_btn": refresh_usage_btn,
+        "usage_timer": usage_timer
+    }